@@ -0,0 +1,170 @@
+"""
+答案缓存基准：模拟 WebUI 用户提问（prompt.suggestions 中的示例问题及其换了说法的版本，按 Zipf 分布抽取），
+助手替身按问题选择工具（工具耗时为固定延迟），再把 system prompt、问题和工具结果发给本地替身大模型，
+分别在不缓存、只按规范化文本缓存（exact）和加上 n-gram 向量相似匹配（ngram）三种配置下，
+统计命中率、大模型调用次数和每个问题的平均 / P50 / P95 耗时
+
+替身大模型见 bench_tool_output.StandInLLM，--llm-url 可以改为指向真实的本地模型服务
+
+用法:
+    python benchmarks/bench_answer_cache.py --requests 120 --clients 4
+    python benchmarks/bench_answer_cache.py --live-ttl 2 --decode-tps 100 --output answer_cache.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_tool_output import StandInLLM, chat  # noqa: E402
+
+# (示例问题, 换了说法的版本, 使用的工具)
+QUESTIONS = (
+    ('查询2023年比特币的最高价和最低价', ('请帮我查询一下2023年BTC的最高价和最低价', '2023年比特币最高价最低价是多少？'),
+     'exc_sql'),
+    ('分析最近3个月比特币价格的走势', ('最近3个月比特币价格走势分析', '请分析一下最近3个月BTC价格的走势'), 'exc_sql'),
+    ('对比特币的成交量进行月度统计并分析', ('对BTC的成交量进行月度统计并分析', '请对比特币的成交量进行月度统计并分析。'),
+     'exc_sql'),
+    ('使用ARIMA模型预测比特币未来7天的价格', ('使用ARIMA模型预测BTC未来7天的价格', '用ARIMA模型预测比特币未来7天价格'),
+     'arima_stock'),
+    ('预测BTCUSDT未来14天的价格趋势', ('预测BTC未来14天的价格趋势', '请预测一下比特币未来14天的价格趋势'), 'arima_stock'),
+    ('获取BTCUSDT的实时价格并分析短期走势', ('获取BTC实时价格并分析短期走势', 'BTC实时价格和短期走势'),
+     'get_real_time_price'),
+    ('查看比特币的最新价格、技术指标和投资建议', ('查看BTC的最新价格、技术指标和投资建议', '比特币最新价格，技术指标，投资建议？'),
+     'get_real_time_price'),
+    # 与示例问题很像但含义不同，不应命中
+    ('查询2023年比特币的最高价', ('查询2022年比特币的最高价和最低价', '分析最近3个月比特币成交量的走势'), 'exc_sql'),
+)
+
+
+class StandInAssistant:
+    """助手替身：与 Assistant 相同的 _run 接口，按问题对应的工具等待 tool_latency 秒后请求替身大模型"""
+
+    def __init__(self, llm_url, model, tool_latency, routes):
+        self.llm_url = llm_url
+        self.model = model
+        self.tool_latency = tool_latency
+        self.routes = routes
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+
+    def run(self, messages, **kwargs):
+        yield from self._run(messages, **kwargs)
+
+    def _run(self, messages, **kwargs):
+        import btc_analysis_agent_qwen_trub as agent
+
+        question = messages[-1]['content']
+        tool = self.routes[question]
+        call = {'role': 'assistant', 'content': '', 'function_call': {'name': tool, 'arguments': '{}'}}
+        yield [call]
+        time.sleep(self.tool_latency)
+        result = {'role': 'function', 'name': tool, 'content': f'{tool} 的结果'}
+        yield [call, result]
+        with self._lock:
+            self.llm_calls += 1
+        chat(self.llm_url, self.model, [{'role': 'system', 'content': agent.system_prompt}, *messages, call, result])
+        yield [call, result, {'role': 'assistant', 'content': '回答'}]
+
+
+def workload(count, seed):
+    """按 Zipf 分布抽取示例问题，再随机选原句或换了说法的版本"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+    requests = []
+    for _ in range(count):
+        question, variants, _ = rng.choices(QUESTIONS, weights)[0]
+        requests.append(rng.choice((question,) + variants))
+    return requests
+
+
+def run_config(name, args, llm_url, requests, routes):
+    from btc_answer_cache import AnswerCache, AnswerCacheMixin, ngram_embedding
+
+    bot = StandInAssistant(llm_url, args.model, args.tool_latency, routes)
+    if name != 'none':
+        bot.__class__ = type('CachedStandInAssistant', (AnswerCacheMixin, StandInAssistant), {
+            'answer_cache': AnswerCache(embed=ngram_embedding if name == 'ngram' else None, live_ttl=args.live_ttl)})
+    latencies = []
+    lock = threading.Lock()
+    queue = list(enumerate(requests))
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                _, question = queue.pop(0)
+            started = time.perf_counter()
+            for _ in bot.run([{'role': 'user', 'content': question}]):
+                pass
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    cache = getattr(bot, 'answer_cache', None)
+    values = np.array(latencies) * 1000
+    return {
+        'config': name,
+        'requests': len(latencies),
+        'llm_calls': bot.llm_calls,
+        'hit_rate': round(cache.hit_rate(), 3) if cache else 0.0,
+        'similar_hits': cache.stats['similar'] if cache else 0,
+        'mean_ms': round(float(values.mean()), 1),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p95_ms': round(float(np.percentile(values, 95)), 1),
+        'elapsed_s': round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='答案缓存的命中率和延迟')
+    parser.add_argument('--requests', type=int, default=120, help='提问次数')
+    parser.add_argument('--clients', type=int, default=4, help='同时提问的用户数')
+    parser.add_argument('--tool-latency', type=float, default=0.3, help='模拟的工具耗时（秒）')
+    parser.add_argument('--live-ttl', type=float, default=5.0, help='含实时行情的回答的有效期（秒）')
+    parser.add_argument('--prefill-tps', type=float, default=1500.0)
+    parser.add_argument('--decode-tps', type=float, default=200.0)
+    parser.add_argument('--answer-tokens', type=int, default=60)
+    parser.add_argument('--llm-url', help='真实的 OpenAI 兼容模型服务地址，默认启动本地替身大模型')
+    parser.add_argument('--model', default='stand-in')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    routes = {text: tool for question, variants, tool in QUESTIONS for text in (question,) + variants}
+    requests = workload(args.requests, args.seed)
+    llm = None if args.llm_url else StandInLLM(args.prefill_tps, args.decode_tps, args.answer_tokens).start()
+    try:
+        results = [run_config(name, args, args.llm_url or llm.url, requests, routes)
+                   for name in ('none', 'exact', 'ngram')]
+    finally:
+        if llm is not None:
+            llm.stop()
+
+    print(f"{args.requests} 次提问，{args.clients} 个用户，工具 {args.tool_latency * 1000:g}ms，"
+          f"实时回答有效期 {args.live_ttl:g}s")
+    print('| 配置 | 命中率 | 相似命中 | 大模型调用 | 平均(ms) | P50(ms) | P95(ms) | 总耗时(s) |')
+    print('|------|------|------|------|------|------|------|------|')
+    for item in results:
+        print(f"| {item['config']} | {item['hit_rate']:.1%} | {item['similar_hits']} | {item['llm_calls']} | "
+              f"{item['mean_ms']} | {item['p50_ms']} | {item['p95_ms']} | {item['elapsed_s']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
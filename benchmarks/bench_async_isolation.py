@@ -0,0 +1,156 @@
+"""
+会话隔离基准：一个会话触发长时间的数据补齐（exc_sql 检测到数据库缺少数十天日线，分批请求交易所并限速），
+同时其他会话不断查询无关交易对的实时价格，统计这些会话在补齐期间的延迟
+
+对比三种执行方式:
+    sync  同步工具，由固定大小的线程池按顺序处理请求（--workers 1 相当于 WebUI 默认逐个处理请求）
+    async 异步工具（btc_async_tools），补齐在单独的线程池中执行，其他会话的 I/O 在事件循环上并发
+
+用法:
+    python benchmarks/bench_async_isolation.py --backfill-days 60 --sessions 4 --workers 1,5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+from fixtures import seed_kline_table  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+BACKFILL_PARAMS = json.dumps({'sql_input': 'SELECT 日期, 收盘价 FROM btc_usdt_kline ORDER BY 日期 DESC LIMIT 30'},
+                             ensure_ascii=False)
+PROBE_PARAMS = json.dumps({'symbol': 'ETHUSDT'})
+
+
+def reset_database(db_path, client, backfill_days):
+    """重建数据库，使最近 backfill_days 天的日线缺失"""
+    from sqlalchemy import create_engine
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_engine(f'sqlite:///{db_path}')
+    seed_kline_table(engine, client, 30, end_date=date.today() - timedelta(days=backfill_days))
+    engine.dispose()
+
+
+def run_scenario(submit, backfill_tool, probe_tool, sessions, min_duration):
+    """提交一次数据补齐，并在补齐期间由 sessions 个会话循环调用实时价格工具，返回 (探测延迟列表, 补齐耗时)"""
+    started = time.perf_counter()
+    done = [None]
+    backfill = submit(backfill_tool, BACKFILL_PARAMS)
+    backfill.add_done_callback(lambda _: done.__setitem__(0, time.perf_counter() - started))
+    latencies, lock = [], threading.Lock()
+
+    def session():
+        while not backfill.done() or time.perf_counter() - started < min_duration:
+            probe_started = time.perf_counter()
+            submit(probe_tool, PROBE_PARAMS).result()
+            with lock:
+                latencies.append(time.perf_counter() - probe_started)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    backfill.result()
+    return latencies, done[0] or (time.perf_counter() - started)
+
+
+def summarize(name, latencies, backfill_seconds):
+    values = np.array(latencies) if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'mode': name,
+        'probes': len(latencies),
+        'backfill_seconds': round(backfill_seconds, 2) if backfill_seconds is not None else None,
+        'p50_ms': round(float(p50) * 1000, 1),
+        'p95_ms': round(float(p95) * 1000, 1),
+        'p99_ms': round(float(p99) * 1000, 1),
+        'max_ms': round(float(values.max()) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='异步工具会话隔离基准')
+    parser.add_argument('--backfill-days', type=int, default=60, help='数据库缺少的日线天数')
+    parser.add_argument('--sessions', type=int, default=4, help='同时查询实时价格的其他会话数')
+    parser.add_argument('--workers', default='1,5', help='同步模式的线程池大小，逗号分隔')
+    parser.add_argument('--exchange-latency', type=float, default=0.05)
+    parser.add_argument('--baseline-seconds', type=float, default=5.0, help='无补齐时的基线测量时长')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_exchange import set_client
+
+    workdir = tempfile.mkdtemp(prefix='btc_isolation_')
+    db_path = os.path.join(workdir, 'isolation.db')
+    os.environ['BTC_DB_URL'] = f'sqlite:///{db_path}'
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    client = FakeClient(latency=args.exchange_latency)
+    set_client(client)
+
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_async_tools import get_runner
+
+    rows = []
+    try:
+        # 基线：没有补齐任务时的实时价格延迟
+        probe = agent.GetRealTimePriceTool()
+        latencies = []
+        deadline = time.perf_counter() + args.baseline_seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            probe.call(PROBE_PARAMS)
+            latencies.append(time.perf_counter() - started)
+        rows.append(summarize('baseline（无补齐）', latencies, None))
+
+        for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+            reset_database(db_path, client, args.backfill_days)
+            pool = ThreadPoolExecutor(max_workers=workers)
+            latencies, backfill_seconds = run_scenario(
+                lambda tool, params: pool.submit(tool.call, params),
+                agent.ExcSQLTool(), agent.GetRealTimePriceTool(), args.sessions, args.baseline_seconds)
+            pool.shutdown()
+            rows.append(summarize(f'sync（{workers} 个线程）', latencies, backfill_seconds))
+
+        reset_database(db_path, client, args.backfill_days)
+        runner = get_runner()
+        latencies, backfill_seconds = run_scenario(
+            lambda tool, params: asyncio.run_coroutine_threadsafe(runner.guarded(tool.name, tool.acall(params)),
+                                                                  runner.loop),
+            agent.AsyncExcSQLTool(), agent.AsyncGetRealTimePriceTool(), args.sessions, args.baseline_seconds)
+        rows.append(summarize('async', latencies, backfill_seconds))
+    finally:
+        set_client(None)
+        shutil.rmtree(workdir, ignore_errors=True)
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                os.remove(os.path.join(IMAGE_DIR, name))
+
+    print(f"数据补齐 {args.backfill_days} 天，{args.sessions} 个其他会话查询实时价格，交易所延迟 {args.exchange_latency}s")
+    print('| 执行方式 | 探测次数 | 补齐耗时(s) | P50(ms) | P95(ms) | P99(ms) | 最大(ms) |')
+    print('|------|------|------|------|------|------|------|')
+    for row in rows:
+        print(f"| {row['mode']} | {row['probes']} | {row['backfill_seconds'] or '-'} | {row['p50_ms']} | "
+              f"{row['p95_ms']} | {row['p99_ms']} | {row['max_ms']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
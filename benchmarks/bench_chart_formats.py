@@ -0,0 +1,116 @@
+"""
+图表格式基准：SQL 价格/成交量图、ARIMA 预测图、实时价格图和四联技术指标图，
+分别按 png（matplotlib，300 dpi）、svg（降采样后直接生成）和 json（降采样后的序列数据）输出，
+比较每种格式的生成耗时和文件大小。数据由 FakeClient 生成；未安装 matplotlib 时跳过 png
+
+用法:
+    python benchmarks/bench_chart_formats.py --runs 5
+    python benchmarks/bench_chart_formats.py --max-points 200 --output chart_formats.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+
+
+def build_layouts():
+    """每种图表的 (名称, png 绘制函数(保存路径), 图表描述函数)"""
+    from datetime import timedelta
+
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_klines import klines_to_frame
+    from btc_vector_charts import forecast_chart_spec, indicator_chart_spec, price_chart_spec, sql_chart_spec
+
+    client = FakeClient()
+    tool = agent.GetRealTimePriceTool()
+
+    daily = klines_to_frame(client.get_klines(symbol='BTCUSDT', interval='1d', limit=365),
+                            time_column='开盘时间', date_column='日期').drop(columns=['开盘时间'])
+
+    history = daily.set_index('日期')['收盘价'].tail(70)
+    slope = (history.iloc[-1] - history.iloc[-8]) / 7
+    future_dates = [history.index[-1] + timedelta(days=i + 1) for i in range(7)]
+    forecast = history.iloc[-1] + slope * np.arange(1, 8)
+    forecast_args = ('BTC', 7, history, future_dates, forecast)
+
+    recent = klines_to_frame(client.get_klines(symbol='BTCUSDT', interval='15m', limit=100), time_column='开盘时间')
+    real_time_data = {'current_price': float(recent['收盘价'].iloc[-1]), 'price_change_percent_24h': 1.23}
+
+    hourly = klines_to_frame(client.get_klines(symbol='BTCUSDT', interval='1h', limit=1440), time_column='时间')
+    indicators = tool.calculate_technical_indicators(hourly)
+    strategy = tool.analyze_trading_strategy(indicators, real_time_data)
+
+    return [
+        ('price_volume', lambda path: agent.generate_btc_chart(daily, path), lambda: sql_chart_spec(daily)),
+        ('forecast', lambda path: agent.plot_forecast(*forecast_args, path),
+         lambda: forecast_chart_spec(*forecast_args)),
+        ('real_time_price', lambda path: tool.plot_real_time_price(real_time_data, recent, path, 'BTCUSDT'),
+         lambda: price_chart_spec('BTCUSDT', recent, real_time_data['current_price'],
+                                  real_time_data['price_change_percent_24h'])),
+        ('indicators', lambda path: tool.plot_technical_indicators(indicators, strategy, path, 'BTCUSDT'),
+         lambda: indicator_chart_spec(indicators, strategy, 'BTCUSDT')),
+    ]
+
+
+def measure(draw, path, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        draw(path)
+        times.append(time.perf_counter() - started)
+    return round(float(np.median(times)) * 1000, 1), os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='png / svg / json 图表的生成耗时和文件大小')
+    parser.add_argument('--runs', type=int, default=5, help='每种图表和格式的生成次数，耗时取中位数')
+    parser.add_argument('--max-points', type=int, default=400, help='svg / json 每条曲线最多保留的点数')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_vector_charts import write_chart
+
+    formats = ['svg', 'json']
+    if importlib.util.find_spec('matplotlib') is not None:
+        formats.insert(0, 'png')
+    else:
+        print('未安装 matplotlib，跳过 png')
+
+    workdir = tempfile.mkdtemp(prefix='btc_charts_')
+    rows = []
+    try:
+        for name, draw_png, build_spec in build_layouts():
+            for fmt in formats:
+                path = os.path.join(workdir, f'{name}.{fmt}')
+                if fmt == 'png':
+                    draw = draw_png
+                else:
+                    def draw(save_path, fmt=fmt):
+                        write_chart(build_spec(), save_path, fmt, args.max_points)
+                elapsed_ms, size = measure(draw, path, args.runs)
+                rows.append({'chart': name, 'format': fmt, 'render_ms': elapsed_ms, 'bytes': size})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"每条曲线最多 {args.max_points} 个点，每项生成 {args.runs} 次取中位数")
+    print('| 图表 | 格式 | 生成耗时(ms) | 文件大小(KB) |')
+    print('|------|------|------|------|')
+    for row in rows:
+        print(f"| {row['chart']} | {row['format']} | {row['render_ms']} | {row['bytes'] / 1024:.1f} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
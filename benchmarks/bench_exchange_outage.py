@@ -0,0 +1,138 @@
+"""
+交易所故障基准：若干会话持续调用 get_real_time_price，交易所（本地 FakeBinanceServer）依次经历
+正常 -> 故障（挂起或 503）-> 恢复 三个阶段，分别统计每个阶段的延迟分位数、错误率和使用过期数据的比例
+对比不经过熔断器（每次请求都等到超时）和经过熔断器（熔断后直接返回最近一次的数据并在后台刷新）两种情况
+
+用法:
+    python benchmarks/bench_exchange_outage.py --outage stall --timeout 2 --healthy 5 --down 20 --recovered 20
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_binance_server import FakeBinanceServer, HttpExchangeClient  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+PHASES = ('healthy', 'down', 'recovered')
+STALE_MARKER = '交易所暂时不可用'
+ERROR_PREFIXES = ('获取实时价格数据时发生错误', '获取实时价格数据失败', '获取实时价格时数据结构错误',
+                  '获取实时价格失败', '交易对符号错误', '网络连接错误')
+
+
+def classify(result):
+    if not isinstance(result, str) or result.startswith(ERROR_PREFIXES):
+        return 'error'
+    return 'stale' if STALE_MARKER in result else 'ok'
+
+
+def session(tool, phase, samples, lock, stop):
+    params = json.dumps({'symbol': 'BTCUSDT'})
+    while not stop.is_set():
+        current = phase[0]
+        started = time.perf_counter()
+        try:
+            outcome = classify(tool.call(params))
+        except Exception:
+            outcome = 'error'
+        with lock:
+            samples.append((current, time.perf_counter() - started, outcome))
+        time.sleep(0.2)
+
+
+def run(args, use_breaker):
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_circuit_breaker import BreakerClient, get_breaker, last_known
+    from btc_exchange import set_client
+
+    breaker = get_breaker()
+    breaker.reset()
+    breaker.reset_timeout = args.reset
+    last_known.clear()
+    server = FakeBinanceServer(limit=100000, latency=args.latency).start()
+    server.stall_seconds = args.timeout * 5
+    client = HttpExchangeClient(server.url, timeout=args.timeout)
+    set_client(BreakerClient(client, breaker) if use_breaker else client)
+    tool = agent.AsyncGetRealTimePriceTool() if args.async_tools else agent.GetRealTimePriceTool()
+
+    phase, samples, lock, stop = ['healthy'], [], threading.Lock(), threading.Event()
+    threads = [threading.Thread(target=session, args=(tool, phase, samples, lock, stop)) for _ in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.healthy)
+    phase[0], server.outage = 'down', args.outage
+    time.sleep(args.down)
+    phase[0], server.outage = 'recovered', None
+    time.sleep(args.recovered)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.stop()
+    set_client(None)
+
+    result = {'mode': 'breaker' if use_breaker else 'no_breaker', 'breaker': breaker.stats(), 'phases': {}}
+    for name in PHASES:
+        items = [item for item in samples if item[0] == name]
+        latencies = np.array([item[1] for item in items]) if items else np.zeros(1)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result['phases'][name] = {
+            'requests': len(items),
+            'p50_ms': round(float(p50) * 1000, 1),
+            'p95_ms': round(float(p95) * 1000, 1),
+            'p99_ms': round(float(p99) * 1000, 1),
+            'max_ms': round(float(latencies.max()) * 1000, 1),
+            'error_rate': round(sum(item[2] == 'error' for item in items) / len(items), 4) if items else 0.0,
+            'stale_rate': round(sum(item[2] == 'stale' for item in items) / len(items), 4) if items else 0.0,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交易所故障时的工具延迟基准')
+    parser.add_argument('--outage', choices=('stall', 'error'), default='stall', help='故障类型：挂起或立即返回 503')
+    parser.add_argument('--timeout', type=float, default=2.0, help='客户端请求超时（秒）')
+    parser.add_argument('--reset', type=float, default=5.0, help='熔断后多久放行探测请求（秒）')
+    parser.add_argument('--healthy', type=float, default=5.0, help='正常阶段时长（秒）')
+    parser.add_argument('--down', type=float, default=20.0, help='故障阶段时长（秒）')
+    parser.add_argument('--recovered', type=float, default=15.0, help='恢复阶段时长（秒）')
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help='正常时交易所每次请求的延迟（秒）')
+    parser.add_argument('--async-tools', action='store_true', help='使用异步版本的工具')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_singleflight import tool_flight
+
+    # 每个会话的调用都单独计时，不合并
+    tool_flight.enabled = False
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    try:
+        rows = [run(args, use_breaker=False), run(args, use_breaker=True)]
+    finally:
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                path = os.path.join(IMAGE_DIR, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    print(f"故障类型 {args.outage}，请求超时 {args.timeout:g}s，{args.sessions} 个会话")
+    print('| 模式 | 阶段 | 请求数 | P50(ms) | P95(ms) | P99(ms) | 最大(ms) | 错误率 | 过期数据 |')
+    print('|------|------|------|------|------|------|------|------|------|')
+    for row in rows:
+        for name, item in row['phases'].items():
+            print(f"| {row['mode']} | {name} | {item['requests']} | {item['p50_ms']} | {item['p95_ms']} | "
+                  f"{item['p99_ms']} | {item['max_ms']} | {item['error_rate']:.1%} | {item['stale_rate']:.1%} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+HTTP 接口压测：在本进程启动 btc_api，交易所使用 FakeClient（或录制文件回放），数据库使用临时 SQLite，完全离线。
+N 个客户端并发请求 price / strategy / forecast / sql，其中 --conditional 比例的请求带上次的 ETag（If-None-Match），
+输出每个接口的吞吐量、P50/P95 延迟和 200 / 304 / 错误的数量
+
+未安装 sqlalchemy 时跳过 sql 接口；未安装 statsmodels 时 forecast 返回 502，计入错误
+
+用法:
+    python benchmarks/bench_http_api.py --clients 8 --duration 20
+    python benchmarks/bench_http_api.py --mix price=5,strategy=3 --conditional 0 --output api.json
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+from fixtures import seed_kline_table  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+
+DEFAULT_MIX = {'price': 5, 'strategy': 3, 'forecast': 1, 'sql': 1}
+SYMBOLS = ('BTCUSDT', 'ETHUSDT')
+SQL_QUERIES = (
+    "SELECT 日期, 收盘价 FROM btc_usdt_kline ORDER BY 日期 DESC LIMIT 30",
+    "SELECT MAX(最高价) AS 最高价, MIN(最低价) AS 最低价 FROM btc_usdt_kline",
+)
+
+
+def make_path(endpoint, rng):
+    if endpoint in ('price', 'strategy'):
+        return f"/{endpoint}?symbol={rng.choice(SYMBOLS)}"
+    if endpoint == 'forecast':
+        return f"/forecast?b_code=BTC&n={rng.choice((7, 14))}"
+    return f"/sql?q={quote(rng.choice(SQL_QUERIES))}"
+
+
+def client_worker(port, mix, deadline, conditional, seed, samples, lock):
+    rng = random.Random(seed)
+    endpoints, weights = zip(*mix.items())
+    etags = {}
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights)[0]
+        path = make_path(endpoint, rng)
+        headers = {}
+        if path in etags and rng.random() < conditional:
+            headers['If-None-Match'] = etags[path]
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('ETag'):
+                etags[path] = response.getheader('ETag')
+        except Exception as e:
+            status = type(e).__name__
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        with lock:
+            samples.append((endpoint, status, time.perf_counter() - started))
+    connection.close()
+
+
+def summarize(samples, elapsed):
+    summary = {}
+    for endpoint in sorted({item[0] for item in samples}) + ['all']:
+        items = [item for item in samples if endpoint == 'all' or item[0] == endpoint]
+        latencies = np.array([item[2] for item in items]) * 1000
+        statuses = [item[1] for item in items]
+        summary[endpoint] = {
+            'requests': len(items),
+            'throughput_rps': round(len(items) / elapsed, 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+            'ok': statuses.count(200),
+            'not_modified': statuses.count(304),
+            'errors': len(statuses) - statuses.count(200) - statuses.count(304),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 HTTP 接口离线压测')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=20.0, help='运行秒数')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help='接口请求比例，如 price=5,strategy=3,forecast=1,sql=1')
+    parser.add_argument('--conditional', type=float, default=0.5, help='带 If-None-Match 的请求比例')
+    parser.add_argument('--exchange-latency', type=float, default=0.05, help='模拟的交易所接口延迟（秒）')
+    parser.add_argument('--history-days', type=int, default=365, help='SQLite 中预置的日线天数')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_api import start_api_server
+    from btc_exchange import set_client
+
+    mix = {name: float(weight) for name, weight in (item.split('=') for item in args.mix.split(',') if item)}
+    workdir = tempfile.mkdtemp(prefix='btc_api_')
+    client = FakeClient(seed=args.seed, latency=args.exchange_latency)
+    if importlib.util.find_spec('sqlalchemy') is not None:
+        from sqlalchemy import create_engine
+
+        db_url = f"sqlite:///{os.path.join(workdir, 'api.db')}"
+        os.environ['BTC_DB_URL'] = db_url
+        seed_kline_table(create_engine(db_url), client, args.history_days)
+    elif mix.pop('sql', None):
+        print('未安装 sqlalchemy，跳过 sql 接口')
+    set_client(client)
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    server = start_api_server([agent.ExcSQLTool(), agent.ARIMATool(), agent.GetRealTimePriceTool()], port=0)
+    port = server.server_address[1]
+
+    samples, lock = [], threading.Lock()
+    try:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=client_worker,
+                                    args=(port, mix, deadline, args.conditional, args.seed + i, samples, lock))
+                   for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        set_client(None)
+        shutil.rmtree(workdir, ignore_errors=True)
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                os.remove(os.path.join(IMAGE_DIR, name))
+
+    summary = summarize(samples, elapsed)
+    print(f"{args.clients} 个客户端，{args.duration:g} 秒，交易所延迟 {args.exchange_latency * 1000:g}ms，"
+          f"条件请求比例 {args.conditional:.0%}")
+    print('| 接口 | 请求数 | 吞吐(次/秒) | P50(ms) | P95(ms) | 200 | 304 | 错误 |')
+    print('|------|------|------|------|------|------|------|------|')
+    for name, item in summary.items():
+        print(f"| {name} | {item['requests']} | {item['throughput_rps']} | {item['p50_ms']} | {item['p95_ms']} | "
+              f"{item['ok']} | {item['not_modified']} | {item['errors']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'clients': args.clients, 'duration': args.duration, 'mix': mix, 'summary': summary},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+导入耗时基准测试：基于 python -X importtime 统计导入主模块的耗时，
+并检查较重的依赖是否被提前导入，用于发现启动速度的回退
+
+用法:
+    python benchmarks/bench_import_time.py --budget-ms 1500 --top 15
+退出码为 1 表示超出耗时预算或有重依赖在导入阶段被加载
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = 'btc_analysis_agent_qwen_trub'
+
+# 这些依赖只应在对应工具或服务启动时导入
+LAZY_MODULES = (
+    'statsmodels',
+    'matplotlib',
+    'pandas',
+    'sqlalchemy',
+    'dashscope',
+    'binance',
+    'qwen_agent.agents',
+    'qwen_agent.gui',
+)
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def profile_import(module=MODULE, python=sys.executable):
+    """在子进程中导入模块，返回 [(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def summarize(rows, module=MODULE, top=15):
+    total_us = next((cum for name, _, cum, _ in rows if name == module), sum(r[1] for r in rows))
+    imported = {name for name, _, _, _ in rows}
+    eager = sorted(name for name in LAZY_MODULES if name in imported)
+    # 只统计主模块直接导入的顶层依赖
+    heaviest = sorted((r for r in rows if r[3] <= 1), key=lambda r: r[2], reverse=True)[:top]
+    return {
+        'module': module,
+        'total_ms': round(total_us / 1000, 1),
+        'eager_heavy_modules': eager,
+        'top_imports': [{'module': name, 'cumulative_ms': round(cum / 1000, 1)} for name, _, cum, _ in heaviest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='主模块导入耗时基准测试')
+    parser.add_argument('--module', default=MODULE)
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    summary = summarize(profile_import(args.module), args.module, args.top)
+    print(f"导入 {summary['module']} 总耗时: {summary['total_ms']} ms（预算 {args.budget_ms} ms）")
+    print('| 模块 | 累计耗时(ms) |')
+    print('|------|------|')
+    for row in summary['top_imports']:
+        print(f"| {row['module']} | {row['cumulative_ms']} |")
+
+    failed = False
+    if summary['eager_heavy_modules']:
+        print(f"以下依赖应延迟导入，但在导入阶段被加载: {', '.join(summary['eager_heavy_modules'])}")
+        failed = True
+    if summary['total_ms'] > args.budget_ms:
+        print("导入耗时超出预算")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
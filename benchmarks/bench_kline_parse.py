@@ -0,0 +1,96 @@
+"""
+K线解析基准测试：对比原先的 12 列字符串 DataFrame + astype(float) 写法与 btc_klines 的按列解析
+输出每 10 万根K线的解析耗时、解析过程峰值内存和结果占用内存
+
+用法:
+    python benchmarks/bench_kline_parse.py --candles 100000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from btc_klines import KLINE_FIELDS, klines_to_frame, parse_klines, parse_klines_structured  # noqa: E402
+from fixtures import make_raw_klines  # noqa: E402
+
+
+def legacy_parse(klines):
+    """原先 fetch_60day_historical_data 中的写法"""
+    df = pd.DataFrame(klines, columns=list(KLINE_FIELDS))
+    df['时间'] = pd.to_datetime(df['开盘时间戳'], unit='ms')
+    df['开盘价'] = df['开盘价'].astype(float)
+    df['收盘价'] = df['收盘价'].astype(float)
+    df['最高价'] = df['最高价'].astype(float)
+    df['最低价'] = df['最低价'].astype(float)
+    df['成交量'] = df['成交量'].astype(float)
+    return df
+
+
+def result_bytes(result):
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, dict):
+        return int(sum(v.nbytes for v in result.values()))
+    return int(result.nbytes)
+
+
+def measure(func, klines, repeat):
+    """返回 (最快耗时秒, 峰值内存字节, 结果内存字节)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(klines)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    result = func(klines)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, result_bytes(result)
+
+
+CASES = {
+    'legacy_dataframe': legacy_parse,
+    'frame_float64': lambda k: klines_to_frame(k, time_column='时间'),
+    'columns_float64': parse_klines,
+    'columns_float32': lambda k: parse_klines(k, float_dtype=np.float32),
+    'structured_float64': parse_klines_structured,
+}
+
+
+def run(candles=100_000, repeat=5):
+    klines = make_raw_klines(candles)
+    scale = 100_000 / candles
+    rows = []
+    for name, func in CASES.items():
+        seconds, peak, size = measure(func, klines, repeat)
+        rows.append({
+            'case': name,
+            'candles': candles,
+            'ms_per_100k': round(seconds * 1000 * scale, 2),
+            'peak_mb_per_100k': round(peak / 1e6 * scale, 2),
+            'result_mb_per_100k': round(size / 1e6 * scale, 2),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K线解析基准测试')
+    parser.add_argument('--candles', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = run(args.candles, args.repeat)
+    print('| 解析方式 | 耗时(ms/10万根) | 峰值内存(MB/10万根) | 结果内存(MB/10万根) |')
+    print('|------|------|------|------|')
+    for row in rows:
+        print(f"| {row['case']} | {row['ms_per_100k']} | {row['peak_mb_per_100k']} | {row['result_mb_per_100k']} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+本地订单簿基准：生成（或读取）录制的增量深度流，重放到 OrderBookSync，
+校验盘口与参考盘口逐档一致（包括序号断档后重新同步），并统计：
+- 每个增量事件的处理耗时
+- 深度加权中间价、买卖盘不平衡度、1% 范围流动性的查询耗时（另外统计每次查询前都修改一档的情况）
+- 对比：每次请求都加载一份 REST 快照再计算同样的指标（不含网络耗时）
+
+生成的流由 fake_exchange.FakeDepthStream 产生：订阅后先缓存若干事件再请求快照，每隔 --gap-every 个事件丢弃一个
+（模拟丢包），丢包后下一个事件触发重新同步，录制文件中记下当时请求到的快照；--check-every 个事件记一次参考盘口
+
+用法:
+    python benchmarks/bench_order_book.py --events 100000 --levels 1000
+    python benchmarks/bench_order_book.py --save depth.jsonl.gz            # 保存生成的录制文件
+    python benchmarks/bench_order_book.py --stream exchange_sessions/depth_BTCUSDT_1700000000.jsonl.gz
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeDepthStream  # noqa: E402
+
+
+def generate(args):
+    """生成录制记录 [(种类, 数据), ...]，种类为 event、snapshot 或 check（参考盘口）"""
+    stream = FakeDepthStream(seed=args.seed, levels=args.levels)
+    records = []
+    resync_pending = True
+    buffered = 0
+    for index in range(args.events):
+        event = stream.next_event()
+        if args.gap_every and index and index % args.gap_every == 0:
+            # 丢包：参考盘口已经变化，但本地收不到这个事件
+            continue
+        records.append(('event', event))
+        buffered += 1
+        if resync_pending and buffered >= args.buffered:
+            # 订阅后缓存了一些事件时快照才返回（录制时快照写在请求的时刻）
+            records.append(('snapshot', stream.snapshot()))
+            resync_pending = False
+        if args.gap_every and index % args.gap_every == 1 and index > 1:
+            # 丢包后的第一个事件触发重新同步
+            records.append(('snapshot', stream.snapshot()))
+        if args.check_every and index % args.check_every == 0 and not resync_pending:
+            records.append(('check', stream.snapshot()))
+    records.append(('check', stream.snapshot()))
+    return records
+
+
+def levels_of(side):
+    return [(float(price), float(quantity)) for price, quantity in side]
+
+
+def same_book(book, reference):
+    local = book.snapshot(limit=len(reference['bids']) + len(reference['asks']) + 1)
+    return (levels_of(local['bids']) == levels_of(reference['bids'])
+            and levels_of(local['asks']) == levels_of(reference['asks']))
+
+
+def per_call_us(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地订单簿的正确性和更新 / 查询耗时')
+    parser.add_argument('--events', type=int, default=100000, help='生成的增量事件数')
+    parser.add_argument('--levels', type=int, default=1000, help='参考盘口每侧的档位数')
+    parser.add_argument('--buffered', type=int, default=20, help='快照返回前缓存的事件数')
+    parser.add_argument('--gap-every', type=int, default=25000, help='每隔多少个事件丢弃一个，0 为不丢')
+    parser.add_argument('--check-every', type=int, default=10000, help='每隔多少个事件校验一次盘口')
+    parser.add_argument('--repeat', type=int, default=20000, help='每种查询的重复次数')
+    parser.add_argument('--stream', help='重放录制的深度流文件，而不是生成')
+    parser.add_argument('--save', help='把生成的录制记录保存为 JSONL（.gz）文件')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_order_book import OrderBook, StreamRecorder, read_stream, replay_stream
+
+    if args.stream:
+        records = read_stream(args.stream)
+    else:
+        records = generate(args)
+        if args.save:
+            recorder = StreamRecorder(args.save)
+            for kind, data in records:
+                recorder.write(kind, data)
+            recorder.close()
+    events = sum(kind == 'event' for kind, _ in records)
+
+    mismatches = []
+
+    def verify(sync, kind, data):
+        if kind == 'check' and not (sync.synced and same_book(sync.book, data)):
+            mismatches.append(data['lastUpdateId'])
+
+    sync = replay_stream(records, on_record=verify)
+    started = time.perf_counter()
+    timed = replay_stream(records)
+    update_us = (time.perf_counter() - started) / max(events, 1) * 1e6
+    book = timed.book
+
+    queries = {
+        'weighted_mid': lambda: book.weighted_mid(20),
+        'imbalance': lambda: book.imbalance(20),
+        'liquidity_1pct': lambda: book.liquidity(1.0),
+        'metrics': lambda: book.metrics(),
+    }
+    query_us = {name: round(per_call_us(func, args.repeat), 2) for name, func in queries.items()}
+    # 每次查询前修改一档（深度流更新频繁时的实际情况）
+    best_bid = book.best()[0]
+    toggle = [0]
+
+    def update_then_query():
+        toggle[0] += 1
+        book.bids.update(best_bid[0], best_bid[1] + toggle[0] % 2)
+        book.liquidity(1.0)
+    query_us['liquidity_1pct_after_update'] = round(per_call_us(update_then_query, max(args.repeat // 10, 1)), 2)
+    snapshot = book.snapshot(limit=1000)
+
+    def from_rest():
+        fresh = OrderBook(book.symbol)
+        fresh.load_snapshot(snapshot)
+        fresh.metrics()
+    rest_us = round(per_call_us(from_rest, max(args.repeat // 100, 1)), 1)
+
+    result = {
+        'events': events,
+        'levels': {'bids': len(book.bids), 'asks': len(book.asks)},
+        'checks': sum(kind == 'check' for kind, _ in records),
+        'mismatches': mismatches,
+        'stats': sync.stats,
+        'update_us': round(update_us, 2),
+        'query_us': query_us,
+        'rest_snapshot_us': rest_us,
+        'metrics': book.metrics(),
+    }
+    print(f"{events} 个增量事件，盘口 {len(book.bids)}/{len(book.asks)} 档，"
+          f"同步 {sync.stats['syncs']} 次（断档 {sync.stats['gaps']} 次），"
+          f"校验 {result['checks']} 次，不一致 {len(mismatches)} 次")
+    print(f"每个事件 {result['update_us']} us；每次请求加载 1000 档 REST 快照并计算指标 {rest_us} us")
+    print('| 查询 | 耗时(us) |')
+    print('|------|------|')
+    for name, value in query_us.items():
+        print(f"| {name} | {value} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
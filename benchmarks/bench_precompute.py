@@ -0,0 +1,112 @@
+"""
+收盘后预计算基准：get_real_time_price 请求本地 FakeBinanceServer（每次请求带固定延迟），
+比较没有预计算（每次获取历史K线、计算指标和策略、绘制技术指标图表）和关注列表命中预计算结果
+（只获取实时行情和短期K线、代入实时价格）时的调用耗时，以及一次预计算本身的耗时
+
+用法:
+    python benchmarks/bench_precompute.py --latency 0.05 --runs 5
+    python benchmarks/bench_precompute.py --async-tools --output precompute.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_binance_server import FakeBinanceServer, HttpExchangeClient  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+
+
+def p50_ms(values):
+    return round(float(np.percentile(values, 50)) * 1000, 1)
+
+
+def clear_market_data():
+    """清空缓存的行情和K线（保留预计算结果），每次调用都要重新请求交易所"""
+    from btc_cache_backend import cache_key, get_cache_backend
+
+    for kind in ('quote', 'klines', 'daily', 'stage'):
+        get_cache_backend().clear(cache_key(kind, ''))
+
+
+def timed_calls(tool, params, runs):
+    tool.call(params)  # 预热：导入、首次指标计算
+    samples = []
+    for _ in range(runs):
+        clear_market_data()
+        started = time.perf_counter()
+        tool.call(params)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(args, tool):
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_precompute import PrecomputeJob, PrecomputeScheduler, precomputed
+
+    params = json.dumps({'symbol': 'BTCUSDT', 'output': args.mode})
+    precomputed.clear()
+    cold = timed_calls(tool, params, args.runs)
+
+    scheduler = PrecomputeScheduler(
+        [PrecomputeJob('strategy', agent.KLINE_INTERVAL_1HOUR, agent.GetRealTimePriceTool().precompute_strategy)],
+        symbols=['BTCUSDT'], jitter=0).start()
+    started = time.perf_counter()
+    while precomputed.get('BTCUSDT', 'strategy') is None:
+        if scheduler.failures:
+            raise RuntimeError('预计算失败')
+        time.sleep(0.01)
+    precompute_seconds = time.perf_counter() - started
+    scheduler.stop()
+    warm = timed_calls(tool, params, args.runs)
+    return {'cold_p50_ms': p50_ms(cold), 'precomputed_p50_ms': p50_ms(warm),
+            'precompute_ms': round(precompute_seconds * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='收盘后预计算对 get_real_time_price 耗时的影响')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟交易所每次请求的延迟（秒）')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=('markdown', 'compact'), default='markdown', help='工具结果格式')
+    parser.add_argument('--async-tools', action='store_true', help='使用异步版本的工具')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_exchange import set_client
+    from btc_singleflight import tool_flight
+
+    # 每次调用都单独计时，不合并
+    tool_flight.enabled = False
+    server = FakeBinanceServer(limit=10 ** 6, latency=args.latency).start()
+    set_client(HttpExchangeClient(server.url))
+    tool = agent.AsyncGetRealTimePriceTool() if args.async_tools else agent.GetRealTimePriceTool()
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    try:
+        result = run(args, tool)
+    finally:
+        server.stop()
+        set_client(None)
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                path = os.path.join(IMAGE_DIR, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    print(f"{type(tool).__name__}，交易所延迟 {args.latency * 1000:g}ms，{args.runs} 次，取 P50")
+    print('| 无预计算(ms) | 命中预计算(ms) | 单次预计算(ms) |')
+    print('|------|------|------|')
+    print(f"| {result['cold_p50_ms']} | {result['precomputed_p50_ms']} | {result['precompute_ms']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
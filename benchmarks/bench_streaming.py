@@ -0,0 +1,97 @@
+"""
+分阶段流式输出基准：get_real_time_price 请求本地 FakeBinanceServer（每次请求带固定延迟），
+比较 call()（等全部完成才返回）和 stream()（逐段产出）首次拿到有用内容的时间，
+以及流式各阶段（行情、策略分析、价格走势图、技术指标图表）的到达时间
+
+用法:
+    python benchmarks/bench_streaming.py --latency 0.15 --runs 5
+    python benchmarks/bench_streaming.py --async-tools --output streaming.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_binance_server import FakeBinanceServer, HttpExchangeClient  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+
+
+def p50_ms(values):
+    return round(float(np.percentile(values, 50)) * 1000, 1)
+
+
+def run(args, tool):
+    from btc_cache_backend import get_cache_backend
+
+    params = json.dumps({'symbol': 'BTCUSDT', 'output': args.mode})
+    tool.call(params)  # 预热：导入、首次指标计算
+    full, first, stages = [], [], []
+    for _ in range(args.runs):
+        # 每次计时前清空缓存，行情和K线都要重新请求交易所
+        get_cache_backend().clear()
+        started = time.perf_counter()
+        tool.call(params)
+        full.append(time.perf_counter() - started)
+
+        get_cache_backend().clear()
+        started = time.perf_counter()
+        arrivals = [time.perf_counter() - started for _ in tool.stream(params)]
+        first.append(arrivals[0])
+        stages.append(arrivals)
+    count = min(len(item) for item in stages)
+    return {
+        'call_p50_ms': p50_ms(full),
+        'stream_first_p50_ms': p50_ms(first),
+        'stream_stages_p50_ms': [p50_ms([item[i] for item in stages]) for i in range(count)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分阶段流式输出的首段内容延迟')
+    parser.add_argument('--latency', type=float, default=0.15, help='模拟交易所每次请求的延迟（秒）')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=('markdown', 'compact'), default='markdown', help='工具结果格式')
+    parser.add_argument('--async-tools', action='store_true', help='使用异步版本的工具')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    import btc_analysis_agent_qwen_trub as agent
+    from btc_exchange import set_client
+    from btc_singleflight import tool_flight
+
+    # 每次调用都单独计时，不合并
+    tool_flight.enabled = False
+    server = FakeBinanceServer(limit=10 ** 6, latency=args.latency).start()
+    set_client(HttpExchangeClient(server.url))
+    tool = agent.AsyncGetRealTimePriceTool() if args.async_tools else agent.GetRealTimePriceTool()
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    try:
+        result = run(args, tool)
+    finally:
+        server.stop()
+        set_client(None)
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                path = os.path.join(IMAGE_DIR, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    print(f"{type(tool).__name__}，交易所延迟 {args.latency * 1000:g}ms，{args.runs} 次，取 P50")
+    print('| call() 完整结果(ms) | stream() 首段(ms) | stream() 各阶段(ms) |')
+    print('|------|------|------|')
+    print(f"| {result['call_p50_ms']} | {result['stream_first_p50_ms']} | "
+          f"{' / '.join(str(item) for item in result['stream_stages_p50_ms'])} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
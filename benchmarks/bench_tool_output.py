@@ -0,0 +1,213 @@
+"""
+工具输出格式基准：get_real_time_price 分别以 markdown（完整报告）和 compact（一行摘要加 JSON）格式返回，
+统计工具结果和整个提示词（system prompt、函数描述、用户问题、工具结果）的 token 数，
+再把提示词发给本地的替身大模型，测量首 token 时间和回答完成时间，加上工具耗时即端到端延迟
+
+替身大模型是一个 OpenAI 兼容的流式接口：按提示词 token 数 / prefill 速度等待后输出首个 token，
+之后按 decode 速度逐个输出 answer_tokens 个 token。--llm-url 可以改为指向真实的本地模型服务
+（如 llama.cpp、vLLM 的 /v1 地址），此时延迟为真实测量值
+
+token 数优先用 tiktoken（cl100k_base）计算，未安装时按汉字 1 个 token、其他字符约 3 个 1 个 token 估算
+
+用法:
+    python benchmarks/bench_tool_output.py --runs 5 --prefill-tps 1500 --decode-tps 50 --answer-tokens 150
+    python benchmarks/bench_tool_output.py --llm-url http://127.0.0.1:8000/v1 --model qwen2.5-7b-instruct
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+MODES = ('markdown', 'compact')
+QUESTION = '现在比特币价格多少？给我一个短线操作建议'
+CJK = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+    TOKENIZER = 'tiktoken cl100k_base'
+except Exception:
+    _encoding = None
+    TOKENIZER = '估算（汉字 1 token，其他字符 3 个 1 token）'
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    cjk = len(CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3)
+
+
+def build_messages(tool_result):
+    """与助手实际发给大模型的内容相同：system prompt（含函数描述）、用户问题、函数调用和工具结果"""
+    import btc_analysis_agent_qwen_trub as agent
+
+    system = agent.system_prompt + '\n\n' + json.dumps(agent.functions_desc, ensure_ascii=False)
+    return [
+        {'role': 'system', 'content': system},
+        {'role': 'user', 'content': QUESTION},
+        {'role': 'assistant', 'content': '', 'function_call': {
+            'name': 'get_real_time_price', 'arguments': json.dumps({'symbol': 'BTCUSDT'})}},
+        {'role': 'function', 'name': 'get_real_time_price', 'content': tool_result},
+    ]
+
+
+def prompt_tokens(messages):
+    return sum(count_tokens(message.get('content') or '') + 4 for message in messages)
+
+
+class StandInLLM:
+    """本地替身大模型：OpenAI 兼容的 /v1/chat/completions 流式接口，延迟由提示词 token 数决定"""
+
+    def __init__(self, prefill_tps=1500.0, decode_tps=50.0, answer_tokens=150):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.answer_tokens = answer_tokens
+        self.httpd = None
+
+    def start(self):
+        llm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(prompt_tokens(body['messages']) / llm.prefill_tps)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for _ in range(llm.answer_tokens):
+                    chunk = {'choices': [{'index': 0, 'delta': {'content': '好'}}]}
+                    self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(1 / llm.decode_tps)
+                self.wfile.write(b'data: [DONE]\n\n')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='stand-in-llm', daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def chat(url, model, messages):
+    """流式请求一次，返回 (首 token 时间, 完成时间)，单位秒"""
+    body = json.dumps({'model': model, 'messages': messages, 'stream': True}).encode('utf-8')
+    request = urllib.request.Request(f'{url.rstrip("/")}/chat/completions', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    first = None
+    with urllib.request.urlopen(request, timeout=300) as resp:
+        for line in resp:
+            if not line.startswith(b'data: ') or line.strip() == b'data: [DONE]':
+                continue
+            delta = json.loads(line[6:])['choices'][0].get('delta', {})
+            if first is None and delta.get('content'):
+                first = time.perf_counter() - started
+    return first or 0.0, time.perf_counter() - started
+
+
+def run(args, mode, url):
+    import btc_analysis_agent_qwen_trub as agent
+
+    tool = agent.GetRealTimePriceTool()
+    params = json.dumps({'symbol': 'BTCUSDT', 'output': mode, 'deadline_seconds': 0})
+    tool.call(params)  # 预热：导入、首次指标计算
+    tool_times, ttfts, llm_times, e2e = [], [], [], []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = tool.call(params)
+        tool_times.append(time.perf_counter() - started)
+        messages = build_messages(result)
+        ttft, total = chat(url, args.model, messages)
+        ttfts.append(ttft)
+        llm_times.append(total)
+        e2e.append(tool_times[-1] + total)
+
+    def p50_ms(values):
+        return round(float(np.percentile(values, 50)) * 1000, 1)
+
+    return {
+        'mode': mode,
+        'result_chars': len(result),
+        'result_tokens': count_tokens(result),
+        'prompt_tokens': prompt_tokens(messages),
+        'tool_p50_ms': p50_ms(tool_times),
+        'ttft_p50_ms': p50_ms(ttfts),
+        'llm_p50_ms': p50_ms(llm_times),
+        'e2e_p50_ms': p50_ms(e2e),
+        'sample': result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='工具输出格式对 token 数和回答延迟的影响')
+    parser.add_argument('--runs', type=int, default=3, help='每种格式的测量次数')
+    parser.add_argument('--prefill-tps', type=float, default=1500.0, help='替身大模型每秒处理的提示词 token 数')
+    parser.add_argument('--decode-tps', type=float, default=50.0, help='替身大模型每秒输出的 token 数')
+    parser.add_argument('--answer-tokens', type=int, default=150, help='替身大模型每次回答的 token 数')
+    parser.add_argument('--llm-url', help='OpenAI 兼容的大模型地址（/v1），不指定时使用替身大模型')
+    parser.add_argument('--model', default='stand-in')
+    parser.add_argument('--output', help='结果（含两种格式的工具结果样例）写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_exchange import set_client
+    from btc_singleflight import tool_flight
+
+    # 每次调用都单独计时，不合并
+    tool_flight.enabled = False
+    set_client(FakeClient())
+    llm = None if args.llm_url else StandInLLM(args.prefill_tps, args.decode_tps, args.answer_tokens).start()
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+    try:
+        rows = [run(args, mode, args.llm_url or llm.url) for mode in MODES]
+    finally:
+        if llm is not None:
+            llm.stop()
+        set_client(None)
+        if os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                path = os.path.join(IMAGE_DIR, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    if llm is not None:
+        print(f"替身大模型: prefill {args.prefill_tps:g} token/s，decode {args.decode_tps:g} token/s，"
+              f"回答 {args.answer_tokens} token")
+    print(f"token 计数: {TOKENIZER}，每种格式 {args.runs} 次，延迟取 P50")
+    print('| 格式 | 工具结果字符 | 工具结果 token | 提示词 token | 工具(ms) | 首 token(ms) | 大模型(ms) | 端到端(ms) |')
+    print('|------|------|------|------|------|------|------|------|')
+    for row in rows:
+        print(f"| {row['mode']} | {row['result_chars']} | {row['result_tokens']} | {row['prompt_tokens']} | "
+              f"{row['tool_p50_ms']} | {row['ttft_p50_ms']} | {row['llm_p50_ms']} | {row['e2e_p50_ms']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+请求权重调度基准：后台补齐线程不停地分页拉取历史K线，同时若干交互会话查询实时价格（行情 + 盘口 + K线），
+全部请求发往本地限流的 FakeBinanceServer。分别在不经过调度、经过 WeightGovernor 两种情况下运行，
+统计交易所返回的 429 / 418 次数、交互请求的成功率和延迟、补齐完成的批次数
+
+用法:
+    python benchmarks/bench_weight_governor.py --limit 600 --window 10 --duration 30
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_binance_server import FakeBinanceServer, HttpExchangeClient  # noqa: E402
+
+from btc_weight_governor import (BACKFILL, INTERACTIVE, GovernedClient, WeightGovernor,  # noqa: E402
+                                 WeightLimitError, request_priority)
+
+
+def interactive_session(client, deadline, think_time, samples, lock):
+    """与 get_real_time_price 相同的一组请求"""
+    with request_priority(INTERACTIVE):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                client.get_ticker(symbol='BTCUSDT')
+                client.get_order_book(symbol='BTCUSDT', limit=1)
+                client.get_klines(symbol='BTCUSDT', interval='15m', limit=100)
+                client.get_klines(symbol='BTCUSDT', interval='1h', limit=1000)
+                outcome = 'ok'
+            except WeightLimitError:
+                outcome = 'rejected'
+            except Exception as e:
+                outcome = 'banned' if getattr(e, 'status_code', None) == 418 else 'rate_limited'
+            with lock:
+                samples.append((outcome, time.perf_counter() - started))
+            time.sleep(think_time)
+
+
+def backfill_worker(client, deadline, counts, lock):
+    """按 1000 根一页不停地拉取小时线，模拟大段数据补齐"""
+    end_ms = int(time.time() * 1000)
+    with request_priority(BACKFILL):
+        while time.perf_counter() < deadline:
+            try:
+                client.get_historical_klines(symbol='BTCUSDT', interval='1h', start_str=end_ms - 1000 * 3600 * 1000,
+                                             end_str=end_ms)
+                key = 'batches'
+            except WeightLimitError:
+                key = 'deferred'
+                time.sleep(0.2)
+            except Exception:
+                key = 'errors'
+                time.sleep(0.2)
+            with lock:
+                counts[key] = counts.get(key, 0) + 1
+
+
+def run(args, governed):
+    server = FakeBinanceServer(limit=args.limit, window=args.window, ban_after=args.ban_after,
+                               ban_seconds=args.ban_seconds, latency=args.latency).start()
+    governor = WeightGovernor(limit=args.limit, window=args.window) if governed else None
+
+    def make_client():
+        client = HttpExchangeClient(server.url)
+        return GovernedClient(client, governor) if governor else client
+
+    samples, counts, lock = [], {}, threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=backfill_worker, args=(make_client(), deadline, counts, lock))
+               for _ in range(args.backfill_workers)]
+    threads += [threading.Thread(target=interactive_session,
+                                 args=(make_client(), deadline, args.think_time, samples, lock))
+                for _ in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.stop()
+
+    ok = [elapsed for outcome, elapsed in samples if outcome == 'ok']
+    p50, p95 = np.percentile(ok, [50, 95]) if ok else (0.0, 0.0)
+    return {
+        'mode': 'governed' if governed else 'ungoverned',
+        'interactive_requests': len(samples),
+        'interactive_ok_rate': round(len(ok) / len(samples), 4) if samples else 0.0,
+        'interactive_outcomes': {name: sum(1 for outcome, _ in samples if outcome == name)
+                                 for name in ('ok', 'rejected', 'rate_limited', 'banned')},
+        'interactive_p50_ms': round(float(p50) * 1000, 1),
+        'interactive_p95_ms': round(float(p95) * 1000, 1),
+        'backfill': counts,
+        'server_statuses': {str(status): count for status, count in sorted(server.statuses.items())},
+        'governor': governor.stats() if governor else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交易所请求权重调度基准')
+    parser.add_argument('--limit', type=int, default=600, help='模拟交易所每个窗口的权重上限')
+    parser.add_argument('--window', type=float, default=10.0, help='权重统计窗口（秒），缩短以便快速复现')
+    parser.add_argument('--ban-after', type=int, default=3)
+    parser.add_argument('--ban-seconds', type=float, default=10.0)
+    parser.add_argument('--latency', type=float, default=0.01, help='模拟交易所每次请求的延迟（秒）')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--sessions', type=int, default=4, help='交互会话数')
+    parser.add_argument('--think-time', type=float, default=2.0, help='交互会话两次查询之间的间隔（秒）')
+    parser.add_argument('--backfill-workers', type=int, default=2)
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    rows = [run(args, governed=False), run(args, governed=True)]
+    print(f"权重上限 {args.limit}/{args.window:g}s，{args.sessions} 个交互会话，{args.backfill_workers} 个补齐线程，"
+          f"运行 {args.duration:g}s")
+    print('| 模式 | 交互请求 | 成功率 | 被拒绝 | 429 | 418 | P50(ms) | P95(ms) | 补齐批次 | 交易所状态码 |')
+    print('|------|------|------|------|------|------|------|------|------|------|')
+    for row in rows:
+        outcomes = row['interactive_outcomes']
+        print(f"| {row['mode']} | {row['interactive_requests']} | {row['interactive_ok_rate']:.1%} | "
+              f"{outcomes['rejected']} | {outcomes['rate_limited']} | {outcomes['banned']} | "
+              f"{row['interactive_p50_ms']} | {row['interactive_p95_ms']} | {row['backfill'].get('batches', 0)} | "
+              f"{row['server_statuses']} |")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
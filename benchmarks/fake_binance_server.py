@@ -0,0 +1,257 @@
+"""
+本地模拟的 Binance REST 服务，按窗口统计请求权重并执行限流：
+超出上限返回 429（带 Retry-After），429 之后仍继续请求达到 ban_after 次则返回 418 并封禁 ban_seconds 秒，
+每个响应都带 X-MBX-USED-WEIGHT-1M 头。行情数据由 FakeClient 生成
+outage 用于模拟交易所故障：'error' 立即返回 503，'stall' 挂起 stall_seconds 秒后返回 504
+
+HttpExchangeClient 通过 HTTP 访问该服务，方法名、参数、client.response 和异常的 status_code / response
+与 python-binance 相同，可以直接交给 GovernedClient 或 set_client() 使用；
+异步工具设置 BTC_BINANCE_API 为服务地址后也会直接请求它
+
+用法:
+    python benchmarks/fake_binance_server.py --port 8765 --limit 1200 --window 60
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+
+# 与 Binance 现货 REST 接口文档一致的权重
+PATH_WEIGHTS = {'/api/v3/klines': 2, '/api/v3/ping': 1, '/api/v3/time': 1}
+
+
+def request_weight(path, query):
+    if path == '/api/v3/depth':
+        limit = int(query.get('limit', 100))
+        return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+    if path == '/api/v3/ticker/24hr':
+        return 2 if query.get('symbol') else 80
+    return PATH_WEIGHTS.get(path, 2)
+
+
+class FakeBinanceServer:
+    """限流状态和行情数据，HTTP 处理由 _Handler 完成"""
+
+    def __init__(self, limit=1200, window=60.0, ban_after=3, ban_seconds=30.0, latency=0.0, seed=7):
+        self.limit = limit
+        self.window = window
+        self.ban_after = ban_after
+        self.ban_seconds = ban_seconds
+        self.latency = latency
+        self.exchange = FakeClient(seed=seed)
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._used = 0
+        self._violations = 0
+        self._banned_until = 0.0
+        self.statuses = {}
+        self.outage = None
+        self.stall_seconds = 30.0
+        self.httpd = None
+
+    def admit(self, weight):
+        """返回 (状态码, 已用权重, Retry-After)"""
+        with self._lock:
+            now = time.time()
+            window_start = now - now % self.window
+            if window_start != self._window_start:
+                self._window_start = window_start
+                self._used = 0
+                self._violations = 0
+            if now < self._banned_until:
+                status, retry_after = 418, self._banned_until - now
+            elif self._used + weight > self.limit:
+                self._violations += 1
+                if self._violations > self.ban_after:
+                    self._banned_until = now + self.ban_seconds
+                    status, retry_after = 418, self.ban_seconds
+                else:
+                    status, retry_after = 429, window_start + self.window - now
+            else:
+                self._used += weight
+                status, retry_after = 200, None
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            return status, self._used, retry_after
+
+    def respond(self, path, query):
+        if path == '/api/v3/klines':
+            return self.exchange.get_klines(
+                symbol=query['symbol'], interval=query['interval'], limit=int(query.get('limit', 500)),
+                startTime=int(query['startTime']) if 'startTime' in query else None,
+                endTime=int(query['endTime']) if 'endTime' in query else None)
+        if path == '/api/v3/ticker/24hr':
+            return self.exchange.get_ticker(symbol=query.get('symbol', 'BTCUSDT'))
+        if path == '/api/v3/depth':
+            return self.exchange.get_order_book(symbol=query['symbol'], limit=int(query.get('limit', 100)))
+        if path == '/api/v3/time':
+            return self.exchange.get_server_time()
+        if path == '/api/v3/ping':
+            return {}
+        return None
+
+    def start(self, host='127.0.0.1', port=0):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='fake-binance', daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        outage = self.fake.outage
+        if outage:
+            if outage == 'stall':
+                time.sleep(self.fake.stall_seconds)
+            status, used, retry_after = (504 if outage == 'stall' else 503), 0, None
+            data = {'code': -1001, 'msg': 'Internal error; unable to process your request. Please try again.'}
+        else:
+            status, used, retry_after = self.fake.admit(request_weight(parsed.path, query))
+            data = self.limited_response(status)
+        if status == 200:
+            if self.fake.latency:
+                time.sleep(self.fake.latency)
+            data = self.fake.respond(parsed.path, query)
+            if data is None:
+                status, data = 404, {'code': -1100, 'msg': 'Unknown path'}
+        body = json.dumps(data).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+            if retry_after is not None:
+                self.send_header('Retry-After', str(max(int(retry_after + 0.999), 1)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已超时断开
+            pass
+
+    def limited_response(self, status):
+        if status == 429:
+            return {'code': -1003, 'msg': 'Too many requests; current limit is %d request weight per window.'
+                    % self.fake.limit}
+        if status == 418:
+            return {'code': -1003, 'msg': 'Way too many requests; IP banned.'}
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Response:
+    """与 requests.Response 相同的 status_code / headers 属性"""
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class HttpAPIError(Exception):
+    """与 BinanceAPIException 相同：消息为 APIError(code=...)，带 status_code 和 response"""
+
+    def __init__(self, response, code, message):
+        super().__init__(f'APIError(code={code}): {message}')
+        self.status_code = response.status_code
+        self.response = response
+
+
+class HttpExchangeClient:
+    """通过 HTTP 访问 FakeBinanceServer 的客户端，接口与 binance.Client 相同"""
+
+    def __init__(self, base_url, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.response = None
+
+    def _get(self, path, **params):
+        query = urllib.parse.urlencode({key: value for key, value in params.items() if value is not None})
+        try:
+            with urllib.request.urlopen(f'{self.base_url}{path}?{query}', timeout=self.timeout) as resp:
+                self.response = _Response(resp.status, resp.headers)
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            self.response = _Response(e.code, e.headers)
+            data = json.loads(e.read() or b'{}')
+            raise HttpAPIError(self.response, data.get('code'), data.get('msg')) from None
+
+    def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None):
+        return self._get('/api/v3/klines', symbol=symbol, interval=interval, limit=limit,
+                         startTime=startTime, endTime=endTime)
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=1000):
+        from btc_weight_governor import _to_ms
+
+        # 与 python-binance 一样先请求一次最早的有效时间
+        self.get_klines(symbol=symbol, interval=interval, limit=1, startTime=0)
+        return self.get_klines(symbol=symbol, interval=interval, limit=limit,
+                               startTime=_to_ms(start_str), endTime=_to_ms(end_str) if end_str else None)
+
+    def get_ticker(self, symbol=None):
+        return self._get('/api/v3/ticker/24hr', symbol=symbol)
+
+    def get_order_book(self, symbol, limit=100):
+        return self._get('/api/v3/depth', symbol=symbol, limit=limit)
+
+    def get_server_time(self):
+        return self._get('/api/v3/time')
+
+    def ping(self):
+        return self._get('/api/v3/ping')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 Binance REST 服务（带请求权重限流）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--limit', type=int, default=1200, help='每个窗口的权重上限')
+    parser.add_argument('--window', type=float, default=60.0, help='权重统计窗口（秒）')
+    parser.add_argument('--ban-after', type=int, default=3, help='429 之后继续请求多少次返回 418')
+    parser.add_argument('--ban-seconds', type=float, default=30.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--outage', choices=('error', 'stall'), help='模拟交易所故障')
+    args = parser.parse_args()
+
+    server = FakeBinanceServer(limit=args.limit, window=args.window, ban_after=args.ban_after,
+                               ban_seconds=args.ban_seconds, latency=args.latency).start(args.host, args.port)
+    server.outage = args.outage
+    print(f"模拟交易所已启动: {server.url}（BTC_BINANCE_API={server.url}）")
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print(f"响应状态统计: {server.statuses}")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+离线的 Binance 客户端替身
+接口与 binance.Client 中用到的方法一致（get_klines、get_historical_klines、get_ticker、get_order_book），
+K线由 (交易对, 周期, 开盘时间) 确定性生成，同一根K线无论何时、以何种方式请求都相同，
+不需要网络即可运行各工具和基准测试：
+
+    from btc_exchange import set_client
+    set_client(FakeClient())
+"""
+import os
+import sys
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from btc_candle_ring import INTERVAL_MS  # noqa: E402
+
+
+def _to_ms(value):
+    """把毫秒时间戳或 'YYYY-MM-DD' 形式的日期字符串转换为 UTC 毫秒"""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(text, fmt)
+            return int(parsed.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析的时间: {value}")
+
+
+def _hash_noise(index, salt):
+    """由整数序号得到 [0, 1) 的确定性伪随机数"""
+    x = np.sin(index.astype(np.float64) * 12.9898 + salt * 78.233) * 43758.5453
+    return x - np.floor(x)
+
+
+class FakeClient:
+    """
+    确定性的离线交易所客户端
+    latency: 每次调用额外等待的秒数，用于模拟网络延迟
+    now_ms: 固定的当前时间，默认使用系统时间
+    """
+
+    def __init__(self, seed=7, base_price=30000.0, latency=0.0, now_ms=None):
+        self.seed = seed
+        self.base_price = base_price
+        self.latency = latency
+        self.now_ms = now_ms
+        # 每个接口的调用次数
+        self.calls = Counter()
+
+    def _now(self):
+        return self.now_ms if self.now_ms is not None else int(time.time() * 1000)
+
+    def _call(self, endpoint):
+        self.calls[endpoint] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _salt(self, symbol):
+        return (zlib.crc32(symbol.upper().encode()) % 1000) + self.seed
+
+    def _price(self, symbol, minutes):
+        """以分钟序号为自变量的价格曲线，各周期的K线都从同一条曲线取值，彼此一致"""
+        salt = self._salt(symbol)
+        t = minutes.astype(np.float64)
+        trend = 0.15 * np.sin(2 * np.pi * t / (90 * 1440) + salt) + 0.04 * np.sin(2 * np.pi * t / (7 * 1440) + salt)
+        noise = 0.004 * (_hash_noise(minutes, salt) - 0.5)
+        return self.base_price * np.exp(trend + noise)
+
+    def _make_klines(self, symbol, interval, open_times):
+        step = INTERVAL_MS[interval]
+        now_ms = self._now()
+        open_times = np.asarray(open_times, dtype=np.int64)
+        close_times = open_times + step - 1
+        # 未收盘K线的收盘价取当前时间的价格
+        last_minute = np.minimum(close_times, now_ms) // 60_000
+        open_price = self._price(symbol, open_times // 60_000)
+        close_price = self._price(symbol, last_minute)
+        salt = self._salt(symbol)
+        spread = 1 + 0.004 * _hash_noise(open_times // 60_000, salt + 1)
+        high = np.maximum(open_price, close_price) * spread
+        low = np.minimum(open_price, close_price) / spread
+        volume = (10 + 90 * _hash_noise(open_times // 60_000, salt + 2)) * (step / 60_000) ** 0.5
+        klines = []
+        for i in range(len(open_times)):
+            klines.append([
+                int(open_times[i]), f'{open_price[i]:.2f}', f'{high[i]:.2f}', f'{low[i]:.2f}',
+                f'{close_price[i]:.2f}', f'{volume[i]:.5f}', int(close_times[i]),
+                f'{volume[i] * close_price[i]:.5f}', int(volume[i] * 10), f'{volume[i] / 2:.5f}',
+                f'{volume[i] * close_price[i] / 2:.5f}', '0'
+            ])
+        return klines
+
+    def _range(self, interval, start_ms, end_ms, limit):
+        """计算 [start_ms, end_ms] 内最多 limit 根K线的开盘时间，不超过当前时间"""
+        step = INTERVAL_MS[interval]
+        now_ms = self._now()
+        end_ms = now_ms if end_ms is None else min(end_ms, now_ms)
+        last = end_ms - end_ms % step
+        if start_ms is None:
+            first = last - (limit - 1) * step
+        else:
+            first = start_ms + (-start_ms) % step
+            last = min(last, first + (limit - 1) * step)
+        if last < first:
+            return np.empty(0, dtype=np.int64)
+        return np.arange(first, last + 1, step, dtype=np.int64)
+
+    # ---------- 与 binance.Client 相同的接口 ----------
+    def ping(self):
+        self._call('ping')
+        return {}
+
+    def get_server_time(self):
+        self._call('get_server_time')
+        return {'serverTime': self._now()}
+
+    def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None, **kwargs):
+        self._call('get_klines')
+        open_times = self._range(interval, startTime, endTime, min(int(limit), 1000))
+        return self._make_klines(symbol, interval, open_times)
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=1000, **kwargs):
+        """与 python-binance 相同：end_str 为日期时包含当天开盘的K线"""
+        self._call('get_historical_klines')
+        start_ms = _to_ms(start_str)
+        end_ms = _to_ms(end_str)
+        if start_ms is None:
+            return self._make_klines(symbol, interval, self._range(interval, None, end_ms, limit))
+        step = INTERVAL_MS[interval]
+        now_ms = self._now()
+        end_ms = now_ms if end_ms is None else min(end_ms, now_ms)
+        first = start_ms + (-start_ms) % step
+        if end_ms < first:
+            return []
+        return self._make_klines(symbol, interval, np.arange(first, end_ms - end_ms % step + 1, step, dtype=np.int64))
+
+    def get_ticker(self, symbol, **kwargs):
+        self._call('get_ticker')
+        now_ms = self._now()
+        minutes = np.arange(now_ms // 60_000 - 1440, now_ms // 60_000 + 1, dtype=np.int64)
+        prices = self._price(symbol, minutes)
+        last, first = float(prices[-1]), float(prices[0])
+        volume = float(np.sum(10 + 90 * _hash_noise(minutes, self._salt(symbol) + 2)))
+        return {
+            'symbol': symbol.upper(),
+            'lastPrice': f'{last:.2f}',
+            'priceChange': f'{last - first:.2f}',
+            'priceChangePercent': f'{(last / first - 1) * 100:.3f}',
+            'highPrice': f'{float(prices.max()):.2f}',
+            'lowPrice': f'{float(prices.min()):.2f}',
+            'volume': f'{volume:.5f}',
+        }
+
+    def get_order_book(self, symbol, limit=100, **kwargs):
+        self._call('get_order_book')
+        now_ms = self._now()
+        mid = float(self._price(symbol, np.array([now_ms // 60_000]))[0])
+        levels = range(1, int(limit) + 1)
+        return {
+            'lastUpdateId': now_ms,
+            'bids': [[f'{mid - 0.01 * i:.2f}', f'{0.5 * i:.5f}'] for i in levels],
+            'asks': [[f'{mid + 0.01 * i:.2f}', f'{0.5 * i:.5f}'] for i in levels],
+        }
+
+
+class FakeDepthStream:
+    """
+    确定性的增量深度流：维护一份参考盘口（中间价不变，买卖盘各 levels 档，间隔 tick），
+    next_event() 随机修改、删除或新增靠近盘口的若干档，产生序号连续的 depthUpdate 事件，
+    snapshot() 返回参考盘口当前的 get_order_book 格式快照，用于初始化和校验本地盘口
+    """
+
+    def __init__(self, symbol='BTCUSDT', seed=7, mid=30000.0, levels=1000, tick=0.5, first_update_id=1000):
+        self.symbol = symbol
+        self.mid = mid
+        self.levels = levels
+        self.tick = tick
+        self.update_id = first_update_id
+        self.rng = np.random.default_rng(seed)
+        # 距中间价的档数 -> 数量
+        self.bids = {i: round(float(self.rng.uniform(0.01, 5)), 5) for i in range(1, levels + 1)}
+        self.asks = {i: round(float(self.rng.uniform(0.01, 5)), 5) for i in range(1, levels + 1)}
+
+    def _price(self, name, offset):
+        return f'{self.mid - self.tick * offset:.2f}' if name == 'b' else f'{self.mid + self.tick * offset:.2f}'
+
+    def next_event(self):
+        changes = {'b': {}, 'a': {}}
+        for _ in range(int(self.rng.integers(1, 8))):
+            name = 'b' if self.rng.random() < 0.5 else 'a'
+            side = self.bids if name == 'b' else self.asks
+            # 大多数变化发生在盘口附近，偶尔在深处新增档位
+            offset = int(min(self.rng.geometric(0.05), self.levels * 1.2))
+            quantity = 0.0 if self.rng.random() < 0.3 and len(side) > 1 else round(float(self.rng.uniform(0.01, 5)), 5)
+            if quantity:
+                side[offset] = quantity
+            else:
+                side.pop(offset, None)
+            changes[name][offset] = quantity
+        first = self.update_id + 1
+        self.update_id += sum(len(items) for items in changes.values())
+        return {
+            'e': 'depthUpdate', 'E': int(time.time() * 1000), 's': self.symbol, 'U': first, 'u': self.update_id,
+            'b': [[self._price('b', offset), f'{quantity:.5f}'] for offset, quantity in changes['b'].items()],
+            'a': [[self._price('a', offset), f'{quantity:.5f}'] for offset, quantity in changes['a'].items()],
+        }
+
+    def snapshot(self, limit=None):
+        bids = sorted(self.bids.items())[:limit]
+        asks = sorted(self.asks.items())[:limit]
+        return {
+            'lastUpdateId': self.update_id,
+            'bids': [[self._price('b', offset), f'{quantity:.5f}'] for offset, quantity in bids],
+            'asks': [[self._price('a', offset), f'{quantity:.5f}'] for offset, quantity in asks],
+        }
@@ -0,0 +1,98 @@
+"""
+基准测试用的确定性合成K线数据
+同样的参数总是生成同样的数据，不同版本之间的基准结果可以直接对比
+"""
+import numpy as np
+
+DEFAULT_START_MS = 1_600_000_000_000
+DEFAULT_INTERVAL_MS = 3_600_000
+
+
+def make_ohlcv(n, start_ms=DEFAULT_START_MS, interval_ms=DEFAULT_INTERVAL_MS, seed=7, base_price=30000.0):
+    """生成 n 根K线的 OHLCV 列 {'open_time', 'open', 'high', 'low', 'close', 'volume'}，价格为几何随机游走"""
+    rng = np.random.default_rng(seed)
+    close = base_price * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([close[0]], close[:-1])) if n else close
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.003, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.003, n))
+    volume = rng.uniform(1, 100, n)
+    return {
+        'open_time': start_ms + np.arange(n, dtype=np.int64) * interval_ms,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+    }
+
+
+def ohlcv_to_klines(ohlcv, interval_ms=DEFAULT_INTERVAL_MS):
+    """把 OHLCV 列转换为与交易所返回格式一致的原始K线（价格、成交量为字符串）"""
+    klines = []
+    for open_time, open_, high, low, close, volume in zip(
+            ohlcv['open_time'].tolist(), ohlcv['open'].tolist(), ohlcv['high'].tolist(),
+            ohlcv['low'].tolist(), ohlcv['close'].tolist(), ohlcv['volume'].tolist()):
+        klines.append([
+            open_time, f'{open_:.2f}', f'{high:.2f}', f'{low:.2f}', f'{close:.2f}',
+            f'{volume:.5f}', open_time + interval_ms - 1, f'{volume * close:.5f}',
+            int(volume * 10), f'{volume / 2:.5f}', f'{volume * close / 2:.5f}', '0'
+        ])
+    return klines
+
+
+def make_raw_klines(n, start_ms=DEFAULT_START_MS, interval_ms=60_000, seed=7):
+    """生成 n 根原始K线"""
+    return ohlcv_to_klines(make_ohlcv(n, start_ms, interval_ms, seed), interval_ms)
+
+
+def make_frame(n, time_column='时间', start_ms=DEFAULT_START_MS, interval_ms=DEFAULT_INTERVAL_MS, seed=7):
+    """生成与 klines_to_frame 列名一致的 DataFrame，供技术指标、策略和绘图使用"""
+    import pandas as pd
+
+    ohlcv = make_ohlcv(n, start_ms, interval_ms, seed)
+    return pd.DataFrame({
+        time_column: pd.to_datetime(ohlcv['open_time'], unit='ms'),
+        '开盘价': ohlcv['open'],
+        '最高价': ohlcv['high'],
+        '最低价': ohlcv['low'],
+        '收盘价': ohlcv['close'],
+        '成交量': ohlcv['volume'],
+    })
+
+
+def make_real_time_data(frame, symbol='BTCUSDT'):
+    """根据K线构造 fetch_real_time_price 格式的实时行情"""
+    from datetime import datetime
+
+    last = frame.iloc[-1]
+    window = frame.tail(24)
+    current = float(last['收盘价'])
+    first = float(window['开盘价'].iloc[0])
+    return {
+        'symbol': symbol,
+        'current_price': current,
+        'bid_price': round(current - 0.01, 2),
+        'ask_price': round(current + 0.01, 2),
+        'bid_quantity': 1.0,
+        'ask_quantity': 1.0,
+        'price_change_24h': current - first,
+        'price_change_percent_24h': (current / first - 1) * 100,
+        'high_price_24h': float(window['最高价'].max()),
+        'low_price_24h': float(window['最低价'].min()),
+        'volume_24h': float(window['成交量'].sum()),
+        'last_trade_time': datetime.now(),
+    }
+
+
+def seed_kline_table(engine, client, days, end_date=None, symbol='BTCUSDT', table='btc_usdt_kline'):
+    """用客户端返回的日线填充K线表（列与 ExcSQLTool 入库时一致），覆盖 end_date 之前的 days 天"""
+    from datetime import date, timedelta
+
+    from btc_klines import klines_to_frame
+
+    end_date = end_date or date.today()
+    start = (end_date - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    klines = client.get_historical_klines(symbol, '1d', start, end_date.strftime('%Y-%m-%d'))
+    frame = klines_to_frame(klines, time_column='开盘时间', date_column='日期', close_time_column='收盘时间')
+    frame.to_sql(table, engine, if_exists='replace', index=False)
+    return len(frame)
@@ -0,0 +1,345 @@
+"""
+并发会话压测：模拟 N 个聊天会话按一定比例调用 exc_sql、arima_stock、get_real_time_price，
+直接调用工具类（不经过大模型），交易所使用 FakeClient（或录制文件回放），数据库使用临时 SQLite
+并发数逐级增加，每一级输出吞吐量、P50/P95/P99 延迟和错误率，用于评估 WebUI 能支撑的并发用户数
+
+--processes N 模拟多 worker 部署：每一级的会话分给 N 个进程，每个进程有自己的工具实例和交易所客户端，
+缓存后端由 --cache-backend 指定（memory 为各进程独立的内存缓存，sqlite 为共享的 SQLite 文件，
+resp 为启动一个 Redis 协议替身服务），每一级额外输出交易所调用次数（每次请求平均）和缓存后端命中率，
+用于验证 worker 增加后缓存效果是否保持
+
+用法:
+    python benchmarks/load_test.py --levels 1,2,4,8 --duration 30
+    python benchmarks/load_test.py --levels 8 --processes 4 --cache-backend sqlite
+    python benchmarks/load_test.py --mix exc_sql=1,get_real_time_price=3 --exchange-latency 0.08 --output load.json
+    python benchmarks/load_test.py --session exchange_sessions/demo.jsonl.gz --jitter 0.02
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+from fixtures import seed_kline_table  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_DIR = os.path.join(REPO_DIR, 'btc_images')
+
+# 默认调用比例：实时价格最常用，其次是SQL查询和预测
+DEFAULT_MIX = {'exc_sql': 3, 'arima_stock': 2, 'get_real_time_price': 5}
+
+SQL_QUERIES = (
+    "SELECT 日期, 收盘价 FROM btc_usdt_kline ORDER BY 日期 DESC LIMIT 30",
+    "SELECT 日期, 开盘价, 最高价, 最低价, 收盘价, 成交量 FROM btc_usdt_kline ORDER BY 日期 DESC LIMIT 90",
+    "SELECT MAX(最高价) AS 最高价, MIN(最低价) AS 最低价 FROM btc_usdt_kline",
+    "SELECT 日期, 成交量 FROM btc_usdt_kline ORDER BY 日期 DESC LIMIT 180",
+)
+
+# 工具出错时返回的文本开头（工具内部捕获异常后返回错误描述，而不是抛出）
+ERROR_PREFIXES = (
+    'SQL执行或可视化出错', '获取历史数据或构建预测模型失败', '预测模型构建失败', '警告: 获取的历史数据不足',
+    '获取实时价格数据时发生错误', '获取实时价格数据失败', '获取实时价格时数据结构错误', '获取实时价格失败',
+    '交易对符号错误', '网络连接错误',
+)
+# 返回了结果但部分内容缺失（如图表生成失败）
+DEGRADED_MARKERS = ('*注:',)
+
+
+def make_params(tool, rng):
+    """按工具生成一次调用的参数"""
+    if tool == 'exc_sql':
+        return {'sql_input': rng.choice(SQL_QUERIES)}
+    if tool == 'arima_stock':
+        return {'b_code': 'BTC', 'n': rng.choice((7, 14))}
+    return {'symbol': 'BTCUSDT'}
+
+
+def classify(result):
+    if not isinstance(result, str):
+        return 'error'
+    if result.startswith(ERROR_PREFIXES):
+        return 'error'
+    if any(marker in result for marker in DEGRADED_MARKERS):
+        return 'degraded'
+    return 'ok'
+
+
+def create_tools():
+    import btc_analysis_agent_qwen_trub as agent
+
+    sql_tool = agent.ExcSQLTool()
+    # 只有首次调用会补齐数据，压测时不等待交易所限速
+    sql_tool.fetch_delay = 0
+    # 与 WebUI 一样，所有会话共用同一组工具实例
+    return {
+        'exc_sql': sql_tool,
+        'arima_stock': agent.ARIMATool(),
+        'get_real_time_price': agent.GetRealTimePriceTool(),
+    }
+
+
+def session_worker(index, tools, mix, deadline, think_time, seed, samples, lock):
+    rng = random.Random(seed * 1000 + index)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        tool = rng.choices(names, weights)[0]
+        params = json.dumps(make_params(tool, rng), ensure_ascii=False)
+        started = time.perf_counter()
+        try:
+            outcome = classify(tools[tool].call(params))
+            error = None
+        except Exception as e:
+            outcome, error = 'error', f'{type(e).__name__}: {str(e)}'
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.append((tool, elapsed, outcome, error))
+        if think_time:
+            # 用户阅读回答后再提问的间隔
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def run_level(tools, sessions, duration, mix, think_time, seed):
+    """以 sessions 中编号的并发会话运行 duration 秒，返回 (样本列表, 实际耗时)"""
+    samples, lock = [], threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=session_worker, name=f'session-{i}',
+                         args=(i, tools, mix, deadline, think_time, seed, samples, lock))
+        for i in sessions
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def exchange_calls(client):
+    calls = getattr(client, 'calls', None)
+    return sum(calls.values()) if calls is not None else None
+
+
+def run_process(sessions, args, mix, barrier, results):
+    """压测子进程（一个 worker）：创建自己的交易所客户端和工具实例，所有进程就绪后运行分到的会话"""
+    from btc_cache_backend import get_cache_backend
+    from btc_exchange import set_client
+    from btc_singleflight import tool_flight
+
+    tool_flight.enabled = not args.no_single_flight
+    client = create_exchange(args)
+    set_client(client)
+    tools = create_tools()
+    backend = get_cache_backend()
+    barrier.wait()
+    samples, elapsed = run_level(tools, sessions, args.duration, mix, args.think_time, args.seed)
+    results.put({'samples': samples, 'elapsed': elapsed, 'exchange_calls': exchange_calls(client),
+                 'cache': dict(backend.stats), 'single_flight': tool_flight.stats()})
+
+
+def run_level_processes(concurrency, processes, args, mix):
+    """把 concurrency 个会话轮流分给 processes 个子进程运行，返回 (样本列表, 耗时, 交易所调用次数, 缓存统计, 合并统计)"""
+    context = multiprocessing.get_context('spawn')
+    processes = max(1, min(processes, concurrency))
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [context.Process(target=run_process, name=f'worker-{i}',
+                               args=(range(i, concurrency, processes), args, mix, barrier, results))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    parts = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    samples = [sample for part in parts for sample in part['samples']]
+    calls = [part['exchange_calls'] for part in parts]
+    cache, single_flight = {}, {}
+    for part in parts:
+        for name, value in part['cache'].items():
+            cache[name] = cache.get(name, 0) + value
+        for tool, stats in part['single_flight'].items():
+            merged = single_flight.setdefault(tool, {})
+            for name, value in stats.items():
+                merged[name] = merged.get(name, 0) + value
+    return (samples, max(part['elapsed'] for part in parts), None if None in calls else sum(calls),
+            cache, single_flight)
+
+
+def cache_backend_spec(name, workdir):
+    """--cache-backend 对应的 BTC_CACHE_BACKEND，resp 时启动 Redis 协议替身服务，返回 (配置, 替身服务)"""
+    if name == 'sqlite':
+        return f"sqlite:///{os.path.join(workdir, 'cache.db')}", None
+    if name == 'resp':
+        from btc_cache_backend import RespStandIn
+
+        server = RespStandIn(port=0).start()
+        return server.url, server
+    return name, None
+
+
+def summarize(samples, elapsed):
+    """按工具和总体统计吞吐量、延迟分位数和错误率"""
+    groups = {'all': samples}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    summary = {}
+    for name, items in groups.items():
+        latencies = np.array([item[1] for item in items]) if items else np.zeros(1)
+        errors = sum(item[2] == 'error' for item in items)
+        degraded = sum(item[2] == 'degraded' for item in items)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[name] = {
+            'requests': len(items),
+            'throughput_rps': round(len(items) / elapsed, 3) if elapsed else 0.0,
+            'p50_ms': round(float(p50) * 1000, 1),
+            'p95_ms': round(float(p95) * 1000, 1),
+            'p99_ms': round(float(p99) * 1000, 1),
+            'max_ms': round(float(latencies.max()) * 1000, 1),
+            'error_rate': round(errors / len(items), 4) if items else 0.0,
+            'degraded_rate': round(degraded / len(items), 4) if items else 0.0,
+        }
+    return summary
+
+
+def sample_errors(samples, limit=5):
+    """出现次数最多的异常信息"""
+    counts = {}
+    for _, _, outcome, error in samples:
+        if error:
+            counts[error] = counts.get(error, 0) + 1
+    return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def create_exchange(args):
+    if args.session:
+        from btc_replay import ReplayClient
+
+        return ReplayClient(args.session, latency=args.exchange_latency, jitter=args.jitter, seed=args.seed)
+    return FakeClient(seed=args.seed, latency=args.exchange_latency)
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"未知工具: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='工具并发会话压测')
+    parser.add_argument('--levels', default='1,2,4,8', help='逐级增加的并发会话数')
+    parser.add_argument('--duration', type=float, default=20.0, help='每一级的运行秒数')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help='工具调用比例，如 exc_sql=3,arima_stock=2,get_real_time_price=5')
+    parser.add_argument('--think-time', type=float, default=0.0, help='会话两次调用之间的平均间隔（秒）')
+    parser.add_argument('--exchange-latency', type=float, default=0.05, help='模拟的交易所接口延迟（秒）')
+    parser.add_argument('--session', help='使用录制文件回放交易所响应，而不是 FakeClient')
+    parser.add_argument('--jitter', type=float, default=0.0, help='回放时叠加的延迟抖动（秒）')
+    parser.add_argument('--history-days', type=int, default=365, help='SQLite 中预置的日线天数')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-single-flight', action='store_true', help='关闭相同并发调用的合并')
+    parser.add_argument('--processes', type=int, default=1, help='模拟的 worker 进程数，大于 1 时每一级的会话分给多个进程')
+    parser.add_argument('--cache-backend', default='memory',
+                        help='缓存后端：memory、sqlite（临时 SQLite 文件）、resp（Redis 协议替身服务）或 BTC_CACHE_BACKEND 格式')
+    parser.add_argument('--keep-images', action='store_true', help='保留压测过程中生成的图表')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    from btc_cache_backend import get_cache_backend
+    from btc_exchange import set_client
+    from btc_singleflight import tool_flight
+
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    workdir = tempfile.mkdtemp(prefix='btc_load_')
+    db_url = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ['BTC_DB_URL'] = db_url
+    # 子进程继承环境变量，使用同一个缓存后端
+    os.environ['BTC_CACHE_BACKEND'], cache_server = cache_backend_spec(args.cache_backend, workdir)
+    images_before = set(os.listdir(IMAGE_DIR)) if os.path.isdir(IMAGE_DIR) else set()
+
+    tool_flight.enabled = not args.no_single_flight
+    client = create_exchange(args)
+    if importlib.util.find_spec('sqlalchemy') is not None:
+        from sqlalchemy import create_engine
+
+        seed_kline_table(create_engine(db_url), FakeClient(seed=args.seed) if args.session else client,
+                         args.history_days)
+    elif mix.pop('exc_sql', None):
+        print('未安装 sqlalchemy，跳过 exc_sql')
+    set_client(client)
+    tools = create_tools()
+
+    report = {'levels': [], 'mix': mix, 'duration': args.duration, 'exchange_latency': args.exchange_latency,
+              'think_time': args.think_time, 'processes': args.processes, 'cache_backend': args.cache_backend}
+    try:
+        for concurrency in levels:
+            if args.processes > 1:
+                samples, elapsed, calls, cache, single_flight = run_level_processes(
+                    concurrency, args.processes, args, mix)
+            else:
+                tool_flight.reset_stats()
+                backend = get_cache_backend()
+                backend.reset_stats()
+                calls_before = exchange_calls(client)
+                samples, elapsed = run_level(tools, range(concurrency), args.duration, mix, args.think_time,
+                                             args.seed)
+                calls = None if calls_before is None else exchange_calls(client) - calls_before
+                cache, single_flight = dict(backend.stats), tool_flight.stats()
+            summary = summarize(samples, elapsed)
+            lookups = cache['hits'] + cache['misses']
+            report['levels'].append({'concurrency': concurrency, 'elapsed': round(elapsed, 2),
+                                     'summary': summary, 'top_errors': sample_errors(samples),
+                                     'single_flight': single_flight, 'exchange_calls': calls,
+                                     'cache': {**cache, 'hit_rate': round(cache['hits'] / lookups, 4) if lookups else 0.0}})
+            total = summary['all']
+            per_request = f"{calls / total['requests']:.2f}" if calls is not None and total['requests'] else '-'
+            print(f"并发 {concurrency}: {total['requests']} 次请求, {total['throughput_rps']} 次/秒, "
+                  f"P50 {total['p50_ms']} ms, P95 {total['p95_ms']} ms, P99 {total['p99_ms']} ms, "
+                  f"错误率 {total['error_rate']:.1%}, 交易所调用 {calls if calls is not None else '-'} 次"
+                  f"（每次请求 {per_request}），缓存命中率 {report['levels'][-1]['cache']['hit_rate']:.1%}")
+    finally:
+        set_client(None)
+        if cache_server is not None:
+            cache_server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if not args.keep_images and os.path.isdir(IMAGE_DIR):
+            for name in set(os.listdir(IMAGE_DIR)) - images_before:
+                os.remove(os.path.join(IMAGE_DIR, name))
+
+    print('\n| 并发 | 工具 | 请求数 | 吞吐(次/秒) | P50(ms) | P95(ms) | P99(ms) | 错误率 | 降级率 |')
+    print('|------|------|------|------|------|------|------|------|------|')
+    for level in report['levels']:
+        for name, item in level['summary'].items():
+            print(f"| {level['concurrency']} | {name} | {item['requests']} | {item['throughput_rps']} | "
+                  f"{item['p50_ms']} | {item['p95_ms']} | {item['p99_ms']} | "
+                  f"{item['error_rate']:.1%} | {item['degraded_rate']:.1%} |")
+        for error, count in level['top_errors']:
+            print(f"  并发 {level['concurrency']} 异常 x{count}: {error}")
+        for name, item in level['single_flight'].items():
+            print(f"  并发 {level['concurrency']} {name}: 实际执行 {item['executed']} 次，合并 {item['collapsed']} 次")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+离线基准测试套件：覆盖K线解析、技术指标、ADX/ATR、交易策略、ARIMA 拟合、图表绘制和数据入库等热点路径
+所有数据来自确定性的合成K线（fixtures），交易所替换为 FakeClient，数据库使用临时 SQLite，不需要网络
+
+用法:
+    python benchmarks/run_benchmarks.py --sizes 100,1000,10000 --output benchmarks/results/current.json
+    python benchmarks/run_benchmarks.py --cases kline_parse,indicators_numpy --sizes 100,1000,10000,100000,1000000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json --threshold 0.2
+
+每个用例有默认的最大规模（逐行循环的旧实现在百万根K线上需要数小时），用 --no-limit 取消限制
+--compare 时与基线结果逐项对比，耗时增加超过阈值的用例视为回退，退出码为 1
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeClient  # noqa: E402
+from fixtures import make_frame, make_ohlcv, make_raw_klines, make_real_time_data, seed_kline_table  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (100, 1_000, 10_000)
+# 单个用例累计耗时超过该秒数后不再重复
+TIME_BUDGET = 5.0
+
+
+class Case:
+    """
+    基准用例
+    prepare(n, workdir) 返回一个无参函数，计时只包含该函数的执行
+    fresh 为 True 时每次重复前都重新 prepare（如需要重置数据库的入库用例）
+    """
+
+    def __init__(self, prepare, max_size, requires=(), fresh=False, description=''):
+        self.prepare = prepare
+        self.max_size = max_size
+        self.requires = tuple(requires)
+        self.fresh = fresh
+        self.description = description
+
+
+def _agent_module():
+    import btc_analysis_agent_qwen_trub
+
+    return btc_analysis_agent_qwen_trub
+
+
+def prepare_kline_parse(n, workdir):
+    from btc_klines import klines_to_frame
+
+    klines = make_raw_klines(n)
+    return lambda: klines_to_frame(klines, time_column='时间')
+
+
+def prepare_indicators_numpy(n, workdir):
+    from btc_indicators import compute_indicator_arrays
+
+    data = make_ohlcv(n)
+    return lambda: compute_indicator_arrays(data['close'], data['high'], data['low'], data['volume'])
+
+
+def prepare_technical_indicators(n, workdir):
+    tool = _agent_module().GetRealTimePriceTool()
+    frame = make_frame(n)
+    return lambda: tool.calculate_technical_indicators(frame.copy())
+
+
+def prepare_adx(n, workdir):
+    strategy = _agent_module().OptimizedTradingStrategy()
+    frame = make_frame(n)
+    return lambda: strategy.calculate_adx(frame)
+
+
+def prepare_atr(n, workdir):
+    strategy = _agent_module().OptimizedTradingStrategy()
+    frame = make_frame(n)
+    return lambda: strategy.calculate_atr(frame)
+
+
+def prepare_trading_strategy(n, workdir):
+    tool = _agent_module().GetRealTimePriceTool()
+    frame = tool.calculate_technical_indicators(make_frame(n))
+    real_time_data = make_real_time_data(frame)
+    return lambda: tool.analyze_trading_strategy(frame.copy(), real_time_data)
+
+
+def prepare_arima_fit(n, workdir):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    frame = make_frame(n, time_column='日期', interval_ms=86_400_000).set_index('日期')
+    close = frame['收盘价']
+
+    def run():
+        ARIMA(close, order=(5, 1, 0)).fit().forecast(steps=7)
+    return run
+
+
+def prepare_chart_render(n, workdir):
+    agent = _agent_module()
+    frame = make_frame(n, time_column='日期', interval_ms=86_400_000)[['日期', '收盘价', '成交量']]
+    save_path = os.path.join(workdir, 'chart.png')
+    return lambda: agent.generate_btc_chart(frame, save_path)
+
+
+def prepare_ingestion(n, workdir):
+    """数据库中缺少最近 n 天的日线，从 FakeClient 拉取并写入 SQLite"""
+    from sqlalchemy import create_engine
+
+    from btc_exchange import set_client
+
+    agent = _agent_module()
+    client = FakeClient()
+    set_client(client)
+    db_path = os.path.join(workdir, f'ingest_{n}.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_engine(f'sqlite:///{db_path}')
+    seed_kline_table(engine, client, 1, end_date=datetime.now().date() - timedelta(days=n))
+    tool = agent.ExcSQLTool()
+    tool.fetch_delay = 0
+    return lambda: tool.check_and_update_data(engine)
+
+
+CASES = {
+    'kline_parse': Case(prepare_kline_parse, 1_000_000, description='原始K线解析为 DataFrame'),
+    'indicators_numpy': Case(prepare_indicators_numpy, 1_000_000, description='btc_indicators 全部指标'),
+    'technical_indicators': Case(prepare_technical_indicators, 20_000, ('qwen_agent',),
+                                 description='GetRealTimePriceTool.calculate_technical_indicators'),
+    'adx': Case(prepare_adx, 1_000_000, ('qwen_agent',), description='OptimizedTradingStrategy.calculate_adx'),
+    'atr': Case(prepare_atr, 20_000, ('qwen_agent',), description='OptimizedTradingStrategy.calculate_atr'),
+    'trading_strategy': Case(prepare_trading_strategy, 20_000, ('qwen_agent',),
+                             description='analyze_trading_strategy'),
+    'arima_fit': Case(prepare_arima_fit, 10_000, ('statsmodels',), description='ARIMA(5,1,0) 拟合与预测'),
+    'chart_render': Case(prepare_chart_render, 100_000, ('qwen_agent', 'matplotlib'),
+                         description='generate_btc_chart'),
+    'ingestion': Case(prepare_ingestion, 10_000, ('qwen_agent', 'sqlalchemy'), fresh=True,
+                      description='ExcSQLTool.check_and_update_data（FakeClient + SQLite）'),
+}
+
+
+def missing_requirements(case):
+    import importlib.util
+
+    return [name for name in case.requires if importlib.util.find_spec(name) is None]
+
+
+def measure(case, n, repeat, workdir):
+    """返回每次执行的耗时列表，累计超过 TIME_BUDGET 后提前停止"""
+    run = case.prepare(n, workdir)
+    if not case.fresh:
+        # 预热一次，排除首次调用时的延迟导入
+        run()
+    timings = []
+    for i in range(repeat):
+        if case.fresh and i:
+            run = case.prepare(n, workdir)
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+        if sum(timings) > TIME_BUDGET:
+            break
+    return timings
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    versions = {}
+    for name in ('numpy', 'pandas', 'scipy', 'statsmodels', 'matplotlib', 'sqlalchemy'):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'packages': versions,
+    }
+
+
+def run(case_names, sizes, repeat, no_limit=False):
+    results, skipped = [], []
+    workdir = tempfile.mkdtemp(prefix='btc_bench_')
+    try:
+        for name in case_names:
+            case = CASES[name]
+            missing = missing_requirements(case)
+            if missing:
+                skipped.append({'case': name, 'reason': f"缺少依赖: {', '.join(missing)}"})
+                print(f"跳过 {name}: 缺少依赖 {', '.join(missing)}")
+                continue
+            for n in sizes:
+                if n > case.max_size and not no_limit:
+                    skipped.append({'case': name, 'candles': n, 'reason': f'超过默认最大规模 {case.max_size}'})
+                    continue
+                try:
+                    timings = measure(case, n, repeat, workdir)
+                except Exception as e:
+                    skipped.append({'case': name, 'candles': n, 'reason': f'执行出错: {str(e)}'})
+                    print(f"{name}[{n}] 执行出错: {str(e)}")
+                    continue
+                best = min(timings)
+                results.append({
+                    'case': name,
+                    'candles': n,
+                    'repeat': len(timings),
+                    'seconds_min': best,
+                    'seconds_median': statistics.median(timings),
+                    'candles_per_second': n / best if best > 0 else None,
+                })
+                print(f"{name}[{n}]: {best * 1000:.2f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'environment': environment(), 'results': results, 'skipped': skipped}
+
+
+def compare(baseline, current, threshold=0.2):
+    """逐项对比两份结果，返回 (表格行, 是否存在回退)"""
+    base = {(r['case'], r['candles']): r for r in baseline['results']}
+    rows, regressed = [], False
+    for result in current['results']:
+        key = (result['case'], result['candles'])
+        if key not in base:
+            continue
+        before = base[key]['seconds_min']
+        after = result['seconds_min']
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '回退'
+            regressed = True
+        elif change < -threshold:
+            flag = '提升'
+        rows.append((result['case'], result['candles'], before * 1000, after * 1000, change * 100, flag))
+    return rows, regressed
+
+
+def print_results(report):
+    print('| 用例 | K线数量 | 最快耗时(ms) | 中位耗时(ms) | K线/秒 |')
+    print('|------|------|------|------|------|')
+    for r in report['results']:
+        rate = f"{r['candles_per_second']:,.0f}" if r['candles_per_second'] else '-'
+        print(f"| {r['case']} | {r['candles']} | {r['seconds_min'] * 1000:.2f} | "
+              f"{r['seconds_median'] * 1000:.2f} | {rate} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试套件')
+    parser.add_argument('--cases', default=','.join(CASES), help=f"逗号分隔，可选: {', '.join(CASES)}")
+    parser.add_argument('--sizes', default=','.join(str(n) for n in DEFAULT_SIZES), help='K线数量，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-limit', action='store_true', help='忽略各用例的默认最大规模')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    parser.add_argument('--compare', help='与之对比的基线 JSON 文件')
+    parser.add_argument('--current', help='与基线对比的已有结果文件，不指定则重新运行')
+    parser.add_argument('--threshold', type=float, default=0.2, help='耗时增加超过该比例视为回退')
+    args = parser.parse_args()
+
+    case_names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in case_names if name not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {', '.join(unknown)}")
+
+    if args.current:
+        with open(args.current, encoding='utf-8') as f:
+            report = json.load(f)
+    else:
+        sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+        report = run(case_names, sizes, args.repeat, args.no_limit)
+        print_results(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, report, args.threshold)
+        print(f"\n与基线 {baseline['environment'].get('commit', '')} 对比（阈值 {args.threshold:.0%}）")
+        print('| 用例 | K线数量 | 基线(ms) | 当前(ms) | 变化(%) | |')
+        print('|------|------|------|------|------|------|')
+        for case, candles, before, after, change, flag in rows:
+            print(f"| {case} | {candles} | {before:.2f} | {after:.2f} | {change:+.1f} | {flag} |")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,71 @@
 import os
 import asyncio
+import concurrent.futures
+import functools
+import sys
+import threading
 from typing import Optional
-import dashscope
-from qwen_agent.agents import Assistant
-from qwen_agent.gui import WebUI
-import pandas as pd
-from sqlalchemy import create_engine
 from qwen_agent.tools.base import BaseTool, register_tool
-import matplotlib.pyplot as plt
 import io
 import base64
 import time
 import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
 from datetime import datetime, timedelta
 import warnings
 # 移除talib依赖，使用pandas自己实现技术指标
+# statsmodels、matplotlib、pandas、sqlalchemy、dashscope、qwen_agent 的 Assistant/WebUI 以及 binance
+# 导入都较慢，改为在用到的函数内部导入，缩短启动时间
 
 warnings.filterwarnings('ignore')  # 忽略ARIMA模型的一些警告信息
 
-# 新增：从binance导入Client以获取实时价格
-from binance import Client
+from btc_async_tools import PrefetchedView, get_runner
+from btc_cache_backend import cache_key, get_cache_backend
+from btc_candle_ring import CandleRingStore
+from btc_circuit_breaker import label_stale, serve_stale, stale_context, stale_note
+from btc_deadline import BudgetExceeded, CallBudget, StageEstimator, call_budget
+from btc_exchange import KLINE_INTERVAL_15MINUTE, KLINE_INTERVAL_1DAY, KLINE_INTERVAL_1HOUR, get_client
+from btc_indicators import bollinger, rolling_mean, rsi
+from btc_klines import klines_to_frame
+from btc_order_book import local_order_book, order_book_enabled, start_depth_stream
+from btc_precompute import PrecomputeJob, PrecomputeScheduler, closed_candles, precomputed, watchlist
+from btc_metrics import enabled as metrics_enabled, instrument_llm, record_cache, record_external_call, span, \
+    start_metrics_server, traced
+from btc_session_store import SessionResultStore, session_id_from_kwargs
+from btc_singleflight import coalesced, tool_flight_key
+from btc_strategy_params import load_strategy_params
+from btc_timeframes import MultiTimeframeFeed
+from btc_vector_charts import chart_markdown, forecast_chart_spec, indicator_chart_spec, price_chart_spec, \
+    render_chart, sql_chart_spec
+from btc_weight_governor import BACKFILL, INTERACTIVE, request_priority, with_priority
 
-# 解决中文显示问题
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'Arial Unicode MS']  # 优先使用的中文字体
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+_pyplot = None
+# pyplot 使用全局状态，多个会话并发绘图时需要串行
+pyplot_lock = threading.RLock()
 
-# 配置 DashScope
-dashscope.api_key = os.getenv('DASHSCOPE_API_KEY', '')  # 从环境变量获取 API Key
-dashscope.timeout = 30  # 设置超时时间为 30 秒
+def get_pyplot():
+    """首次绘图时导入 matplotlib 并设置中文字体"""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib.pyplot as plt
+        # 解决中文显示问题
+        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'Arial Unicode MS']  # 优先使用的中文字体
+        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        _pyplot = plt
+    return _pyplot
+
+def with_pyplot_lock(func):
+    """绘图函数装饰器：持有 pyplot_lock 期间执行"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with pyplot_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+def configure_dashscope():
+    """配置 DashScope，只在初始化大模型服务时调用"""
+    import dashscope
+    dashscope.api_key = os.getenv('DASHSCOPE_API_KEY', '')  # 从环境变量获取 API Key
+    dashscope.timeout = 30  # 设置超时时间为 30 秒
 
 # 配置数据库连接 - 使用与比特币数据相同的数据库配置
 db_config = {
@@ -40,8 +77,63 @@ db_config = {
     'charset': 'utf8mb4'
 }
 
-# 初始化Binance客户端，无需API Key即可访问公开数据
-client = Client()
+def get_db_url(database=None):
+    """数据库连接串，设置环境变量 BTC_DB_URL 时使用该地址（如离线基准测试用的 sqlite:///btc_bench.db）"""
+    db_url = os.getenv('BTC_DB_URL')
+    if db_url:
+        return db_url
+    database = database or db_config['database']
+    return f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{database}?charset=utf8mb4"
+
+# Binance客户端通过 btc_exchange.get_client() 在首次使用时创建，无需API Key即可访问公开数据
+
+# ====== 共享K线环形缓冲区 ======
+# WebUI 进程在后台为这些交易对维护一条 1 分钟K线数据源，本地聚合出 15m/1h/4h/1d 等周期，
+# 写入共享内存缓冲区，多个工作进程直接读取
+FEED_SYMBOLS = [item.strip().upper() for item in os.getenv('BTC_FEED_SYMBOLS', 'BTCUSDT').split(',') if item.strip()]
+CANDLE_RING_MAX_AGE = float(os.getenv('BTC_CANDLE_RING_MAX_AGE', '30'))  # 缓冲区超过该秒数未更新则视为失效
+KLINE_REQUEST_LIMIT = 1000  # 交易所单次最多返回的K线数量
+candle_rings = CandleRingStore()
+
+def read_candle_ring(symbol, interval, limit, time_column):
+    """从共享缓冲区读取最近 limit 根K线，缓冲区不存在、过期或数据不足时返回 None"""
+    ring = candle_rings.get(symbol, interval)
+    if ring is None or ring.age_seconds() > CANDLE_RING_MAX_AGE or len(ring) < min(limit, KLINE_REQUEST_LIMIT):
+        record_cache('candle_ring', False)
+        return None
+    record_cache('candle_ring', True)
+    return ring.to_frame(limit, time_column=time_column)
+
+def start_timeframe_feeds():
+    """为 FEED_SYMBOLS 启动 1 分钟数据源及多周期重采样的后台线程"""
+    return [MultiTimeframeFeed(get_client(), candle_rings, symbol).start() for symbol in FEED_SYMBOLS]
+
+# ====== 本地订单簿 ======
+# BTC_ORDER_BOOK=1 时订阅 FEED_SYMBOLS 的增量深度流，在本进程维护完整盘口（见 btc_order_book），
+# get_real_time_price 直接读取本地盘口的买一卖一和深度指标，不再请求订单簿
+def start_order_books():
+    """订阅增量深度流并维护本地盘口，未开启或订阅失败时返回 None"""
+    if not order_book_enabled():
+        return None
+    return start_depth_stream(FEED_SYMBOLS, get_client)
+
+# ====== 收盘后预计算 ======
+# 关注列表中的交易对在每根1小时K线收盘后预先算好技术指标和技术指标图表，每根日线收盘后预先算好ARIMA预测，
+# 交互请求只需叠加实时行情（见 btc_precompute）
+PRECOMPUTE_FORECAST_DAYS = int(os.getenv('BTC_PRECOMPUTE_FORECAST_DAYS', '7'))
+
+def start_precompute():
+    """为关注列表启动收盘后预计算的后台线程，关注列表为空时不启动"""
+    symbols = watchlist()
+    if not symbols:
+        return None
+    price_tool, arima_tool = GetRealTimePriceTool(), ARIMATool()
+    jobs = [
+        PrecomputeJob('strategy', KLINE_INTERVAL_1HOUR, price_tool.precompute_strategy),
+        PrecomputeJob(ARIMATool.precompute_kind(PRECOMPUTE_FORECAST_DAYS), KLINE_INTERVAL_1DAY,
+                      functools.partial(arima_tool.precompute_forecast, n=PRECOMPUTE_FORECAST_DAYS)),
+    ]
+    return PrecomputeScheduler(jobs, symbols).start()
 
 # ====== 比特币助手 system prompt 和函数描述 ======
 system_prompt = """我是比特币价格分析助手，以下是关于比特币价格数据表的字段信息，我可以编写SQL查询并分析比特币价格数据
@@ -71,6 +163,10 @@ CREATE TABLE btc_usdt_kline (
 3. 潜在的投资机会和风险点
 4. 基于当前市场状况的策略建议
 
+get_real_time_price 返回一行摘要和 JSON 数据时，我会基于其中的数值和指标信号（正数看多、负数看空）作答，并用 markdown 图片语法展示 charts 中的图表。
+
+用户针对上一次查询结果追问（如"只看最近一个月"）时，我会用与上一次完全相同的SQL调用 exc_sql 并传入 recent_days，直接在之前的结果上切片，不需要重新查询数据库；SQL 有任何不同时会重新查询。
+
 每当 exc_sql 工具返回 markdown 表格和图片时，我必须原样输出工具返回的全部内容（包括图片 markdown），不要只总结表格，也不要省略图片。这样用户才能直接看到表格和图片。
 """
 
@@ -84,6 +180,10 @@ functions_desc = [
                 "sql_input": {
                     "type": "string",
                     "description": "生成的SQL语句",
+                },
+                "recent_days": {
+                    "type": "integer",
+                    "description": "可选，只展示查询结果中最近N天的数据，追问时配合相同的SQL复用本会话之前的查询结果",
                 }
             },
             "required": ["sql_input"],
@@ -125,15 +225,25 @@ functions_desc = [
 ]
 
 # ====== 会话隔离 DataFrame 存储 ======
-# 用于存储每个会话的 DataFrame，避免多用户数据串扰
-_last_df_dict = {}
+# 按会话保存最近的查询结果，追问时直接切片，避免多用户数据串扰；按 LRU、内存上限和 TTL 淘汰
+session_store = SessionResultStore()
 
 def get_session_id(kwargs):
-    """根据 kwargs 获取当前会话的唯一 session_id，这里用 messages 的 id"""
-    messages = kwargs.get('messages')
-    if messages is not None:
-        return id(messages)
-    return None
+    """根据 kwargs 获取当前会话的稳定 session_id：显式传入的 session_id，否则为首条用户消息的哈希"""
+    return session_id_from_kwargs(kwargs)
+
+def normalize_sql(sql):
+    """SQL 缓存键：合并空白、去掉末尾分号"""
+    return ' '.join(sql.split()).rstrip(';').strip()
+
+def slice_recent_days(df, days):
+    """按第一个日期或时间列保留最近 days 天的数据，没有日期列时原样返回"""
+    import pandas as pd
+    date_column = next((col for col in df.columns if '日期' in col or '时间' in col), None)
+    if date_column is None or df.empty:
+        return df
+    dates = pd.to_datetime(df[date_column], errors='coerce')
+    return df[dates > dates.max() - pd.Timedelta(days=days)]
 
 # ====== exc_sql 工具类实现 ======
 @register_tool('exc_sql')
@@ -143,22 +253,34 @@ class ExcSQLTool(BaseTool):
     优化功能：检查数据库历史数据是否有缺失，如有缺失则从交易所获取并更新数据库
     """
     description = '对于生成的SQL，进行SQL查询，并自动可视化'
+    fetch_delay = 0.5  # 分批请求交易所之间的间隔（秒），避免触发API限制
+    single_flight = True  # 相同的并发调用只执行一次，见 btc_singleflight
     parameters = [{
         'name': 'sql_input',
         'type': 'string',
         'description': '生成的SQL语句',
         'required': True
+    }, {
+        'name': 'recent_days',
+        'type': 'integer',
+        'description': '可选，只展示查询结果中最近N天的数据，追问时配合相同的SQL复用本会话之前的查询结果',
+        'required': False
     }]
 
+    @traced('exc_sql', 'sync_check')
+    @with_priority(BACKFILL)
     def check_and_update_data(self, engine):
         """
         检查数据库中的数据是否有缺失，如果有缺失则从Binance获取并更新
         """
+        import pandas as pd
         try:
             # 查询数据库中最新的数据日期
             latest_date_query = "SELECT MAX(日期) as latest_date FROM btc_usdt_kline"
             latest_date_result = pd.read_sql(latest_date_query, engine)
             latest_date = latest_date_result['latest_date'].iloc[0]
+            # SQLite 返回的是日期字符串，统一转换为 date
+            latest_date = None if pd.isna(latest_date) else pd.Timestamp(latest_date).date()
             
             # 获取当前日期
             current_date = datetime.now().date()
@@ -181,39 +303,30 @@ class ExcSQLTool(BaseTool):
                 missing_data = []
                 current_fetch_date = start_date
                 
+                # 本地维护的日线已覆盖缺失区间时直接使用，无需请求交易所
+                feed_data = self.fetch_daily_from_feed(start_date, current_date)
+                if feed_data is not None:
+                    missing_data.append(feed_data)
+                    current_fetch_date = current_date + timedelta(days=1)
+                
                 while current_fetch_date <= current_date:
                     try:
                         # 计算结束日期（最多获取7天的数据，避免API限制）
                         end_fetch_date = min(current_fetch_date + timedelta(days=6), current_date)
                         
                         # 获取K线数据，使用1天间隔
-                        klines = client.get_historical_klines(
+                        klines = get_client().get_historical_klines(
                             symbol='BTCUSDT',
-                            interval=Client.KLINE_INTERVAL_1DAY,
+                            interval=KLINE_INTERVAL_1DAY,
                             start_str=current_fetch_date.strftime('%Y-%m-%d'),
                             end_str=end_fetch_date.strftime('%Y-%m-%d')
                         )
                         
                         if klines:
-                            # 转换为DataFrame
-                            df_batch = pd.DataFrame(klines, columns=[
-                                '开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量',
-                                '收盘时间戳', '成交额', '成交笔数', '主动买入成交量', '主动买入成交额', '忽略'
-                            ])
-                            
-                            # 处理数据类型和时间格式
-                            df_batch['开盘时间'] = pd.to_datetime(df_batch['开盘时间戳'], unit='ms')
-                            df_batch['收盘时间'] = pd.to_datetime(df_batch['收盘时间戳'], unit='ms')
-                            df_batch['日期'] = df_batch['开盘时间'].dt.date
-                            
-                            # 转换数值类型
-                            numeric_columns = ['开盘价', '最高价', '最低价', '收盘价', '成交量']
-                            for col in numeric_columns:
-                                df_batch[col] = df_batch[col].astype(float)
-                            
-                            # 选择需要的列
-                            df_batch = df_batch[['日期', '开盘时间', '开盘价', '最高价', '最低价', '收盘价', '成交量', '收盘时间']]
-                            
+                            # 直接解析为只包含所需列的DataFrame
+                            df_batch = klines_to_frame(klines, time_column='开盘时间', date_column='日期',
+                                                       close_time_column='收盘时间')
+
                             # 添加到缺失数据列表
                             missing_data.append(df_batch)
                         
@@ -221,7 +334,7 @@ class ExcSQLTool(BaseTool):
                         current_fetch_date = end_fetch_date + timedelta(days=1)
                         
                         # 添加短暂延迟，避免触发API限制
-                        time.sleep(0.5)
+                        time.sleep(self.fetch_delay)
                         
                     except Exception as e:
                         print(f"获取 {current_fetch_date} 到 {end_fetch_date} 的数据时出错: {str(e)}")
@@ -257,35 +370,74 @@ class ExcSQLTool(BaseTool):
             # 即使更新失败，也不阻止后续查询
             return f"数据更新检查失败: {str(e)}，但将继续执行查询"
 
+    def fetch_daily_from_feed(self, start_date, end_date):
+        """
+        从共享日线缓冲区读取 [start_date, end_date] 的K线，列与数据库表一致
+        缓冲区不可用或未覆盖起始日期时返回 None
+        """
+        import pandas as pd
+        days = (end_date - start_date).days + 1
+        daily = read_candle_ring('BTCUSDT', KLINE_INTERVAL_1DAY, days, time_column='开盘时间')
+        if daily is None or daily.empty or daily['开盘时间'].iloc[0].date() > start_date:
+            return None
+        dates = daily['开盘时间'].dt.date
+        df = daily[(dates >= start_date) & (dates <= end_date)].copy()
+        df.insert(0, '日期', df['开盘时间'].dt.date)
+        df['收盘时间'] = df['开盘时间'] + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+        return df
+
+    @traced('exc_sql', 'query')
+    def run_query(self, sql_input, engine):
+        """执行用户的SQL查询"""
+        import pandas as pd
+        started = time.perf_counter()
+        df = pd.read_sql(sql_input, engine)
+        record_external_call('mysql', 'query', time.perf_counter() - started)
+        return df
+
+    def flight_key(self, args, kwargs):
+        """合并键：会话 + 数据库 + 规范化后的SQL + 展示天数（查询结果按会话缓存，不同会话不合并）"""
+        return (get_session_id(kwargs), args.get('database', db_config['database']), normalize_sql(args['sql_input']),
+                args.get('recent_days'))
+
+    @traced('exc_sql', 'total')
+    @coalesced
     def call(self, params: str, **kwargs) -> str:
         import json
-        import matplotlib.pyplot as plt
         import io, os, time
         import numpy as np
+        from sqlalchemy import create_engine
         args = json.loads(params)
         sql_input = args['sql_input']
         database = args.get('database', db_config['database'])
-        
-        # 使用sqlalchemy创建数据库连接
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{database}?charset=utf8mb4"
-        engine = create_engine(connection_string)
+        recent_days = args.get('recent_days')
+        session_id = get_session_id(kwargs)
+        sql_key = (database, normalize_sql(sql_input))
         
         try:
-            # 首先检查并更新数据
-            update_message = self.check_and_update_data(engine)
-            
-            # 然后执行用户的SQL查询
-            df = pd.read_sql(sql_input, engine)
+            # 本会话已经执行过相同的SQL时复用之前的查询结果（追问只改 recent_days 时在其上切片），SQL 不同则重新查询
+            df, _ = session_store.get(session_id, sql_key)
+            if df is not None:
+                update_message = "复用本会话之前的查询结果，未重新查询数据库"
+            else:
+                # 使用sqlalchemy创建数据库连接
+                engine = create_engine(get_db_url(database))
+
+                # 首先检查并更新数据
+                update_message = self.check_and_update_data(engine)
+
+                # 然后执行用户的SQL查询
+                df = self.run_query(sql_input, engine)
+                session_store.put(session_id, sql_key, df, {'sql': sql_input})
+
+            if recent_days:
+                df = slice_recent_days(df, int(recent_days))
             md = df.head(10).to_markdown(index=False)
-            # 自动创建目录
-            save_dir = os.path.join(os.path.dirname(__file__), 'btc_images')
-            os.makedirs(save_dir, exist_ok=True)
-            filename = f'btc_chart_{int(time.time()*1000)}.png'
-            save_path = os.path.join(save_dir, filename)
-            # 生成图表
-            generate_btc_chart(df, save_path)
-            img_path = os.path.join('btc_images', filename)
-            img_md = f'![比特币图表]({img_path})'
+            # 生成图表，相同数据的图表直接复用已有文件
+            with span('exc_sql', 'render_chart'):
+                img_path = render_chart('btc_chart', df, functools.partial(generate_btc_chart, df),
+                                        functools.partial(sql_chart_spec, df))
+            img_md = chart_markdown('比特币图表', img_path)
             
             # 返回查询结果，同时包含数据更新的信息
             return f"## 数据更新状态\n{update_message}\n\n## 查询结果\n{md}\n\n{img_md}"
@@ -293,7 +445,9 @@ class ExcSQLTool(BaseTool):
             return f"SQL执行或可视化出错: {str(e)}"
 
 # ========== 比特币数据可视化函数 ========== 
+@with_pyplot_lock
 def generate_btc_chart(df_sql, save_path):
+    plt = get_pyplot()
     columns = df_sql.columns
     
     # 如果有日期或时间列，设置为索引
@@ -371,6 +525,24 @@ def generate_btc_chart(df_sql, save_path):
     plt.savefig(save_path, dpi=300, bbox_inches='tight')
     plt.close()
 
+@with_pyplot_lock
+def plot_forecast(b_code, n, history, future_dates, forecast, save_path):
+    """绘制ARIMA预测图：历史收盘价、预测收盘价和±5%预测区间"""
+    plt = get_pyplot()
+    plt.figure(figsize=(12, 6))
+    plt.plot(history.index, history, label='历史收盘价', linewidth=2)
+    plt.plot(future_dates, forecast, label='预测收盘价', color='red', linestyle='--', linewidth=2)
+    plt.fill_between(future_dates, forecast * 0.95, forecast * 1.05, color='red', alpha=0.1, label='预测区间')
+    plt.title(f'{b_code}未来{n}天价格预测 (ARIMA模型)')
+    plt.xlabel('日期')
+    plt.ylabel('价格 (USDT)')
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.legend()
+
+    # 保存图表
+    plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
 # 以下是文件的其余部分，保持原样
 # ====== arima_stock 工具类实现 ======
 @register_tool('arima_stock')
@@ -379,6 +551,7 @@ class ARIMATool(BaseTool):
     使用ARIMA模型对指定币子未来N天的价格进行预测
     """
     description = '使用ARIMA模型对指定币子未来N天的价格进行预测'
+    single_flight = True
     parameters = [
         {
             'name': 'b_code',
@@ -394,54 +567,95 @@ class ARIMATool(BaseTool):
         }
     ]
 
+    @staticmethod
+    def normalize_code(b_code):
+        """修正常见拼写错误并规范化交易对格式，返回 (币种代码, 交易对)"""
+        b_code = b_code.strip().upper()
+        if b_code == 'BCT':
+            b_code = 'BTC'
+        return b_code, f"{b_code}USDT"
+
+    @traced('arima_forecast', 'fetch_history')
+    @serve_stale('日线', kind='daily')
+    def fetch_history(self, symbol, limit):
+        """获取最近 limit 天的日线收盘价，优先读取本地聚合的日线，没有时再请求交易所"""
+        df = read_candle_ring(symbol, KLINE_INTERVAL_1DAY, limit, time_column='日期')
+        if df is None:
+            klines = get_client().get_klines(symbol=symbol, interval=KLINE_INTERVAL_1DAY, limit=limit)
+            # 只保留收盘价，直接解析为带类型的DataFrame
+            df = klines_to_frame(klines, time_column='日期', fields=('收盘价',))
+        return df
+
+    def flight_key(self, args, kwargs):
+        """合并键：规范化后的币种代码 + 预测天数"""
+        return (self.normalize_code(args.get('b_code', 'BTC'))[0], args.get('n', 7))
+
+    @staticmethod
+    def precompute_kind(n):
+        """预计算结果的种类名"""
+        return f'forecast_{n}'
+
+    def precomputed_forecast(self, symbol, n):
+        """日线收盘后预计算的预测结果，没有或已失效时返回 None"""
+        return precomputed.get(symbol, self.precompute_kind(n))
+
+    def precompute_forecast(self, symbol, close_ms, n=7):
+        """预计算任务：基于 close_ms 之前收盘的日线预测未来 n 天，失败时抛出异常由调度器稍后重试"""
+        b_code = symbol[:-len('USDT')] if symbol.endswith('USDT') else symbol
+        result = self.forecast(b_code, symbol, n, close_ms)
+        if not result.startswith(f"#{b_code}"):
+            raise Exception(result)
+        return result
+
+    @traced('arima_forecast', 'total')
+    @coalesced
+    @label_stale
     def call(self, params: str, **kwargs) -> str:
         import json
+        
+        args = json.loads(params)
+        b_code, symbol = self.normalize_code(args.get('b_code', 'BTC'))
+        n = args.get('n', 7)
+
+        # 关注列表中的交易对直接返回日线收盘后预计算的结果
+        cached = self.precomputed_forecast(symbol, n)
+        if cached is not None:
+            return cached
+        return self.forecast(b_code, symbol, n)
+
+    def forecast(self, b_code, symbol, n, close_ms=None):
+        """
+        ARIMA 预测并生成预测图表，返回 markdown 报告
+        close_ms 不为空时只使用该时间之前收盘的日线（收盘后预计算）
+        """
         import pandas as pd
         import numpy as np
         from statsmodels.tsa.arima.model import ARIMA
-        import matplotlib.pyplot as plt
-        import time
-        import os
         from datetime import datetime, timedelta
         
-        args = json.loads(params)
-        b_code = args.get('b_code', 'BTC').strip().upper()
-        n = args.get('n', 7)
-        
-        # 修正常见拼写错误并规范化交易对格式
-        if b_code == 'BCT':
-            b_code = 'BTC'
-        symbol = f"{b_code}USDT"
-        
         # 使用 Binance API 获取历史数据
         try:
             # 获取足够的历史数据，至少需要n*10天的数据来建立模型
-            klines = client.get_klines(symbol=symbol, interval=Client.KLINE_INTERVAL_1DAY, limit=n*10)
+            # 优先读取本地聚合的日线，没有时再请求交易所
+            df = self.fetch_history(symbol, n*10)
+            if close_ms is not None:
+                df = closed_candles(df, '日期', KLINE_INTERVAL_1DAY, close_ms)
             
-            if len(klines) < 30:  # 至少需要30天的数据
+            if len(df) < 30:  # 至少需要30天的数据
                 return f"警告: 获取的历史数据不足30天，预测结果可能不准确。"
-            
-            # 转换为DataFrame
-            df = pd.DataFrame(klines, columns=[
-                '开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量', 
-                '收盘时间戳', '成交额', '成交笔数', '主动买入成交量', '主动买入成交额', '忽略'
-            ])
-            
-            # 只保留收盘价并转换数据类型
-            df['收盘价'] = df['收盘价'].astype(float)
-            df['日期'] = pd.to_datetime(df['开盘时间戳'], unit='ms')
-            
+
             # 设置日期为索引
-            df.set_index('日期', inplace=True)
+            df = df.set_index('日期')
             
             # 使用ARIMA模型预测
             try:
                 # 自动确定ARIMA参数（这里简化为(5,1,0)，实际应用中可以使用auto_arima）
-                model = ARIMA(df['收盘价'], order=(5, 1, 0))
-                model_fit = model.fit()
-                
-                # 预测未来n天的价格
-                forecast = model_fit.forecast(steps=n)
+                with span('arima_forecast', 'fit'):
+                    model = ARIMA(df['收盘价'], order=(5, 1, 0))
+                    model_fit = model.fit()
+
+                    # 预测未来n天的价格
+                    forecast = model_fit.forecast(steps=n)
                 
                 # 生成未来n天的日期索引
                 last_date = df.index[-1]
@@ -457,28 +671,14 @@ class ARIMATool(BaseTool):
                 forecast_table = forecast_df.to_markdown(index=False, tablefmt="pipe", 
                                                        headers=["预测日期", "预测收盘价(USDT)"])
                 
-                # 生成预测图表
-                plt.figure(figsize=(12, 6))
-                plt.plot(df.index, df['收盘价'], label='历史收盘价', linewidth=2)
-                plt.plot(future_dates, forecast, label='预测收盘价', color='red', linestyle='--', linewidth=2)
-                plt.fill_between(future_dates, forecast * 0.95, forecast * 1.05, color='red', alpha=0.1, label='预测区间')
-                plt.title(f'{b_code}未来{n}天价格预测 (ARIMA模型)')
-                plt.xlabel('日期')
-                plt.ylabel('价格 (USDT)')
-                plt.grid(True, linestyle='--', alpha=0.7)
-                plt.legend()
-                
-                # 保存图表
-                save_dir = os.path.join(os.path.dirname(__file__), 'btc_images')
-                os.makedirs(save_dir, exist_ok=True)
-                filename = f'btc_forecast_{int(time.time()*1000)}.png'
-                save_path = os.path.join(save_dir, filename)
-                plt.savefig(save_path, dpi=300, bbox_inches='tight')
-                plt.close()
+                # 生成预测图表，相同数据和预测结果的图表直接复用已有文件
+                chart_args = (b_code, n, df['收盘价'], future_dates, forecast)
+                with span('arima_forecast', 'render_chart'):
+                    img_path = render_chart('btc_forecast', chart_args, functools.partial(plot_forecast, *chart_args),
+                                            functools.partial(forecast_chart_spec, *chart_args))
                 
                 # 生成图表的markdown引用
-                img_path = os.path.join('btc_images', filename)
-                img_md = f'![{b_code}价格预测图]({img_path})'
+                img_md = chart_markdown(f'{b_code}价格预测图', img_path)
                 
                 # 返回预测结果和图表
                 return f"#{b_code}未来{n}天价格预测\n\n" \
@@ -541,24 +741,17 @@ class ARIMATool(BaseTool):
 
 # ====== 优化的交易策略类 ======
 class OptimizedTradingStrategy:
-    def __init__(self):
-        # 定义指标权重系统（可根据市场状态动态调整）
-        self.trend_weights = {
-            'MA': 0.25,      # 趋势跟踪权重
-            'MACD': 0.20,    # 趋势动量权重
-            'SAR': 0.15,     # 趋势反转权重
-            'BOLL': 0.20,    # 波动率权重
-            'RSI': 0.10,     # 超买超卖权重
-            'KDJ': 0.10      # 短期动量权重
-        }
-        
-        self.range_weights = {
-            'RSI': 0.30,     # 震荡市中RSI更重要
-            'BOLL': 0.25,    # 布林带在震荡市中很有效
-            'KDJ': 0.20,     # KDJ适合震荡市
-            'VOL': 0.15,     # 成交量确认
-            'MA': 0.10       # 均线在震荡市中权重降低
-        }
+    def __init__(self, params=None):
+        # 指标权重、得分阈值和指标周期默认值见 btc_strategy_params，
+        # 若存在参数扫描保存的最优参数文件则优先使用
+        params = params or load_strategy_params()
+        # 定义指标权重系统（根据市场状态选择）
+        self.trend_weights = dict(params['trend_weights'])
+        self.range_weights = dict(params['range_weights'])
+        # 综合得分阈值
+        self.signal_thresholds = dict(params['signal_thresholds'])
+        # 不同市场状态下的指标周期
+        self.regime_periods = {regime: dict(periods) for regime, periods in params['regime_periods'].items()}
 
     def calculate_adx(self, df, period=14):
         """使用pandas实现ADX指标计算"""
@@ -653,9 +846,26 @@ class OptimizedTradingStrategy:
         else:
             return 'ranging'   # 震荡市
 
+    def regime_indicators(self, df, periods):
+        """
+        按市场状态的指标周期计算最新一根K线的均线、RSI和布林带，
+        与参数扫描（btc_param_sweep.py）评分时的口径一致
+        """
+        close = df['收盘价'].to_numpy(dtype=float)
+        upper, _, lower = bollinger(close, periods['boll_period'])
+        return {
+            'MA_SHORT': rolling_mean(close, periods['ma_short'])[-1],
+            'MA_MID': rolling_mean(close, periods['ma_mid'])[-1],
+            'MA_LONG': rolling_mean(close, periods['ma_long'])[-1],
+            'RSI': rsi(close, periods['rsi_period'])[-1],
+            'Upper_Band': upper[-1],
+            'Lower_Band': lower[-1],
+        }
+
     def calculate_technical_score(self, df, current_price, market_regime):
-        """计算技术指标综合得分"""
+        """计算技术指标综合得分，均线、RSI和布林带使用当前市场状态的指标周期"""
         latest = df.iloc[-1]
+        periodic = self.regime_indicators(df, self.optimize_parameters_based_on_regime(df, market_regime))
         scores = {}
         
         # MACD评分
@@ -667,9 +877,9 @@ class OptimizedTradingStrategy:
             scores['MACD'] = 0.0
         
         # RSI评分
-        if latest['RSI'] < 30:
+        if periodic['RSI'] < 30:
             scores['RSI'] = 1.0  # 超卖，看多
-        elif latest['RSI'] > 70:
+        elif periodic['RSI'] > 70:
             scores['RSI'] = -1.0  # 超买，看空
         else:
             scores['RSI'] = 0.0
@@ -683,17 +893,17 @@ class OptimizedTradingStrategy:
             scores['KDJ'] = 0.0
         
         # 移动平均线评分
-        if latest['MA5'] > latest['MA10'] > latest['MA20']:
+        if periodic['MA_SHORT'] > periodic['MA_MID'] > periodic['MA_LONG']:
             scores['MA'] = 1.0
-        elif latest['MA5'] < latest['MA10'] < latest['MA20']:
+        elif periodic['MA_SHORT'] < periodic['MA_MID'] < periodic['MA_LONG']:
             scores['MA'] = -1.0
         else:
             scores['MA'] = 0.0
         
         # 布林带评分
-        if current_price < latest['Lower_Band']:
+        if current_price < periodic['Lower_Band']:
             scores['BOLL'] = 1.0  # 触及下轨，可能反弹
-        elif current_price > latest['Upper_Band']:
+        elif current_price > periodic['Upper_Band']:
             scores['BOLL'] = -1.0  # 触及上轨，可能回调
         else:
             scores['BOLL'] = 0.0
@@ -801,12 +1011,13 @@ class OptimizedTradingStrategy:
             
             # 根据得分和信号强度制定策略
             signal_strength = abs(total_score)
+            thresholds = self.signal_thresholds
             
-            if signal_strength > 0.7:
+            if signal_strength > thresholds['high_strength']:
                 strategy['信号强度'] = '强'
                 strategy['仓位建议'] = '重仓'
                 strategy['置信度'] = 0.8
-            elif signal_strength > 0.3:
+            elif signal_strength > thresholds['medium_strength']:
                 strategy['信号强度'] = '中'
                 strategy['仓位建议'] = '中仓'
                 strategy['置信度'] = 0.6
@@ -816,28 +1027,28 @@ class OptimizedTradingStrategy:
                 strategy['置信度'] = 0.4
             
             # 制定交易决策
-            if total_score > 0.5:  # 强烈看多
+            if total_score > thresholds['strong']:  # 强烈看多
                 strategy['方向判断'] = '强势上涨'
                 strategy['建议操作'] = '买入'
                 strategy['止损价格'] = round(current_price - 2 * atr, 2)
                 strategy['止盈价格'] = round(current_price + 3 * atr, 2)
                 strategy['风险收益比'] = 1.5
                 
-            elif total_score > 0.2:  # 温和看多
+            elif total_score > thresholds['mild']:  # 温和看多
                 strategy['方向判断'] = '温和上涨'
                 strategy['建议操作'] = '买入'
                 strategy['止损价格'] = round(current_price - 1.5 * atr, 2)
                 strategy['止盈价格'] = round(current_price + 2 * atr, 2)
                 strategy['风险收益比'] = 1.3
                 
-            elif total_score < -0.5:  # 强烈看空
+            elif total_score < -thresholds['strong']:  # 强烈看空
                 strategy['方向判断'] = '强势下跌'
                 strategy['建议操作'] = '卖出'
                 strategy['止损价格'] = round(current_price + 2 * atr, 2)
                 strategy['止盈价格'] = round(current_price - 3 * atr, 2)
                 strategy['风险收益比'] = 1.5
                 
-            elif total_score < -0.2:  # 温和看空
+            elif total_score < -thresholds['mild']:  # 温和看空
                 strategy['方向判断'] = '温和下跌'
                 strategy['建议操作'] = '卖出'
                 strategy['止损价格'] = round(current_price + 1.5 * atr, 2)
@@ -880,29 +1091,35 @@ class OptimizedTradingStrategy:
         except Exception as e:
             raise Exception(f"分析交易策略失败: {str(e)}")
 
+    @staticmethod
+    def exit_prices(strategy):
+        """返回 (止损价格, 止盈价格)，无效时按操作建议改用支撑位/压力位"""
+        import numpy as np
+        stop_loss = strategy['止损价格']
+        take_profit = strategy['止盈价格']
+        
+        # 根据操作建议处理止损止盈价格
+        if strategy['建议操作'] == '卖出':
+            # 对于卖出信号，止损应该在当前价格上方，止盈应该在当前价格下方
+            if isinstance(stop_loss, float) and (np.isnan(stop_loss) or stop_loss == 0):
+                stop_loss = round(strategy['压力位1'], 2)  # 卖出时止损在压力位
+            if isinstance(take_profit, float) and (np.isnan(take_profit) or take_profit == 0):
+                take_profit = round(strategy['支撑位1'], 2)  # 卖出时止盈在支撑位
+        else:
+            # 对于买入或其他信号，保持原有逻辑
+            if isinstance(stop_loss, float) and (np.isnan(stop_loss) or stop_loss == 0):
+                stop_loss = round(strategy['支撑位1'], 2)
+            if isinstance(take_profit, float) and (np.isnan(take_profit) or take_profit == 0):
+                take_profit = round(strategy['压力位1'], 2)
+        return stop_loss, take_profit
+
     def format_trading_strategy(self, strategy):
         """
         格式化交易策略结果
         """
         try:
             # 检查并处理NaN值，确保显示的价格都是有效数字
-            import numpy as np
-            stop_loss = strategy['止损价格']
-            take_profit = strategy['止盈价格']
-            
-            # 根据操作建议处理止损止盈价格
-            if strategy['建议操作'] == '卖出':
-                # 对于卖出信号，止损应该在当前价格上方，止盈应该在当前价格下方
-                if isinstance(stop_loss, float) and (np.isnan(stop_loss) or stop_loss == 0):
-                    stop_loss = round(strategy['压力位1'], 2)  # 卖出时止损在压力位
-                if isinstance(take_profit, float) and (np.isnan(take_profit) or take_profit == 0):
-                    take_profit = round(strategy['支撑位1'], 2)  # 卖出时止盈在支撑位
-            else:
-                # 对于买入或其他信号，保持原有逻辑
-                if isinstance(stop_loss, float) and (np.isnan(stop_loss) or stop_loss == 0):
-                    stop_loss = round(strategy['支撑位1'], 2)
-                if isinstance(take_profit, float) and (np.isnan(take_profit) or take_profit == 0):
-                    take_profit = round(strategy['压力位1'], 2)
+            stop_loss, take_profit = self.exit_prices(strategy)
             
             formatted = f"""
 📊 **交易策略分析报告**
@@ -945,27 +1162,11 @@ class OptimizedTradingStrategy:
     def optimize_parameters_based_on_regime(self, df, market_regime):
         """
         根据市场状态优化指标参数
+        趋势市使用更长的周期以减少假信号，震荡市使用更敏感的设置；
+        具体数值来自策略参数，可由 btc_param_sweep.py 扫描得到
         """
-        optimized_params = {}
-        
-        if market_regime == 'trending':
-            # 趋势市参数：更长的周期以减少假信号
-            optimized_params.update({
-                'ma_short': 10,    # 缩短均线捕捉趋势
-                'ma_long': 30,
-                'rsi_period': 14,
-                'boll_period': 20
-            })
-        else:
-            # 震荡市参数：更敏感的设置
-            optimized_params.update({
-                'ma_short': 5,     # 更短周期捕捉震荡
-                'ma_long': 20,
-                'rsi_period': 10,  # 更敏感的RSI
-                'boll_period': 14
-            })
-        
-        return optimized_params
+        regime = 'trending' if market_regime == 'trending' else 'ranging'
+        return dict(self.regime_periods[regime])
 
 # ====== get_real_time_price 工具类实现 ======
 @register_tool('get_real_time_price')
@@ -974,6 +1175,7 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
     获取指定币子的实时价格数据，精确到秒
     """
     description = '获取指定币子的实时价格数据，精确到秒'
+    single_flight = True
     parameters = [
         {
             'name': 'symbol',
@@ -983,23 +1185,66 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
         }
     ]
 
+    # 单次调用的时间预算（秒），0 表示不限时；各阶段耗时的估算在所有实例间共享
+    deadline = float(os.getenv('BTC_PRICE_DEADLINE', '8'))
+    stage_estimator = StageEstimator(defaults={
+        'fetch_klines': 0.3, 'render_price_chart': 0.8, 'fetch_history': 0.5,
+        'indicators': 0.5, 'strategy': 0.2, 'render_indicator_chart': 1.2,
+    })
+    stage_cache_ttl = float(os.getenv('BTC_PRICE_STAGE_CACHE_TTL', '300'))
+    PRICE_CHART_STAGES = ('fetch_klines', 'render_price_chart')
+    STRATEGY_STAGES = ('fetch_history', 'indicators', 'strategy')
+    INDICATOR_CHART_STAGES = ('render_indicator_chart',)
+    # 结果格式：markdown 为完整报告，compact 为一行摘要加 JSON 数据
+    output_mode = os.getenv('BTC_TOOL_OUTPUT', 'markdown')
+
     def __init__(self):
         BaseTool.__init__(self)
         OptimizedTradingStrategy.__init__(self)
 
+    def flight_key(self, args, kwargs):
+        """合并键：规范化后的交易对和输出格式"""
+        return (self.normalize_symbol(args.get('symbol', 'BTCUSDT')), self.output_mode_for(args))
+
+    @traced('get_real_time_price', 'total')
+    @coalesced
+    @with_priority(INTERACTIVE)
+    @label_stale
     def call(self, params: str, **kwargs) -> str:
         import json
         args = json.loads(params)
-        symbol = args.get('symbol', 'BTCUSDT').strip().upper()  # 确保交易对符号为大写
-        
+        with call_budget(self.deadline_for(args), self.stage_estimator) as budget:
+            return self.run_pipeline(args, budget)
+
+    def stream(self, params: str, **kwargs):
+        """
+        流式版本的 call（生成器）：行情到达后先产出只含价格的结果，之后策略分析、价格走势图、技术指标图表
+        每完成一项产出一次，每次产出的都是到目前为止的完整结果，最后一次与 call 的返回值相同
+        流式调用不与相同的调用合并
+        """
+        import json
+        args = json.loads(params)
+        with span('get_real_time_price', 'total'), request_priority(INTERACTIVE), \
+                stale_context() as (notes, owner), \
+                call_budget(self.deadline_for(args), self.stage_estimator) as budget:
+            for result in self.stream_stages(args, budget):
+                yield f"{result}\n\n{stale_note(notes)}" if owner and notes else result
+
+    def stream_stages(self, args, budget):
+        return self.run_stages(args, budget)
+
+    def run_pipeline(self, args, budget):
+        """获取价格并在时间预算内依次完成策略分析和图表，返回最终结果"""
+        result = None
+        for result in self.run_stages(args, budget):
+            pass
+        return result
+
+    def run_stages(self, args, budget):
+        """获取价格并在时间预算内依次完成策略分析和图表，每完成一个阶段产出一次到目前为止的结果"""
         try:
-            # 修正常见拼写错误
-            if symbol == 'BCT':
-                symbol = 'BTCUSDT'
-            # 确保交易对符合Binance格式
-            if 'USDT' not in symbol:
-                symbol = f"{symbol}USDT"
-            
+            symbol = self.normalize_symbol(args.get('symbol', 'BTCUSDT'))
+
             # 获取实时价格数据 - 添加额外的异常捕获
             try:
                 real_time_data = self.fetch_real_time_price(symbol)
@@ -1007,130 +1252,244 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
                 fetch_error_msg = str(fetch_error)
                 # 处理fetch_real_time_price中抛出的特定异常
                 if 'Invalid symbol' in fetch_error_msg:
-                    return f"交易对符号错误: {symbol}。请使用正确的交易对格式，如'BTCUSDT'。"
+                    yield f"交易对符号错误: {symbol}。请使用正确的交易对格式，如'BTCUSDT'。"
                 elif 'Connection' in fetch_error_msg or 'timed out' in fetch_error_msg:
-                    return f"网络连接错误: 无法连接到交易所服务器。请检查您的网络连接。"
+                    yield f"网络连接错误: 无法连接到交易所服务器。请检查您的网络连接。"
                 else:
-                    return f"获取实时价格数据失败: {fetch_error_msg}"
-            
+                    yield f"获取实时价格数据失败: {fetch_error_msg}"
+                return
+
             # 双重验证数据结构 - 确保real_time_data是字典且包含current_price
             if not isinstance(real_time_data, dict):
-                return f"获取实时价格时数据结构错误: 返回的数据类型不是字典。请检查网络连接或稍后重试。"
-            
+                yield f"获取实时价格时数据结构错误: 返回的数据类型不是字典。请检查网络连接或稍后重试。"
+                return
+
             if 'current_price' not in real_time_data:
-                return f"获取实时价格时数据结构错误: 返回的字典中缺少current_price字段。请检查网络连接或稍后重试。"
-            
+                yield f"获取实时价格时数据结构错误: 返回的字典中缺少current_price字段。请检查网络连接或稍后重试。"
+                return
+
             # 验证current_price的值是否有效
             if real_time_data['current_price'] == 0 or real_time_data['current_price'] is None:
-                return f"获取实时价格失败: 当前价格为零或无效。可能是交易所API暂时不可用，请稍后重试。"
-            
-            # 获取最近的K线数据用于短期分析 - 添加异常捕获
-            try:
+                yield f"获取实时价格失败: 当前价格为零或无效。可能是交易所API暂时不可用，请稍后重试。"
+                return
+
+            format_result = self.format_compact if self.output_mode_for(args) == 'compact' else self.format_markdown
+
+            def render(chart, section):
+                updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                return format_result(symbol, real_time_data, chart, section, budget, updated_at)
+
+            # 未完成的阶段为 None，显示为"生成中"
+            yield render(None, None)
+
+            # 可选阶段按优先级从高到低：交易策略分析、技术指标图表、价格走势图，时间不够时从后往前跳过
+            section = self.build_strategy_section(symbol, real_time_data, budget)
+            yield render(None, section)
+            reserve = self.INDICATOR_CHART_STAGES if section.get('history') is not None else ()
+            chart = self.build_price_chart_section(symbol, real_time_data, budget, reserve)
+            yield render(chart, section)
+            if section.get('history') is not None:
+                section['indicator_image'] = self.build_indicator_chart(symbol, section, budget)
+                section['history'] = None
+                yield render(chart, section)
+
+        except Exception as e:
+            yield f"获取实时价格数据时发生错误: {str(e)}"
+
+    def deadline_for(self, args):
+        """本次调用的时间预算（秒），参数中的 deadline_seconds 优先，0 表示不限时"""
+        return float(args.get('deadline_seconds', self.deadline) or 0) or None
+
+    def output_mode_for(self, args):
+        """本次调用的输出格式，参数中的 output 优先：markdown 或 compact"""
+        return str(args.get('output', self.output_mode)).lower()
+
+    def cached_stage(self, symbol, stage):
+        """
+        最近一次生成的图表路径和策略分析（可能来自其他 worker），时间预算不足时复用
+        返回 (缓存的阶段结果, 距今秒数)，没有或已超过 stage_cache_ttl 时返回 (None, None)
+        """
+        item = get_cache_backend().get(cache_key('stage', symbol, stage))
+        if item is None:
+            return None, None
+        return item[0], time.time() - item[1]
+
+    def store_stage(self, symbol, stage, value):
+        get_cache_backend().set(cache_key('stage', symbol, stage), (value, time.time()), self.stage_cache_ttl)
+
+    def build_price_chart_section(self, symbol, real_time_data, budget, reserve=()):
+        """
+        价格走势图，优先级最低：剩余时间要同时够画这张图和 reserve 中之后的阶段（技术指标图表）
+        返回 {'image': 图片相对路径或 None, 'message': 未生成图表的说明或 None}
+        """
+        if not budget.allows(*self.PRICE_CHART_STAGES, *reserve):
+            cached, age = self.cached_stage(symbol, 'price_chart')
+            if cached is None:
+                budget.skip('价格走势图')
+                return {'image': None, 'message': "*注: 时间预算不足，未生成价格走势图。*"}
+            budget.reuse('价格走势图', age)
+            return {'image': cached, 'message': None}
+
+        try:
+            with budget.stage('fetch_klines'):
                 recent_klines = self.fetch_recent_klines(symbol)
-            except Exception as kline_error:
-                # 即使K线数据获取失败，也尝试继续，只返回价格信息而不显示图表
-                price_table = self.format_real_time_price(real_time_data)
-                return f"#{symbol}实时价格数据（精确到秒）\n\n" \
-                       f"## 当前价格信息\n{price_table}\n\n" \
-                       f"## 价格走势图表\n*注: 无法获取K线数据，因此无法显示价格走势图。*\n\n" \
-                       f"*数据更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}*"
-            
-            # 生成可视化图表 - 添加异常捕获
+        except BudgetExceeded:
+            budget.skip('价格走势图')
+            return {'image': None, 'message': "*注: 时间预算不足，未生成价格走势图。*"}
+        except Exception:
+            # 即使K线数据获取失败，也继续返回价格信息和策略分析
+            return {'image': None, 'message': "*注: 无法获取K线数据，因此无法显示价格走势图。*"}
+
+        # 图表只取决于K线、当前价格和24小时涨跌幅，相同时直接复用已有文件
+        inputs = (symbol, recent_klines, real_time_data['current_price'], real_time_data['price_change_percent_24h'])
+        try:
+            with budget.stage('render_price_chart'):
+                image = render_chart('btc_real_time_price', inputs, functools.partial(
+                    self.plot_real_time_price, real_time_data, recent_klines, symbol=symbol),
+                    functools.partial(price_chart_spec, symbol, recent_klines, *inputs[2:]))
+        except Exception as plot_error:
+            # 打印错误信息以便调试
+            print(f"图表生成错误: {str(plot_error)}")
+            return {'image': None, 'message': f"*注: 图表生成失败，但已获取到价格数据。错误: {str(plot_error)}*"}
+
+        self.store_stage(symbol, 'price_chart', image)
+        return {'image': image, 'message': None}
+
+    def build_strategy_section(self, symbol, real_time_data, budget):
+        """
+        交易策略分析，有收盘后预计算的结果时只代入实时价格，时间不够时复用缓存的结果
+        返回 {'strategy': 策略字典或 None, 'indicator_image': 图片相对路径或 None, 'message': 未分析的说明或 None,
+              'history': 带指标的历史数据（本次新算出策略、技术指标图表尚未生成时）或 None}
+        """
+        artifact = self.precomputed_strategy(symbol)
+        if artifact is not None:
             try:
-                save_dir = os.path.join(os.path.dirname(__file__), 'btc_images')
-                os.makedirs(save_dir, exist_ok=True)
-                filename = f'btc_real_time_price_{int(time.time()*1000)}.png'
-                save_path = os.path.join(save_dir, filename)
-                
-                self.plot_real_time_price(real_time_data, recent_klines, save_path, symbol)
-                
-                # 格式化实时数据为表格
-                price_table = self.format_real_time_price(real_time_data)
-                
-                img_path = os.path.join('btc_images', filename)
-                img_md = f'![{symbol}实时价格图表]({img_path})'
-                
-                # ===== 新增交易策略分析部分 =====
-                trading_strategy_md = """
-## 短期交易策略分析
-"""
-                
-                try:
+                with span('get_real_time_price', 'strategy'):
+                    trading_strategy = self.analyze_trading_strategy(artifact['history'], real_time_data)
+            except Exception as strategy_error:
+                return {'strategy': None, 'indicator_image': None,
+                        'message': f"*注: 无法获取或分析交易策略数据: {str(strategy_error)}*"}
+            self.store_stage(symbol, 'strategy', trading_strategy)
+            if artifact['indicator_image'] is not None:
+                self.store_stage(symbol, 'indicator_chart', artifact['indicator_image'])
+            return {'strategy': trading_strategy, 'indicator_image': artifact['indicator_image'], 'message': None}
+
+        if budget.allows(*self.STRATEGY_STAGES):
+            try:
+                with budget.stage('fetch_history'):
                     # 获取30天历史数据
                     historical_data = self.fetch_60day_historical_data(symbol)
-                    
-                    # 计算技术指标
+
+                # 计算技术指标
+                with budget.stage('indicators'):
                     historical_data_with_indicators = self.calculate_technical_indicators(historical_data)
-                    
-                    # 分析交易策略（使用优化的策略）
+
+                # 分析交易策略（使用优化的策略）
+                with budget.stage('strategy'), span('get_real_time_price', 'strategy'):
                     trading_strategy = self.analyze_trading_strategy(historical_data_with_indicators, real_time_data)
-                    
-                    # 格式化交易策略（使用优化的格式化方法）
-                    formatted_strategy = self.format_trading_strategy(trading_strategy)
-                    
-                    # 生成技术指标图表
-                    indicators_filename = f'btc_technical_indicators_{int(time.time()*1000)}.png'
-                    indicators_save_path = os.path.join(save_dir, indicators_filename)
-                    self.plot_technical_indicators(historical_data_with_indicators, trading_strategy, indicators_save_path, symbol)
-                    
-                    indicators_img_path = os.path.join('btc_images', indicators_filename)
-                    indicators_img_md = f'![{symbol}技术指标图表]({indicators_img_path})'
-                    
-                    trading_strategy_md = f"""
-## 短期交易策略分析
+                self.store_stage(symbol, 'strategy', trading_strategy)
+                return {'strategy': trading_strategy, 'indicator_image': None, 'message': None,
+                        'history': historical_data_with_indicators}
+            except BudgetExceeded:
+                pass
+            except Exception as strategy_error:
+                # 即使策略分析失败，也要确保返回基本价格信息
+                return {'strategy': None, 'indicator_image': None,
+                        'message': f"*注: 无法获取或分析交易策略数据: {str(strategy_error)}*"}
 
-### 技术指标分析
-{indicators_img_md}
+        trading_strategy, age = self.cached_stage(symbol, 'strategy')
+        if trading_strategy is None:
+            budget.skip('交易策略分析')
+            return {'strategy': None, 'indicator_image': None, 'message': "*注: 时间预算不足，未进行交易策略分析。*"}
+        budget.reuse('交易策略分析', age)
+        return {'strategy': trading_strategy, 'indicator_image': self.cached_stage(symbol, 'indicator_chart')[0],
+                'message': None}
 
-### 交易策略建议
-{formatted_strategy}
+    def precomputed_strategy(self, symbol):
+        """1小时K线收盘后预计算的 {'history': 带指标的历史数据, 'indicator_image': 技术指标图表}，没有或已失效时返回 None"""
+        return precomputed.get(symbol, 'strategy')
 
-### 策略解读
-根据优化的多指标综合分析系统，当前市场状态为**{trading_strategy['市场状态']}**，整体趋势判断为**{trading_strategy['方向判断']}**，建议**{trading_strategy['建议操作']}**。
+    def precompute_strategy(self, symbol, close_ms):
+        """预计算任务：基于 close_ms 之前收盘的1小时K线计算技术指标并生成技术指标图表"""
+        history = closed_candles(self.fetch_60day_historical_data(symbol), '时间', KLINE_INTERVAL_1HOUR, close_ms)
+        history = self.calculate_technical_indicators(history)
+        # 按最后收盘价分析一次：ATR、ADX 等只取决于K线的列在这里算好，之后的请求只需代入实时价格
+        strategy = self.analyze_trading_strategy(history, {'current_price': float(history['收盘价'].iloc[-1])})
+        image = self.build_indicator_chart(symbol, {'strategy': strategy, 'history': history},
+                                           CallBudget(None, self.stage_estimator))
+        return {'history': history, 'indicator_image': image}
 
-- **信号强度**: {trading_strategy['信号强度']}（置信度: {trading_strategy['置信度']:.0%}）
-- **支撑位和压力位**: 当前价格处于支撑位{trading_strategy['支撑位1']}和压力位{trading_strategy['压力位1']}之间
-- **止损设置**: 建议将止损设置在{trading_strategy['止损价格']}，控制风险
-- **止盈目标**: 建议将止盈设置在{trading_strategy['止盈价格']}
-- **风险收益比**: 当前风险收益比为1:{trading_strategy['风险收益比']}
-- **仓位建议**: {trading_strategy['仓位建议']}
+    def build_indicator_chart(self, symbol, section, budget):
+        """技术指标图表，返回图片相对路径；时间不够时使用缓存的图表，失败时只省略图表"""
+        if not budget.allows(*self.INDICATOR_CHART_STAGES):
+            image, age = self.cached_stage(symbol, 'indicator_chart')
+            if image is None:
+                budget.skip('技术指标图表')
+            else:
+                budget.reuse('技术指标图表', age)
+            return image
+        strategy = section['strategy']
+        levels = [strategy[name] for name in ('支撑位1', '支撑位2', '压力位1', '压力位2')]
+        try:
+            with budget.stage('render_indicator_chart'):
+                image = render_chart('btc_technical_indicators', (symbol, section['history'], levels),
+                                     functools.partial(self.plot_technical_indicators, section['history'],
+                                                       strategy, symbol=symbol),
+                                     functools.partial(indicator_chart_spec, section['history'], strategy, symbol))
+        except Exception as plot_error:
+            print(f"图表生成错误: {str(plot_error)}")
+            return None
+        self.store_stage(symbol, 'indicator_chart', image)
+        return image
 
-请注意，加密货币市场波动较大，以上策略仅供参考，投资有风险，入市需谨慎。
-                    """
-                except Exception as strategy_error:
-                    # 即使策略分析失败，也要确保返回基本价格信息
-                    trading_strategy_md = f"""
-## 短期交易策略分析
-*注: 无法获取或分析交易策略数据: {str(strategy_error)}*
-                    """
-                
-                # 构建返回结果，包含详细的实时价格数据和分析，供大模型进一步处理
-                return f"#{symbol}实时价格数据与交易策略分析\n\n" \
-                       f"## 当前价格信息\n{price_table}\n\n" \
-                       f"## 价格走势图表\n{img_md}\n\n" \
-                       f"{trading_strategy_md}\n\n" \
-                       f"*数据更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}*"
-                
-            except Exception as plot_error:
-                # 即使图表生成失败，也返回价格信息
-                price_table = self.format_real_time_price(real_time_data)
-                
-                # 尝试获取交易策略分析（即使图表生成失败）
-                trading_strategy_md = """
+    def format_markdown(self, symbol, real_time_data, chart, section, budget, updated_at):
+        """完整的 Markdown 结果：价格表格、价格走势图、策略报告和策略解读；chart / section 为 None 时显示生成中"""
+        price_table = self.format_real_time_price(real_time_data)
+        if chart is None:
+            chart_md = "*价格走势图生成中...*"
+        else:
+            chart_md = chart_markdown(f"{symbol}实时价格图表", chart['image']) if chart['image'] else chart['message']
+
+        # 构建返回结果，包含详细的实时价格数据和分析，供大模型进一步处理
+        title = f"#{symbol}实时价格数据与交易策略分析" if chart and chart['image'] else f"#{symbol}实时价格数据（精确到秒）"
+        result = f"{title}\n\n" \
+                 f"## 当前价格信息\n{price_table}\n\n" \
+                 f"## 价格走势图表\n{chart_md}\n\n" \
+                 f"{self.format_strategy_section(symbol, section)}\n\n" \
+                 f"*数据更新时间: {updated_at}*"
+        note = budget.note()
+        return f"{result}\n\n{note}" if note else result
+
+    def format_strategy_section(self, symbol, section):
+        if section is None:
+            return """
 ## 短期交易策略分析
-*注: 无法生成图表，但尝试获取基本策略分析...*
+*交易策略分析中...*
 """
-                
-                try:
-                    # 获取30天历史数据
-                    historical_data = self.fetch_60day_historical_data(symbol)
-                    historical_data_with_indicators = self.calculate_technical_indicators(historical_data)
-                    trading_strategy = self.analyze_trading_strategy(historical_data_with_indicators, real_time_data)
-                    formatted_strategy = self.format_trading_strategy(trading_strategy)
-                    
-                    trading_strategy_md = f"""
+        trading_strategy = section['strategy']
+        if trading_strategy is None:
+            return f"""
 ## 短期交易策略分析
+{section['message']}
+"""
 
+        # 格式化交易策略（使用优化的格式化方法）
+        formatted_strategy = self.format_trading_strategy(trading_strategy)
+        if section.get('history') is not None:
+            indicators_md = """
+### 技术指标分析
+*技术指标图表生成中...*
+"""
+        elif section['indicator_image']:
+            indicators_md = f"""
+### 技术指标分析
+{chart_markdown(f"{symbol}技术指标图表", section['indicator_image'])}
+"""
+        else:
+            indicators_md = ''
+        return f"""
+## 短期交易策略分析
+{indicators_md}
 ### 交易策略建议
 {formatted_strategy}
 
@@ -1143,114 +1502,187 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
 - **止盈目标**: 建议将止盈设置在{trading_strategy['止盈价格']}
 - **风险收益比**: 当前风险收益比为1:{trading_strategy['风险收益比']}
 - **仓位建议**: {trading_strategy['仓位建议']}
+
+请注意，加密货币市场波动较大，以上策略仅供参考，投资有风险，入市需谨慎。
                     """
-                except:
-                    pass
-                
-                # 打印错误信息以便调试
-                print(f"图表生成错误: {str(plot_error)}")
-                
-                # 确保btc_images目录存在
-                save_dir = os.path.join(os.path.dirname(__file__), 'btc_images')
-                os.makedirs(save_dir, exist_ok=True)
-                
-                return f"#{symbol}实时价格数据（精确到秒）\n\n" \
-                       f"## 当前价格信息\n{price_table}\n\n" \
-                       f"## 价格走势图表\n*注: 图表生成失败，但已获取到价格数据。错误: {str(plot_error)}*\n\n" \
-                       f"{trading_strategy_md}\n\n" \
-                       f"*数据更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}*"
-            
-        except Exception as e:
-            return f"获取实时价格数据时发生错误: {str(e)}"
-    
+
+    def format_compact(self, symbol, real_time_data, chart, section, budget, updated_at):
+        """
+        紧凑结果：一行摘要加 JSON（价格、策略数值和指标信号、图表路径），
+        省略表格、报告、权重表和重复数值的策略解读，减少大模型需要读取的 token
+        chart / section 为 None 时该部分尚未完成，列在 pending 中
+        """
+        import json
+        price = real_time_data['current_price']
+        change_percent = real_time_data['price_change_percent_24h']
+        payload = {
+            'symbol': symbol,
+            'price': {
+                'last': price,
+                'bid': real_time_data['bid_price'],
+                'ask': real_time_data['ask_price'],
+                'change_24h': real_time_data['price_change_24h'],
+                'change_pct_24h': change_percent,
+                'high_24h': real_time_data['high_price_24h'],
+                'low_24h': real_time_data['low_price_24h'],
+                'volume_24h': real_time_data['volume_24h'],
+            },
+        }
+        depth = real_time_data.get('order_book')
+        if depth:
+            # 本地盘口的深度指标：前 levels 档的深度加权中间价和买卖盘不平衡度，中间价上下 liquidity_percent% 的挂单金额
+            payload['order_book'] = {
+                'spread': round(depth['spread'], 8),
+                'weighted_mid': round(depth['weighted_mid'], 2) if depth['weighted_mid'] is not None else None,
+                'imbalance': round(depth['imbalance'], 3) if depth['imbalance'] is not None else None,
+                'levels': depth['levels'],
+                'liquidity_percent': depth['liquidity_percent'],
+                'bid_notional': round(depth['bid_notional_within'], 2),
+                'ask_notional': round(depth['ask_notional_within'], 2),
+            }
+        summary = f"{symbol} 现价 {price} USDT，24小时 {change_percent:+}%"
+
+        strategy = section['strategy'] if section else None
+        if strategy is not None:
+            stop_loss, take_profit = self.exit_prices(strategy)
+            payload['strategy'] = {
+                'regime': strategy['市场状态'],
+                'direction': strategy['方向判断'],
+                'action': strategy['建议操作'],
+                'score': strategy['综合得分'],
+                'strength': strategy['信号强度'],
+                'confidence': strategy['置信度'],
+                'support': [strategy['支撑位1'], strategy['支撑位2']],
+                'resistance': [strategy['压力位1'], strategy['压力位2']],
+                'stop_loss': stop_loss,
+                'take_profit': take_profit,
+                'risk_reward': strategy['风险收益比'],
+                'position': strategy['仓位建议'],
+                # 正数看多、负数看空
+                'signals': {name: round(float(score), 1) for name, score in strategy.get('指标详情', {}).items()},
+            }
+            summary += f"；{strategy['市场状态']}，{strategy['方向判断']}，建议{strategy['建议操作']}" \
+                       f"（信号{strategy['信号强度']}，置信度 {strategy['置信度']:.0%}），" \
+                       f"支撑 {strategy['支撑位1']}，压力 {strategy['压力位1']}，止损 {stop_loss}，止盈 {take_profit}"
+
+        charts = {name: path for name, path in (('price', chart and chart['image']),
+                                                ('indicators', section and section['indicator_image'])) if path}
+        if charts:
+            payload['charts'] = charts
+        pending = [name for name, done in (('strategy', section), ('price_chart', chart)) if done is None]
+        if section is not None and section.get('history') is not None:
+            pending.append('indicator_chart')
+        if pending:
+            payload['pending'] = pending
+        messages = (chart and chart['message'], section and section['message'], budget.note())
+        notes = [message.strip('*') for message in messages if message]
+        if notes:
+            payload['notes'] = notes
+        payload['time'] = updated_at
+
+        data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'),
+                          default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+        return f"{summary}。\n```json\n{data}\n```"
+
+    @staticmethod
+    def normalize_symbol(symbol):
+        """交易对符号转为大写、修正常见拼写错误并补全为 Binance 格式"""
+        symbol = symbol.strip().upper()
+        if symbol == 'BCT':
+            symbol = 'BTCUSDT'
+        if 'USDT' not in symbol:
+            symbol = f"{symbol}USDT"
+        return symbol
+
+    @traced('get_real_time_price', 'fetch_quote')
+    @serve_stale('实时行情', kind='quote')
     def fetch_real_time_price(self, symbol):
         """
         从Binance API获取实时价格数据
         """
         try:
             # 获取最新价格
-            ticker = client.get_ticker(symbol=symbol)
-            
-            # 获取订单簿深度数据
-            order_book = client.get_order_book(symbol=symbol, limit=1)
-            
-            # 构建返回数据结构
-            real_time_data = {
-                'symbol': symbol,
-                'current_price': float(ticker['lastPrice']),
-                'bid_price': float(order_book['bids'][0][0]) if order_book['bids'] else 0,
-                'ask_price': float(order_book['asks'][0][0]) if order_book['asks'] else 0,
-                'bid_quantity': float(order_book['bids'][0][1]) if order_book['bids'] else 0,
-                'ask_quantity': float(order_book['asks'][0][1]) if order_book['asks'] else 0,
-                'price_change_24h': float(ticker['priceChange']),
-                'price_change_percent_24h': float(ticker['priceChangePercent']),
-                'high_price_24h': float(ticker['highPrice']),
-                'low_price_24h': float(ticker['lowPrice']),
-                'volume_24h': float(ticker['volume']),
-                'last_trade_time': datetime.now()
-            }
+            ticker = get_client().get_ticker(symbol=symbol)
+            
+            # 获取订单簿深度数据，本地维护的盘口可用时直接读取
+            book = local_order_book(symbol)
+            order_book = book.snapshot(limit=1) if book is not None else \
+                get_client().get_order_book(symbol=symbol, limit=1)
             
-            return real_time_data
+            return self.build_real_time_data(symbol, ticker, order_book, book)
         except Exception as e:
-            # 提供更具体的错误信息
-            if 'Invalid symbol' in str(e):
-                raise ValueError(f"无效的交易对: {symbol}")
-            elif 'Connection' in str(e):
-                raise ConnectionError("网络连接失败，请检查您的网络连接")
-            else:
-                raise Exception(f"获取实时价格数据时出错: {str(e)}")
+            raise self.wrap_price_error(symbol, e)
+
+    @staticmethod
+    def build_real_time_data(symbol, ticker, order_book, book=None):
+        """由24小时行情和订单簿构建实时价格数据，book 为本地盘口时附带深度指标（order_book）"""
+        return {
+            'symbol': symbol,
+            'current_price': float(ticker['lastPrice']),
+            'bid_price': float(order_book['bids'][0][0]) if order_book['bids'] else 0,
+            'ask_price': float(order_book['asks'][0][0]) if order_book['asks'] else 0,
+            'bid_quantity': float(order_book['bids'][0][1]) if order_book['bids'] else 0,
+            'ask_quantity': float(order_book['asks'][0][1]) if order_book['asks'] else 0,
+            'price_change_24h': float(ticker['priceChange']),
+            'price_change_percent_24h': float(ticker['priceChangePercent']),
+            'high_price_24h': float(ticker['highPrice']),
+            'low_price_24h': float(ticker['lowPrice']),
+            'volume_24h': float(ticker['volume']),
+            'order_book': book.metrics() if book is not None else None,
+            'last_trade_time': datetime.now()
+        }
+
+    @staticmethod
+    def wrap_price_error(symbol, e):
+        """把获取行情时的异常转换为更具体的错误信息"""
+        if 'Invalid symbol' in str(e):
+            return ValueError(f"无效的交易对: {symbol}")
+        elif 'Connection' in str(e):
+            return ConnectionError("网络连接失败，请检查您的网络连接")
+        else:
+            return Exception(f"获取实时价格数据时出错: {str(e)}")
     
-    def fetch_recent_klines(self, symbol, limit=100, interval=Client.KLINE_INTERVAL_15MINUTE):
+    @traced('get_real_time_price', 'fetch_klines')
+    @serve_stale('K线', key=lambda symbol, limit=100, interval=KLINE_INTERVAL_15MINUTE: (symbol, interval, limit),
+                 kind='klines')
+    def fetch_recent_klines(self, symbol, limit=100, interval=KLINE_INTERVAL_15MINUTE):
         """
         获取最近的K线数据用于绘制短期走势图
         """
         try:
-            klines = client.get_klines(symbol=symbol, interval=interval, limit=limit)
-            
-            # 转换为DataFrame
-            df = pd.DataFrame(klines, columns=[
-                '开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量',
-                '收盘时间戳', '成交额', '成交笔数', '主动买入成交量', '主动买入成交额', '忽略'
-            ])
-            
-            # 转换数据类型和时间戳
-            df['开盘时间'] = pd.to_datetime(df['开盘时间戳'], unit='ms')
-            df['开盘价'] = df['开盘价'].astype(float)
-            df['收盘价'] = df['收盘价'].astype(float)
-            df['最高价'] = df['最高价'].astype(float)
-            df['最低价'] = df['最低价'].astype(float)
-            df['成交量'] = df['成交量'].astype(float)
-            
-            return df
+            # 优先读取共享K线缓冲区，避免重复下载
+            df = read_candle_ring(symbol, interval, limit, time_column='开盘时间')
+            if df is not None:
+                return df
+
+            klines = get_client().get_klines(symbol=symbol, interval=interval, limit=limit)
+
+            # 直接解析为带类型的DataFrame，只保留绘图需要的列
+            return klines_to_frame(klines, time_column='开盘时间')
         except Exception as e:
             raise Exception(f"获取K线数据失败: {str(e)}")
     
+    @traced('get_real_time_price', 'fetch_history')
+    @serve_stale('K线', key=lambda symbol: (symbol, KLINE_INTERVAL_1HOUR, 1440), kind='klines')
     def fetch_60day_historical_data(self, symbol):
         """
         获取近30天的历史数据，用于计算技术指标
         """
         try:
+            # 优先读取共享K线缓冲区，避免重复下载
+            df = read_candle_ring(symbol, KLINE_INTERVAL_1HOUR, 1440, time_column='时间')
+            if df is not None:
+                return df
+
             # 获取30天的1小时K线数据（30天 * 24小时 = 720个数据点）
-            klines = client.get_klines(symbol=symbol, interval=Client.KLINE_INTERVAL_1HOUR, limit=1440)
-            
-            # 转换为DataFrame
-            df = pd.DataFrame(klines, columns=[
-                '开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量',
-                '收盘时间戳', '成交额', '成交笔数', '主动买入成交量', '主动买入成交额', '忽略'
-            ])
-            
-            # 转换数据类型和时间戳
-            df['时间'] = pd.to_datetime(df['开盘时间戳'], unit='ms')
-            df['开盘价'] = df['开盘价'].astype(float)
-            df['收盘价'] = df['收盘价'].astype(float)
-            df['最高价'] = df['最高价'].astype(float)
-            df['最低价'] = df['最低价'].astype(float)
-            df['成交量'] = df['成交量'].astype(float)
+            klines = get_client().get_klines(symbol=symbol, interval=KLINE_INTERVAL_1HOUR, limit=1440)
             
-            return df
+            # 直接解析为带类型的DataFrame，只保留指标计算需要的列
+            return klines_to_frame(klines, time_column='时间')
         except Exception as e:
             raise Exception(f"获取历史数据失败: {str(e)}")
     
+    @traced('get_real_time_price', 'indicators')
     def calculate_technical_indicators(self, df):
         """
         计算各种技术指标
@@ -1298,51 +1730,53 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
             df['Lower_Band'] = df['MA20'] - (df['STD20'] * 2)
             
             # 计算SAR (抛物线转向指标)
-            df['SAR'] = 0.0
-            af = 0.02
-            max_af = 0.2
-            sar = df['收盘价'].iloc[0]
-            ep = df['收盘价'].iloc[0]
-            trend = 1  # 1表示上升趋势，-1表示下降趋势
-            
-            for i in range(1, len(df)):
-                if trend == 1:
-                    sar = sar + af * (ep - sar)
-                    if df['最低价'].iloc[i] < sar:
-                        trend = -1
-                        sar = ep
-                        ep = df['最低价'].iloc[i]
-                        af = 0.02
+            with span('get_real_time_price', 'indicators.sar'):
+                df['SAR'] = 0.0
+                af = 0.02
+                max_af = 0.2
+                sar = df['收盘价'].iloc[0]
+                ep = df['收盘价'].iloc[0]
+                trend = 1  # 1表示上升趋势，-1表示下降趋势
+
+                for i in range(1, len(df)):
+                    if trend == 1:
+                        sar = sar + af * (ep - sar)
+                        if df['最低价'].iloc[i] < sar:
+                            trend = -1
+                            sar = ep
+                            ep = df['最低价'].iloc[i]
+                            af = 0.02
+                        else:
+                            if df['最高价'].iloc[i] > ep:
+                                ep = df['最高价'].iloc[i]
+                                af = min(af + 0.02, max_af)
                     else:
-                        if df['最高价'].iloc[i] > ep:
+                        sar = sar + af * (ep - sar)
+                        if df['最高价'].iloc[i] > sar:
+                            trend = 1
+                            sar = ep
                             ep = df['最高价'].iloc[i]
-                            af = min(af + 0.02, max_af)
-                else:
-                    sar = sar + af * (ep - sar)
-                    if df['最高价'].iloc[i] > sar:
-                        trend = 1
-                        sar = ep
-                        ep = df['最高价'].iloc[i]
-                        af = 0.02
-                    else:
-                        if df['最低价'].iloc[i] < ep:
-                            ep = df['最低价'].iloc[i]
-                            af = min(af + 0.02, max_af)
-                df.loc[df.index[i], 'SAR'] = sar
+                            af = 0.02
+                        else:
+                            if df['最低价'].iloc[i] < ep:
+                                ep = df['最低价'].iloc[i]
+                                af = min(af + 0.02, max_af)
+                    df.loc[df.index[i], 'SAR'] = sar
             
             # 计算VOL (成交量)
             df['VOL5'] = df['成交量'].rolling(window=5).mean()
             df['VOL10'] = df['成交量'].rolling(window=10).mean()
             
             # 计算OBV (能量潮指标)
-            df['OBV'] = 0
-            for i in range(1, len(df)):
-                if df['收盘价'].iloc[i] > df['收盘价'].iloc[i-1]:
-                    df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1] + df['成交量'].iloc[i]
-                elif df['收盘价'].iloc[i] < df['收盘价'].iloc[i-1]:
-                    df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1] - df['成交量'].iloc[i]
-                else:
-                    df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1]
+            with span('get_real_time_price', 'indicators.obv'):
+                df['OBV'] = 0.0
+                for i in range(1, len(df)):
+                    if df['收盘价'].iloc[i] > df['收盘价'].iloc[i-1]:
+                        df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1] + df['成交量'].iloc[i]
+                    elif df['收盘价'].iloc[i] < df['收盘价'].iloc[i-1]:
+                        df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1] - df['成交量'].iloc[i]
+                    else:
+                        df.loc[df.index[i], 'OBV'] = df['OBV'].iloc[i-1]
             
             # OptimizedTradingStrategy类已经包含了自己的ADX和ATR计算方法
         # 这里不需要提前计算这些指标，会在分析策略时自动计算
@@ -1351,10 +1785,13 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
         except Exception as e:
             raise Exception(f"计算技术指标失败: {str(e)}")
     
+    @traced('get_real_time_price', 'render_price_chart')
+    @with_pyplot_lock
     def plot_real_time_price(self, real_time_data, recent_klines, save_path, symbol):
         """
         绘制实时价格走势图
         """
+        plt = get_pyplot()
         try:
             plt.figure(figsize=(12, 6))
             
@@ -1387,10 +1824,13 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
         except Exception as e:
             raise Exception(f"绘制实时价格图表失败: {str(e)}")
     
+    @traced('get_real_time_price', 'render_indicator_chart')
+    @with_pyplot_lock
     def plot_technical_indicators(self, df, strategy, save_path, symbol):
         """
         绘制技术指标图表
         """
+        plt = get_pyplot()
         try:
             # 创建一个包含多个子图的图表
             fig, axes = plt.subplots(4, 1, figsize=(12, 16), gridspec_kw={'height_ratios': [3, 1, 1, 1]})
@@ -1481,12 +1921,192 @@ class GetRealTimePriceTool(BaseTool, OptimizedTradingStrategy):
 | 24小时最高价 | {real_time_data['high_price_24h']} USDT |
 | 24小时最低价 | {real_time_data['low_price_24h']} USDT |
 | 24小时成交量 | {real_time_data['volume_24h']} {real_time_data['symbol'].replace('USDT', '')} |
+"""
+            depth = real_time_data.get('order_book')
+            if depth and depth['weighted_mid'] is not None:
+                percent = depth['liquidity_percent']
+                table += f"""| 深度加权中间价（前{depth['levels']}档） | {depth['weighted_mid']:.2f} USDT |
+| 买卖盘不平衡度（前{depth['levels']}档） | {depth['imbalance']:+.3f} |
+| ±{percent:g}% 内买盘挂单 | {depth['bid_notional_within']:,.0f} USDT |
+| ±{percent:g}% 内卖盘挂单 | {depth['ask_notional_within']:,.0f} USDT |
 """
             
             return table.strip()
         except Exception as e:
             raise Exception(f"格式化实时价格数据失败: {str(e)}")
 
+# ====== 异步工具 ======
+# 与同步工具同名、参数相同；网络 I/O 在后台事件循环上并发完成，
+# 之后把预取的数据交给同步工具原有的处理流程，在线程池中完成计算、绘图和结果格式化
+class AsyncExcSQLTool(ExcSQLTool):
+    def call(self, params: str, **kwargs) -> str:
+        return get_runner().run_tool(self.name, self.acall(params, **kwargs),
+                                     key=tool_flight_key(self, params, kwargs))
+
+    async def acall(self, params: str, **kwargs) -> str:
+        import json
+        runner = get_runner()
+        args = json.loads(params)
+        database = args.get('database', db_config['database'])
+        session_id = get_session_id(kwargs)
+        prefetched = {}
+        cached, _ = session_store.get(session_id, (database, normalize_sql(args['sql_input'])))
+        if cached is None:
+            db_url = get_db_url(database)
+            try:
+                # 数据补齐在单独的线程池中执行，不占用其他会话的计算线程
+                prefetched['check_and_update_data'] = await runner.run_backfill(
+                    self.check_and_update_data, runner.database.sync_engine(db_url))
+                prefetched['run_query'] = await runner.database.read_sql(args['sql_input'], db_url)
+            except Exception as e:
+                prefetched.setdefault('check_and_update_data', f"数据更新检查失败: {str(e)}，但将继续执行查询")
+                prefetched['run_query'] = e
+        return await runner.run_cpu(ExcSQLTool.call, PrefetchedView(self, prefetched), params, **kwargs)
+
+
+class AsyncARIMATool(ARIMATool):
+    def call(self, params: str, **kwargs) -> str:
+        return get_runner().run_tool(self.name, self.acall(params, **kwargs),
+                                     key=tool_flight_key(self, params, kwargs))
+
+    @serve_stale('日线', kind='daily')
+    async def afetch_history(self, symbol, limit):
+        df = read_candle_ring(symbol, KLINE_INTERVAL_1DAY, limit, time_column='日期')
+        if df is None:
+            klines = await get_runner().exchange.get_klines(symbol=symbol, interval=KLINE_INTERVAL_1DAY, limit=limit)
+            df = klines_to_frame(klines, time_column='日期', fields=('收盘价',))
+        return df
+
+    @label_stale
+    async def acall(self, params: str, **kwargs) -> str:
+        import json
+        args = json.loads(params)
+        _, symbol = self.normalize_code(args.get('b_code', 'BTC'))
+        n = args.get('n', 7)
+        cached = self.precomputed_forecast(symbol, n)
+        if cached is not None:
+            return cached
+        try:
+            history = await self.afetch_history(symbol, n * 10)
+        except Exception as e:
+            history = e
+        # ARIMA 拟合和绘图在线程池中执行
+        view = PrefetchedView(self, {'fetch_history': history, 'precomputed_forecast': None})
+        return await get_runner().run_cpu(ARIMATool.call, view, params, **kwargs)
+
+
+class AsyncGetRealTimePriceTool(GetRealTimePriceTool):
+    def call(self, params: str, **kwargs) -> str:
+        return get_runner().run_tool(self.name, self.acall(params, **kwargs),
+                                     key=tool_flight_key(self, params, kwargs))
+
+    @serve_stale('实时行情', kind='quote')
+    async def afetch_real_time_price(self, symbol):
+        exchange = get_runner().exchange
+        try:
+            book = local_order_book(symbol)
+            if book is not None:
+                ticker, order_book = await exchange.get_ticker(symbol=symbol), book.snapshot(limit=1)
+            else:
+                ticker, order_book = await asyncio.gather(exchange.get_ticker(symbol=symbol),
+                                                          exchange.get_order_book(symbol=symbol, limit=1))
+            return self.build_real_time_data(symbol, ticker, order_book, book)
+        except Exception as e:
+            raise self.wrap_price_error(symbol, e)
+
+    @serve_stale('K线', key=lambda symbol, interval, limit, *args: (symbol, interval, limit), kind='klines')
+    async def afetch_klines(self, symbol, interval, limit, time_column, error_prefix):
+        try:
+            df = read_candle_ring(symbol, interval, limit, time_column=time_column)
+            if df is None:
+                klines = await get_runner().exchange.get_klines(symbol=symbol, interval=interval, limit=limit)
+                df = klines_to_frame(klines, time_column=time_column)
+            return df
+        except Exception as e:
+            raise Exception(f"{error_prefix}: {str(e)}")
+
+    @with_priority(INTERACTIVE)
+    @label_stale
+    async def acall(self, params: str, **kwargs) -> str:
+        import json
+        args = json.loads(params)
+        symbol = self.normalize_symbol(args.get('symbol', 'BTCUSDT'))
+        with call_budget(self.deadline_for(args), self.stage_estimator) as budget:
+            # 行情、短期K线和历史K线同时请求，有收盘后预计算的结果时不再请求历史K线
+            artifact = self.precomputed_strategy(symbol)
+            optional = {
+                'fetch_recent_klines': asyncio.ensure_future(
+                    self.afetch_klines(symbol, KLINE_INTERVAL_15MINUTE, 100, '开盘时间', '获取K线数据失败')),
+            }
+            if artifact is None:
+                optional['fetch_60day_historical_data'] = asyncio.ensure_future(
+                    self.afetch_klines(symbol, KLINE_INTERVAL_1HOUR, 1440, '时间', '获取历史数据失败'))
+            quote, = await asyncio.gather(self.afetch_real_time_price(symbol), return_exceptions=True)
+            # K线最多等到剩余时间只够完成计算和绘图，超时的请求在后台继续（结果留给过期数据兜底）
+            await asyncio.wait(optional.values(), timeout=self.prefetch_timeout(budget))
+            results = {name: self.task_result(task) for name, task in optional.items()}
+            view = PrefetchedView(self, {
+                'fetch_real_time_price': quote,
+                'precomputed_strategy': artifact,
+                **results,
+            })
+            return await get_runner().run_cpu(GetRealTimePriceTool.call, view, params, **kwargs)
+
+    def stream_stages(self, args, budget):
+        """
+        流式调用：K线在后台事件循环上与行情同时请求，行情到达后即开始产出结果，
+        之后的阶段用到K线时再等待（最多等到剩余时间只够完成计算和绘图）
+        """
+        runner = get_runner()
+        symbol = self.normalize_symbol(args.get('symbol', 'BTCUSDT'))
+        artifact = self.precomputed_strategy(symbol)
+        results = {
+            'precomputed_strategy': artifact,
+            'fetch_recent_klines': runner.submit(
+                self.afetch_klines(symbol, KLINE_INTERVAL_15MINUTE, 100, '开盘时间', '获取K线数据失败')),
+        }
+        if artifact is None:
+            results['fetch_60day_historical_data'] = runner.submit(
+                self.afetch_klines(symbol, KLINE_INTERVAL_1HOUR, 1440, '时间', '获取历史数据失败'))
+        try:
+            results['fetch_real_time_price'] = runner.run(self.afetch_real_time_price(symbol))
+        except Exception as e:
+            results['fetch_real_time_price'] = e
+        view = PrefetchedView(self, results, resolve=functools.partial(self.future_result, budget))
+        return view.run_stages(args, budget)
+
+    @staticmethod
+    def prefetch_timeout(budget):
+        """等待预取K线的最长时间：剩余时间减去计算和绘图的估算耗时，不限时返回 None"""
+        if budget.seconds is None:
+            return None
+        return max(budget.remaining() - budget.estimate(
+            'render_price_chart', 'indicators', 'strategy', 'render_indicator_chart'), 0.0)
+
+    @classmethod
+    def future_result(cls, budget, future):
+        """流式调用中仍在进行的预取的结果或异常，超时返回 BudgetExceeded"""
+        try:
+            return future.exception(timeout=cls.prefetch_timeout(budget)) or future.result()
+        except concurrent.futures.TimeoutError:
+            return BudgetExceeded('时间预算不足')
+
+    @staticmethod
+    def task_result(task):
+        """预取任务的结果或异常，未完成时返回 BudgetExceeded"""
+        if not task.done():
+            # 任务之后失败时取走异常，避免事件循环打印未处理的异常
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return BudgetExceeded('时间预算不足')
+        return task.exception() or task.result()
+
+
+def create_tools():
+    """助手使用的工具实例，设置 BTC_ASYNC_TOOLS=1 时使用异步版本"""
+    if os.getenv('BTC_ASYNC_TOOLS', '0').lower() not in ('', '0', 'false', 'no'):
+        return [AsyncExcSQLTool(), AsyncARIMATool(), AsyncGetRealTimePriceTool()]
+    return [ExcSQLTool(), ARIMATool(), GetRealTimePriceTool()]
+
 # ====== 获取LLM配置的函数 ======
 def get_llm_cfg():
     """配置LLM模型参数"""
@@ -1507,15 +2127,27 @@ def init_agent_service():
     初始化比特币价格分析助手服务
     """
     try:
-        # 创建助手实例
-        bot = Assistant(
+        from qwen_agent.agents import Assistant
+
+        from btc_answer_cache import answer_cache_enabled, with_answer_cache
+        from btc_streaming import StreamingAssistant, streaming_enabled
+        configure_dashscope()
+        # 创建助手实例，默认分阶段展示工具结果（见 btc_streaming）
+        agent_class = StreamingAssistant if streaming_enabled() else Assistant
+        if answer_cache_enabled():
+            # 相同或换了说法的首个问题直接返回缓存的回答（见 btc_answer_cache）
+            agent_class = with_answer_cache(agent_class)
+        bot = agent_class(
             llm=get_llm_cfg(),
             name='比特币分析助手',
             description='比特币价格数据查询、实时价格和预测分析',
             system_message=system_prompt,
             # 包含所有需要的工具实例
-            function_list=[ExcSQLTool(), ARIMATool(), GetRealTimePriceTool()],
+            function_list=create_tools(),
         )
+        if metrics_enabled():
+            # 记录大模型首个分片和整体耗时
+            instrument_llm(bot.llm)
         print("比特币价格分析助手初始化成功！")
         print("已启用功能：")
         print("1. SQL查询与数据可视化")
@@ -1530,9 +2162,21 @@ def app_gui():
     """
     启动Web图形界面模式
     """
+    from qwen_agent.gui import WebUI
     try:
         bot = init_agent_service()
         
+        # 启动 1 分钟数据源和多周期重采样
+        start_timeframe_feeds()
+        start_order_books()
+        # 关注列表中的交易对在K线收盘后预先计算技术指标、图表和预测
+        start_precompute()
+
+        if metrics_enabled():
+            # 各阶段耗时、缓存命中和外部调用次数通过 /metrics 导出
+            metrics_server = start_metrics_server()
+            print(f"指标端点: http://127.0.0.1:{metrics_server.server_address[1]}/metrics")
+        
         chatbot_config = {
             'title': '比特币价格分析助手',
             'description': '提供实时比特币价格、技术指标分析和交易策略建议',
@@ -1558,22 +2202,64 @@ def app_gui():
         print("请检查网络连接和 API Key 配置")
 
 
+def app_batch(args):
+    """
+    无界面批量模式：不启动 WebUI 和大模型，直接调用工具（见 btc_batch）
+    """
+    import btc_batch
+
+    print("启动批量分析模式...")
+    return btc_batch.run(args, create_tools())
+
+
+def app_api(args):
+    """
+    启动本地 HTTP 接口（见 btc_api），看板、告警等程序直接获取工具结果，不经过大模型
+    """
+    from btc_api import start_api_server
+
+    # 与 Web 界面相同：1 分钟数据源、多周期重采样、本地订单簿和收盘后预计算
+    start_timeframe_feeds()
+    start_order_books()
+    start_precompute()
+    server = start_api_server(create_tools(), args.port, args.host)
+    host, port = server.server_address[:2]
+    print(f"HTTP 接口已启动: http://{host}:{port}/price?symbol=BTCUSDT")
+    threading.Event().wait()
+
+
 def main():
-    """主函数，提供终端和Web界面两种模式"""
+    """主函数，提供 Web 界面、本地 HTTP 接口和无界面批量分析三种模式"""
+    import argparse
+
+    import btc_batch
+
+    parser = argparse.ArgumentParser(description='比特币价格分析助手')
+    subparsers = parser.add_subparsers(dest='mode')
+    subparsers.add_parser('web', help='启动 Web 图形界面（默认）')
+    batch_parser = subparsers.add_parser('batch', help='不启动 Web 界面和大模型，批量执行工具并输出 JSON / Parquet')
+    btc_batch.add_arguments(batch_parser)
+    api_parser = subparsers.add_parser('api', help='不启动 Web 界面和大模型，提供价格、策略、预测和SQL的 HTTP 接口')
+    api_parser.add_argument('--host', default=None, help='监听地址（默认 BTC_API_HOST 或 127.0.0.1）')
+    api_parser.add_argument('--port', type=int, default=None, help='监听端口（默认 BTC_API_PORT 或 8787）')
+    args = parser.parse_args()
+
     print("比特币价格分析助手启动中...")
-    choice = 2  # 默认启动Web图形界面模式
     try:
-        if choice == 1:
-            print("启动终端交互模式...")
-            print("终端模式暂未实现")
-        else:
-            print("启动Web图形界面模式...")
-            app_gui()
+        if args.mode == 'batch':
+            return app_batch(args)
+        if args.mode == 'api':
+            print("启动 HTTP 接口模式...")
+            return app_api(args)
+        print("启动Web图形界面模式...")
+        app_gui()
     except KeyboardInterrupt:
         print("\n程序被用户中断，退出...")
     except Exception as e:
         print(f"程序运行时出错: {str(e)}")
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+问题级答案缓存
+很多用户直接点击 prompt.suggestions 中的示例问题，或者只是换个说法（加"请"、标点、BTC/比特币混用），
+每次都要完整地调用大模型和工具。AnswerCache 按规范化后的问题文本缓存助手的完整回答，
+可选地再按向量相似度匹配换了说法的问题。向量只负责排序，命中还要求两个问题去掉虚词后用到的字及其次数完全相同，
+数字按出现顺序逐个相同："最高价" 不会命中 "最低价"，"2032年" 不会命中 "2023年"，"100天" 不会命中 "10天"，
+BTC 不会命中 ETH
+
+只缓存对话的第一个问题（追问依赖上下文）。回答按用到的工具决定失效方式：
+- 调用了 get_real_time_price：含实时行情，live_ttl 秒后失效
+- 只调用了 exc_sql / arima_stock：基于日线数据，数据水位（最近收盘的日线，即每日数据同步的时间点）变化后失效
+- 没有调用工具：ttl 秒后失效
+工具返回错误的回答不缓存
+
+该模块不导入 qwen_agent，with_answer_cache() 为任意 Assistant 类加上缓存
+
+环境变量:
+    BTC_ANSWER_CACHE            设为 0 关闭答案缓存（默认 1）
+    BTC_ANSWER_EMBEDDING        相似问题匹配：空为只做文本规范化匹配（默认），ngram 为内置的字符 n-gram 向量，
+                                其他值作为 sentence-transformers 本地模型的名称或路径
+    BTC_ANSWER_SIMILARITY       相似度阈值（默认 0.6）
+    BTC_ANSWER_LIVE_TTL         含实时行情的回答的有效期（秒，默认 60）
+    BTC_ANSWER_TTL              其他回答的最长有效期（秒，默认 86400）
+    BTC_ANSWER_CACHE_SIZE       最多缓存的回答数（默认 512）
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from btc_batch import tool_error
+from btc_metrics import record_cache
+from btc_session_store import content_text, message_field
+from btc_timeframes import bucket_start
+
+LIVE_TOOLS = ('get_real_time_price',)
+# 同义写法统一为一种（先替换长的）
+SYNONYMS = (('btcusdt', '比特币'), ('bitcoin', '比特币'), ('btc', '比特币'), ('价钱', '价格'))
+# 不影响问题含义的客套和语气词
+FILLERS = re.compile(r'请问|请|帮我|帮忙|麻烦|给我|一下|谢谢|吗|呢|吧|啊')
+NON_WORD = re.compile(r'[\W_]+')
+DIGITS = re.compile(r'\d+')
+# 换说法时常增删、不改变问题内容的字（虚词、疑问词和 "查询"、"分析" 一类的动词）
+STOP_CHARS = frozenset('的了和与及并且是多少什么怎么样如何查询看分析获取使用用告诉出')
+
+
+def answer_cache_enabled():
+    return os.getenv('BTC_ANSWER_CACHE', '1').lower() not in ('', '0', 'false', 'no')
+
+
+def normalize_question(text):
+    """全角转半角、小写、统一同义写法，去掉客套语气词、空白和标点"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    for word, replacement in SYNONYMS:
+        text = text.replace(word, replacement)
+    return NON_WORD.sub('', FILLERS.sub('', text))
+
+
+def content_chars(key):
+    """规范化问题中决定问题内容的部分：(按顺序的数字串, 数字以外的字及其次数)"""
+    return (tuple(DIGITS.findall(key)),
+            Counter(char for char in DIGITS.sub('', key) if char not in STOP_CHARS))
+
+
+def data_watermark():
+    """历史数据的水位：最近一根已收盘日线的收盘时间，每日数据同步后变化"""
+    return bucket_start(int(time.time() * 1000), '1d')
+
+
+def ngram_embedding(text, dim=512):
+    """内置的字符 1-gram + 2-gram 哈希向量（L2 归一化），不依赖任何模型"""
+    vector = np.zeros(dim)
+    grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode('utf-8')).digest()
+        vector[int.from_bytes(digest[:4], 'little') % dim] += 1.0 if len(gram) == 1 else 2.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def load_embedding(name):
+    """按 BTC_ANSWER_EMBEDDING 返回向量函数 text -> 归一化向量，未配置或模型不可用时返回 None"""
+    if not name:
+        return None
+    if name == 'ngram':
+        return ngram_embedding
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(name)
+    except Exception as e:
+        print(f"加载问题向量模型 {name} 失败，只使用文本匹配: {str(e)}")
+        return None
+    return lambda text: np.asarray(model.encode(text, normalize_embeddings=True), dtype=float)
+
+
+class AnswerCache:
+    def __init__(self, embed=None, similarity=None, live_ttl=None, ttl=None, max_entries=None, watermark=None):
+        self.embed = embed
+        self.similarity = float(similarity or os.getenv('BTC_ANSWER_SIMILARITY', '0.6'))
+        self.live_ttl = float(live_ttl if live_ttl is not None else os.getenv('BTC_ANSWER_LIVE_TTL', '60'))
+        self.ttl = float(ttl if ttl is not None else os.getenv('BTC_ANSWER_TTL', '86400'))
+        self.max_entries = int(max_entries or os.getenv('BTC_ANSWER_CACHE_SIZE', '512'))
+        self.watermark = watermark or data_watermark
+        # 规范化问题 -> {'key', 'response', 'expires', 'watermark', 'chars', 'vector'}，按最近使用排序
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'exact': 0, 'similar': 0, 'miss': 0, 'stored': 0, 'skipped': 0}
+
+    def _valid(self, entry, now):
+        return now < entry['expires'] and (entry['watermark'] is None or entry['watermark'] == self.watermark())
+
+    def get(self, question):
+        """返回缓存的回答（消息列表的副本），没有时返回 None"""
+        key = normalize_question(question)
+        vector = None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            kind = 'exact'
+            if entry is not None and not self._valid(entry, now):
+                self._entries.pop(key)
+                entry = None
+            if entry is None and self.embed is not None and self._entries:
+                vector = self.embed(key)
+                entry = self._nearest(vector, content_chars(key), now)
+                kind = 'similar'
+            if entry is not None:
+                self._entries.move_to_end(entry['key'])
+            self.stats[kind if entry is not None else 'miss'] += 1
+        record_cache('answer', entry is not None)
+        return copy.deepcopy(entry['response']) if entry is not None else None
+
+    def _nearest(self, vector, chars, now):
+        best, best_score = None, self.similarity
+        for entry in self._entries.values():
+            if entry['chars'] != chars or not self._valid(entry, now):
+                continue
+            score = float(np.dot(vector, entry['vector']))
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def put(self, question, response):
+        """按回答中用到的工具决定有效期后保存；工具返回错误或回答为空时不保存"""
+        functions = [message for message in response if message_field(message, 'role') == 'function']
+        answer = response[-1] if response else None
+        if (answer is None or message_field(answer, 'role') != 'assistant'
+                or not content_text(message_field(answer, 'content')).strip()
+                or any(tool_error(content_text(message_field(message, 'content'))) for message in functions)):
+            with self._lock:
+                self.stats['skipped'] += 1
+            return False
+        tools = {message_field(message, 'name') for message in functions}
+        now = time.time()
+        key = normalize_question(question)
+        entry = {
+            'key': key,
+            'response': copy.deepcopy(list(response)),
+            'expires': now + (self.live_ttl if tools & set(LIVE_TOOLS) else self.ttl),
+            'watermark': self.watermark() if tools and not tools & set(LIVE_TOOLS) else None,
+            'chars': content_chars(key),
+            'vector': self.embed(key) if self.embed is not None else None,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stats['stored'] += 1
+        return True
+
+    def hit_rate(self):
+        with self._lock:
+            hits = self.stats['exact'] + self.stats['similar']
+            total = hits + self.stats['miss']
+        return hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def first_question(messages):
+    """对话只有一个用户问题（没有之前的回答）时返回问题文本，否则返回 None"""
+    roles = [message_field(message, 'role') for message in messages]
+    if roles.count('user') != 1 or any(role in ('assistant', 'function') for role in roles):
+        return None
+    user = next(message for message in messages if message_field(message, 'role') == 'user')
+    return content_text(message_field(user, 'content')).strip() or None
+
+
+class AnswerCacheMixin:
+    """Assistant 的混入类：对话第一个问题命中缓存时直接返回缓存的回答，否则照常运行并保存回答"""
+
+    answer_cache = None
+
+    def _run(self, messages, **kwargs):
+        question = first_question(messages)
+        cache = self.answer_cache
+        if question is None or cache is None:
+            yield from super()._run(messages, **kwargs)
+            return
+        cached = cache.get(question)
+        if cached is not None:
+            yield cached
+            return
+        response = None
+        for response in super()._run(messages, **kwargs):
+            yield response
+        if response:
+            cache.put(question, response)
+
+
+def with_answer_cache(agent_class, cache=None):
+    """返回带答案缓存的 agent_class 子类，cache 默认为模块共享的 answer_cache"""
+    return type(f'Cached{agent_class.__name__}', (AnswerCacheMixin, agent_class),
+                {'answer_cache': cache if cache is not None else get_answer_cache()})
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(embed=load_embedding(os.getenv('BTC_ANSWER_EMBEDDING', '')))
+    return _answer_cache
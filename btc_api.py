@@ -0,0 +1,292 @@
+"""
+本地 HTTP 接口
+看板、告警等程序直接获取工具的计算结果，不经过大模型：
+
+    GET /price?symbol=BTCUSDT       实时价格和策略摘要（get_real_time_price 的 compact JSON）
+    GET /strategy?symbol=BTCUSDT    交易策略分析和技术指标图表
+    GET /forecast?b_code=BTC&n=7    ARIMA 预测报告（markdown）
+    GET /sql?q=SELECT ...           只读SQL查询结果（markdown 表格和图表）
+    GET /btc_images/<文件名>         工具生成的图表
+    GET /healthz
+
+缓存：strategy、forecast、sql 的结果只取决于最近收盘的K线（1小时、日线、日线），
+响应按 (接口, 参数, 收盘时间) 缓存到下一次收盘，ETag 由这三项得出，Cache-Control 的 max-age 为距下一次收盘的秒数；
+请求带有相同的 If-None-Match 时直接返回 304，不调用工具。price 含实时行情，ETag 由响应内容得出，
+Cache-Control 为 no-cache。图表按内容寻址（见 btc_chart_store），文件名不变内容就不变，可长期缓存
+
+并发：ThreadingHTTPServer 每个请求一个线程，同一个缓存键同时只计算一次，相同的工具调用在工具层合并
+
+离线运行：BTC_EXCHANGE_MODE=replay 回放录制的交易所数据，BTC_DB_URL 指向 SQLite，
+压测见 benchmarks/bench_http_api.py（FakeClient + 临时 SQLite）
+
+环境变量:
+    BTC_API_HOST        监听地址（默认 127.0.0.1）
+    BTC_API_PORT        监听端口（默认 8787）
+    BTC_API_CACHE_SIZE  响应缓存条目数（默认 256）
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from btc_batch import parse_compact, tool_error
+from btc_candle_ring import INTERVAL_MS
+from btc_chart_store import chart_store
+from btc_metrics import record_cache
+from btc_singleflight import SingleFlight
+from btc_timeframes import bucket_start
+
+READ_ONLY_SQL = ('select', 'with', 'show', 'describe', 'explain')
+# 以只读关键字开头但会写文件、写表、加锁或修改数据的写法（SELECT ... INTO OUTFILE、FOR UPDATE、WITH ... DELETE 等）
+WRITE_SQL = re.compile(
+    r'\b(into|for\s+update|for\s+share|lock\s+in\s+share\s+mode|insert|update|delete|create|drop|'
+    r'alter|truncate|rename|grant|revoke|load|call|do|handler|set|lock|unlock|sleep|benchmark|get_lock)\b', re.I)
+SQL_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`")
+SQL_COMMENT = re.compile(r'--|#|/\*')
+CHART_CONTENT_TYPES = {'.png': 'image/png', '.svg': 'image/svg+xml', '.json': 'application/json'}
+
+
+def read_only_sql(sql):
+    """只读查询时返回 None，否则返回拒绝的原因；先去掉字符串和带引号的标识符，注释一律拒绝（MySQL 会执行 /*! */ 中的内容）"""
+    if sql.split(None, 1)[0].lower() not in READ_ONLY_SQL:
+        return "只支持只读查询（SELECT、WITH、SHOW、DESCRIBE、EXPLAIN）"
+    code = SQL_STRING.sub("''", sql)
+    if ';' in code.rstrip().rstrip(';'):
+        return "只支持单条查询"
+    if SQL_COMMENT.search(code):
+        return "查询中不能包含注释"
+    match = WRITE_SQL.search(code)
+    if match:
+        return f"只读查询中不能使用 {match.group(0).upper()}"
+    return None
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """按收盘时间失效的响应缓存，LRU 淘汰；同一个键同时只计算一次"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = int(max_entries or os.getenv('BTC_API_CACHE_SIZE', '256'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(window=0, enabled=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._entries.pop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache('api', entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, key, body, expires_at):
+        with self._lock:
+            self._entries[key] = (body, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, expires_at, compute):
+        body = self.get(key)
+        if body is not None:
+            return body
+
+        def run():
+            body = self.get(key)
+            if body is None:
+                body = compute()
+                self.put(key, body, expires_at)
+            return body
+        return self._flight.do(('api',) + key, run)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class AnalysisApi:
+    """
+    请求处理逻辑，与 HTTP 服务分开以便直接调用
+    handle() 返回 (状态码, 响应头, 响应体)
+    """
+
+    # 各接口结果所依赖的K线周期，None 表示含实时数据、不按收盘时间缓存
+    ENDPOINT_INTERVALS = {'price': None, 'strategy': '1h', 'forecast': '1d', 'sql': '1d'}
+
+    def __init__(self, tools, cache=None):
+        # 工具名 -> 工具实例（ExcSQLTool、ARIMATool、GetRealTimePriceTool 或其异步版本）
+        self.tools = {tool.name: tool for tool in tools}
+        self.cache = cache if cache is not None else ResponseCache()
+
+    def handle(self, path, query, headers):
+        try:
+            if path == '/healthz':
+                return 200, {'Cache-Control': 'no-cache'}, {'status': 'ok'}
+            if path.startswith('/btc_images/'):
+                return self.chart(path[len('/btc_images/'):], headers)
+            endpoint = path.strip('/')
+            if endpoint not in self.ENDPOINT_INTERVALS:
+                raise ApiError(404, f"未知接口: {path}")
+            params = self.params(endpoint, query)
+            interval = self.ENDPOINT_INTERVALS[endpoint]
+            if interval is None:
+                return self.live(endpoint, params, headers)
+            return self.cached(endpoint, params, interval, headers)
+        except ApiError as e:
+            return e.status, {'Cache-Control': 'no-cache'}, {'error': str(e)}
+        except Exception as e:
+            print(f"接口 {path} 处理失败: {str(e)}")
+            return 500, {'Cache-Control': 'no-cache'}, {'error': f"{type(e).__name__}: {str(e)}"}
+
+    @staticmethod
+    def params(endpoint, query):
+        """校验并规范化请求参数，返回参数字典（参与缓存键和 ETag）"""
+        def first(name, default=None):
+            values = query.get(name)
+            return values[0].strip() if values and values[0].strip() else default
+
+        if endpoint in ('price', 'strategy'):
+            return {'symbol': first('symbol', 'BTCUSDT').upper()}
+        if endpoint == 'forecast':
+            try:
+                n = int(first('n', '7'))
+            except ValueError:
+                raise ApiError(400, "n 必须是整数")
+            if not 1 <= n <= 60:
+                raise ApiError(400, "n 的范围为 1~60")
+            return {'b_code': first('b_code', 'BTC').upper(), 'n': n}
+        sql = first('q')
+        if sql is None:
+            raise ApiError(400, "缺少参数 q")
+        reason = read_only_sql(sql)
+        if reason is not None:
+            raise ApiError(400, reason)
+        return {'sql': sql}
+
+    def call_tool(self, endpoint, params):
+        """调用工具并整理为响应体，工具返回错误描述时抛出 ApiError(502)"""
+        if endpoint in ('price', 'strategy'):
+            result = self.tools['get_real_time_price'].call(json.dumps(
+                {'symbol': params['symbol'], 'output': 'compact'}, ensure_ascii=False))
+            data = parse_compact(result)
+            if data is None:
+                raise ApiError(502, result)
+            if endpoint == 'price':
+                return {'summary': result.split('\n', 1)[0], **data}
+            if 'strategy' not in data:
+                raise ApiError(502, '; '.join(data.get('notes', [])) or '交易策略分析未完成')
+            return {'symbol': data['symbol'], 'strategy': data['strategy'],
+                    'charts': {name: path for name, path in data.get('charts', {}).items() if name == 'indicators'},
+                    'time': data['time']}
+        if endpoint == 'forecast':
+            result = self.tools['arima_stock'].call(json.dumps(params, ensure_ascii=False))
+        else:
+            # 不传会话：各客户端的结果互不复用，重复请求由 ResponseCache 处理
+            result = self.tools['exc_sql'].call(json.dumps({'sql_input': params['sql']}, ensure_ascii=False))
+        if tool_error(result):
+            raise ApiError(502, result)
+        return {**params, 'report': result}
+
+    def live(self, endpoint, params, headers):
+        body = encode(self.call_tool(endpoint, params))
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in if_none_match(headers):
+            return 304, response_headers, None
+        return 200, response_headers, body
+
+    def cached(self, endpoint, params, interval, headers):
+        now_ms = int(time.time() * 1000)
+        close_ms = bucket_start(now_ms, interval)
+        expires_ms = close_ms + INTERVAL_MS[interval]
+        key = (endpoint, json.dumps(params, sort_keys=True, ensure_ascii=False), close_ms)
+        etag = '"' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:20] + '"'
+        response_headers = {
+            'ETag': etag,
+            'Cache-Control': f"public, max-age={max(0, (expires_ms - now_ms) // 1000)}",
+            'Last-Modified': http_date(close_ms),
+        }
+        if etag in if_none_match(headers):
+            record_cache('api', True)
+            return 304, response_headers, None
+        body = self.cache.get_or_compute(key, expires_ms / 1000, lambda: encode(self.call_tool(endpoint, params)))
+        return 200, response_headers, body
+
+    @staticmethod
+    def chart(name, headers):
+        path = os.path.join(chart_store.root, name)
+        if '/' in name or '\\' in name or name.startswith('.') or not os.path.isfile(path):
+            raise ApiError(404, f"图表不存在: {name}")
+        # 文件名包含内容哈希，内容不会变化
+        response_headers = {'ETag': f'"{name}"', 'Cache-Control': 'public, max-age=31536000, immutable',
+                            'Content-Type': CHART_CONTENT_TYPES.get(os.path.splitext(name)[1],
+                                                                    'application/octet-stream')}
+        if f'"{name}"' in if_none_match(headers):
+            return 304, response_headers, None
+        with open(path, 'rb') as f:
+            return 200, response_headers, f.read()
+
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def if_none_match(headers):
+    value = headers.get('If-None-Match') or ''
+    return {item.strip().removeprefix('W/') for item in value.split(',') if item.strip()}
+
+
+def http_date(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    api = None
+    protocol_version = 'HTTP/1.1'
+    # 长连接上响应头和响应体分两次发送，关闭 Nagle 避免与客户端的延迟确认叠加出 40ms 的等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, headers, body = self.api.handle(url.path, parse_qs(url.query), self.headers)
+        if isinstance(body, dict):
+            body = encode(body)
+        self.send_response(status)
+        if 'Content-Type' not in headers and body is not None:
+            headers = {**headers, 'Content-Type': 'application/json; charset=utf-8'}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body) if body is not None else 0))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_api_server(tools, port=None, host=None):
+    """在后台线程启动 HTTP 接口，返回 HTTP 服务实例（server.api 为 AnalysisApi）"""
+    host = host or os.getenv('BTC_API_HOST', '127.0.0.1')
+    port = int(port if port is not None else os.getenv('BTC_API_PORT', '8787'))
+    api = AnalysisApi(tools)
+    handler = type('ApiHandler', (_ApiHandler,), {'api': api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, name='api-server', daemon=True).start()
+    return server
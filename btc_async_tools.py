@@ -0,0 +1,331 @@
+"""
+异步工具执行基础设施
+同步工具在 WebUI 中按请求逐个执行，一个会话的数据补齐或 ARIMA 拟合会拖慢其他会话。
+异步版本的工具在一个后台事件循环上并发完成网络 I/O（有 aiohttp / 异步数据库驱动时直接使用，
+否则放到 I/O 线程池），CPU 密集的计算和绘图交给线程池，数据补齐使用单独的线程池，
+每个工具有独立的并发上限，排队过多时直接返回繁忙提示，形成背压
+
+环境变量:
+    BTC_ASYNC_LIMITS       各工具的并发上限，如 exc_sql=4,arima_stock=2,get_real_time_price=8
+    BTC_ASYNC_MAX_WAITING  每个工具最多排队的请求数（默认 32）
+    BTC_ASYNC_CPU_WORKERS  计算和绘图线程数（默认 CPU 核数）
+    BTC_BINANCE_API        异步 HTTP 请求使用的交易所地址
+"""
+import asyncio
+import contextvars
+import functools
+import importlib.util
+import inspect
+import os
+import threading
+import time
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from btc_circuit_breaker import get_breaker
+from btc_metrics import record_external_call
+from btc_singleflight import tool_flight
+from btc_weight_governor import current_priority, get_governor, governor_enabled
+
+DEFAULT_LIMITS = {'exc_sql': 4, 'arima_stock': 2, 'get_real_time_price': 8}
+DEFAULT_MAX_WAITING = int(os.getenv('BTC_ASYNC_MAX_WAITING', '32'))
+BINANCE_API = os.getenv('BTC_BINANCE_API', 'https://api.binance.com')
+
+
+def parse_limits(text):
+    limits = dict(DEFAULT_LIMITS)
+    for item in (text or '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+def module_available(name):
+    return importlib.util.find_spec(name) is not None
+
+
+class ToolBusyError(Exception):
+    """工具排队的请求超过上限"""
+
+
+class PrefetchedView:
+    """
+    同步工具的单次调用视图：指定的数据获取方法直接返回异步预取的结果（预取失败时抛出当时的异常），
+    其余属性转发给工具实例，方法重新绑定到视图上（方法内部再调用数据获取方法时同样使用预取结果），
+    因此同步工具的处理流程和错误处理可以原样复用
+    预取结果也可以是仍在进行的 Future（流式调用），用到时由 resolve(future) 等待得到结果或异常
+    """
+
+    # 异步调用在进入事件循环前已经按相同的键合并过
+    single_flight = False
+
+    def __init__(self, tool, results, resolve=None):
+        self._tool = tool
+        self._results = results
+        self._resolve = resolve or (lambda future: future.exception() or future.result())
+
+    def __getattr__(self, name):
+        results = self.__dict__['_results']
+        if name in results:
+            def prefetched(*args, **kwargs):
+                result = results[name]
+                if isinstance(result, Future):
+                    result = results[name] = self.__dict__['_resolve'](result)
+                if isinstance(result, BaseException):
+                    raise result
+                return result
+            return prefetched
+        tool = self.__dict__['_tool']
+        attr = getattr(tool, name)
+        if isinstance(attr, types.MethodType) and attr.__self__ is tool:
+            return types.MethodType(attr.__func__, self)
+        return attr
+
+
+class _ToolLimit:
+    """单个工具的并发上限和排队计数"""
+
+    def __init__(self, limit, max_waiting):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.rejected = 0
+
+
+class AsyncExchange:
+    """
+    异步交易所接口，方法名和参数与 binance.Client 相同
+    直连模式且安装了 aiohttp 时直接请求交易所 REST 接口；
+    注入了客户端（FakeClient、回放等）或没有 aiohttp 时，在 I/O 线程池中调用同步客户端
+    """
+
+    def __init__(self, runner, base_url=BINANCE_API):
+        self.runner = runner
+        self.base_url = base_url.rstrip('/')
+        self._session = None
+
+    def use_http(self):
+        from btc_exchange import client_injected
+
+        return (module_available('aiohttp') and not client_injected()
+                and os.getenv('BTC_EXCHANGE_MODE', 'live').lower() == 'live')
+
+    async def _http_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
+
+    async def _get(self, endpoint, path, params):
+        session = await self._http_session()
+        params = {key: value for key, value in params.items() if value is not None}
+        governor = get_governor() if governor_enabled() else None
+        if governor is not None:
+            # 额度不足时在 I/O 线程中排队，不阻塞事件循环
+            await self.runner.run_io(governor.acquire, endpoint, None, current_priority(), params)
+        breaker = get_breaker()
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            async with session.get(self.base_url + path, params=params) as response:
+                data = await response.json(content_type=None)
+                if governor is not None:
+                    governor.update_from_headers(response.headers,
+                                                 status=response.status if response.status in (418, 429) else None)
+                if response.status != 200:
+                    # 与 python-binance 的 APIError 格式一致，工具按消息内容判断错误类型
+                    error = Exception(f"APIError(code={data.get('code')}): {data.get('msg')}")
+                    error.status_code = response.status
+                    raise error
+        except Exception as e:
+            breaker.after_call(e)
+            raise
+        breaker.after_call()
+        record_external_call('binance', endpoint, time.perf_counter() - started)
+        return data
+
+    async def _threaded(self, endpoint, **kwargs):
+        from btc_exchange import get_client
+
+        return await self.runner.run_io(functools.partial(getattr(get_client(), endpoint), **kwargs))
+
+    async def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None):
+        if not self.use_http():
+            return await self._threaded('get_klines', symbol=symbol, interval=interval, limit=limit,
+                                        startTime=startTime, endTime=endTime)
+        return await self._get('get_klines', '/api/v3/klines', {
+            'symbol': symbol, 'interval': interval, 'limit': limit, 'startTime': startTime, 'endTime': endTime,
+        })
+
+    async def get_ticker(self, symbol):
+        if not self.use_http():
+            return await self._threaded('get_ticker', symbol=symbol)
+        return await self._get('get_ticker', '/api/v3/ticker/24hr', {'symbol': symbol})
+
+    async def get_order_book(self, symbol, limit=100):
+        if not self.use_http():
+            return await self._threaded('get_order_book', symbol=symbol, limit=limit)
+        return await self._get('get_order_book', '/api/v3/depth', {'symbol': symbol, 'limit': limit})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class AsyncDatabase:
+    """
+    SQL 查询：安装了 aiomysql / aiosqlite 时使用 SQLAlchemy 异步引擎，否则在 I/O 线程池中执行
+    引擎按连接串缓存复用，不再每次调用都创建
+    """
+
+    ASYNC_DRIVERS = (
+        ('mysql+pymysql://', 'mysql+aiomysql://', 'aiomysql'),
+        ('sqlite:///', 'sqlite+aiosqlite:///', 'aiosqlite'),
+    )
+
+    def __init__(self, runner):
+        self.runner = runner
+        self._engines = {}
+        self._async_engines = {}
+        self._lock = threading.Lock()
+
+    def sync_engine(self, url):
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                from sqlalchemy import create_engine
+
+                engine = self._engines[url] = create_engine(url)
+            return engine
+
+    def async_url(self, url):
+        for prefix, async_prefix, driver in self.ASYNC_DRIVERS:
+            if url.startswith(prefix) and module_available(driver):
+                return async_prefix + url[len(prefix):]
+        return None
+
+    async def read_sql(self, sql, url):
+        import pandas as pd
+
+        started = time.perf_counter()
+        async_url = self.async_url(url)
+        if async_url is None:
+            df = await self.runner.run_io(pd.read_sql, sql, self.sync_engine(url))
+        else:
+            engine = self._async_engines.get(async_url)
+            if engine is None:
+                from sqlalchemy.ext.asyncio import create_async_engine
+
+                engine = self._async_engines[async_url] = create_async_engine(async_url)
+            async with engine.connect() as conn:
+                df = await conn.run_sync(lambda sync_conn: pd.read_sql(sql, sync_conn))
+        record_external_call('mysql', 'query', time.perf_counter() - started)
+        return df
+
+
+class AsyncToolRunner:
+    """
+    后台事件循环 + 线程池
+    同步调用方（qwen_agent 调用 tool.call）通过 run() 提交协程并等待结果，
+    异步调用方通过 arun() 等待，同一时刻可以有多个会话的工具调用在事件循环上交错执行
+    """
+
+    def __init__(self, limits=None, max_waiting=DEFAULT_MAX_WAITING, cpu_workers=None, io_workers=16):
+        self.limits_config = limits or parse_limits(os.getenv('BTC_ASYNC_LIMITS'))
+        self.max_waiting = max_waiting
+        cpu_workers = cpu_workers or int(os.getenv('BTC_ASYNC_CPU_WORKERS', '0')) or os.cpu_count() or 4
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix='tool-cpu')
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='tool-io')
+        # 数据补齐耗时长且会请求交易所，同一时刻只运行一个
+        self.backfill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tool-backfill')
+        self.loop = asyncio.new_event_loop()
+        self._limits = {}
+        self._thread = threading.Thread(target=self.loop.run_forever, name='tool-event-loop', daemon=True)
+        self._thread.start()
+        self.exchange = AsyncExchange(self)
+        self.database = AsyncDatabase(self)
+
+    # ---------- 提交协程 ----------
+    def run(self, coro):
+        """在后台事件循环上执行协程并阻塞等待结果（供同步的 tool.call 使用）"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在工具事件循环内部同步等待，请使用 await")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, coro):
+        """在后台事件循环上启动协程，不等待，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def arun(self, coro):
+        """在其他事件循环中等待后台事件循环上的协程"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def run_tool(self, tool_name, coro, key=None):
+        """
+        带并发上限执行工具协程，排队过多时返回繁忙提示
+        给出合并键时，与正在执行的相同调用共享结果（见 btc_singleflight），等待期间不占用并发名额
+        """
+        try:
+            return self.run(tool_flight.ado(key, self.guarded(tool_name, coro)))
+        finally:
+            # 被合并的调用只关闭了外层的 guarded()，工具协程本身从未开始执行，同样需要关闭
+            if inspect.getcoroutinestate(coro) == inspect.CORO_CREATED:
+                coro.close()
+
+    async def guarded(self, tool_name, coro):
+        limit = self._limits.get(tool_name)
+        if limit is None:
+            limit = self._limits[tool_name] = _ToolLimit(self.limits_config.get(tool_name, 4), self.max_waiting)
+        if limit.semaphore.locked() and limit.waiting >= limit.max_waiting:
+            limit.rejected += 1
+            coro.close()
+            return f"当前请求较多，{tool_name} 工具繁忙，请稍后重试。"
+        limit.waiting += 1
+        try:
+            await limit.semaphore.acquire()
+        finally:
+            limit.waiting -= 1
+        try:
+            return await coro
+        finally:
+            limit.semaphore.release()
+
+    # ---------- 线程池 ----------
+    # 在线程池中执行时带上当前协程的上下文（如交易所请求优先级）
+    async def run_cpu(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(
+            self.cpu_executor, functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+
+    async def run_io(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(
+            self.io_executor, functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+
+    async def run_backfill(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(
+            self.backfill_executor, functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+
+    def stats(self):
+        return {name: {'limit': self.limits_config.get(name, 4), 'waiting': limit.waiting,
+                       'rejected': limit.rejected} for name, limit in self._limits.items()}
+
+    def shutdown(self):
+        asyncio.run_coroutine_threadsafe(self.exchange.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        for executor in (self.cpu_executor, self.io_executor, self.backfill_executor):
+            executor.shutdown(wait=False)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """共享的异步工具执行器，首次使用时创建"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = AsyncToolRunner()
+    return _runner
@@ -0,0 +1,139 @@
+"""
+无界面批量分析
+不启动 WebUI 和大模型，直接调用 exc_sql、arima_stock 和 get_real_time_price 三个工具，
+对一组交易对和SQL查询并发执行，结果写入 JSON 或 Parquet 文件，适合定时任务和批量报表。
+工具实例由调用方传入（见 btc_analysis_agent_qwen_trub.main），本模块不导入 qwen_agent
+
+每个任务一行结果：工具名、目标（交易对或SQL）、参数、耗时、工具返回的文本，
+get_real_time_price 使用 compact 格式时附带解析出的 JSON 数据；工具抛出异常或返回错误描述时记录在 error 中，
+有失败的任务时进程以退出码 1 结束（便于定时任务发现失败）
+
+用法:
+    python btc_analysis_agent_qwen_trub.py batch --symbols BTCUSDT,ETHUSDT --forecast BTC --days 7
+    python btc_analysis_agent_qwen_trub.py batch --sql "SELECT * FROM btc_usdt_kline LIMIT 30" \\
+        --sql-file queries.sql --format parquet --output report.parquet
+"""
+import importlib.util
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+COMPACT_JSON = re.compile(r'```json\n(.*?)\n```', re.S)
+# 工具出错时返回的文本开头（工具内部捕获异常后返回错误描述，而不是抛出）
+TOOL_ERROR_PREFIXES = (
+    'SQL执行或可视化出错', '获取历史数据或构建预测模型失败', '预测模型构建失败', '警告: 获取的历史数据不足',
+    '获取实时价格数据时发生错误', '获取实时价格数据失败', '获取实时价格时数据结构错误', '获取实时价格失败',
+    '交易对符号错误', '网络连接错误',
+)
+
+
+def split_list(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def read_queries(path):
+    """读取SQL文件，多条语句以分号分隔"""
+    with open(path, encoding='utf-8') as f:
+        return [statement.strip() for statement in f.read().split(';') if statement.strip()]
+
+
+def build_tasks(symbols=(), forecast=(), days=7, queries=(), output_mode='compact'):
+    """任务列表，每项为 (工具名, 目标, 参数)"""
+    tasks = [('get_real_time_price', symbol.upper(), {'symbol': symbol.upper(), 'output': output_mode})
+             for symbol in symbols]
+    tasks += [('arima_stock', b_code.upper(), {'b_code': b_code.upper(), 'n': days}) for b_code in forecast]
+    tasks += [('exc_sql', sql, {'sql_input': sql}) for sql in queries]
+    return tasks
+
+
+def tool_error(result):
+    """工具返回的是错误描述时返回 True"""
+    return any(result.startswith(prefix) for prefix in TOOL_ERROR_PREFIXES)
+
+
+def parse_compact(result):
+    """compact 格式结果中的 JSON 数据，没有时返回 None"""
+    match = COMPACT_JSON.search(result or '')
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+def run_task(tools, name, target, params):
+    started = time.perf_counter()
+    row = {'tool': name, 'target': target, 'params': params, 'started_at': datetime.now().isoformat(),
+           'seconds': None, 'result': None, 'data': None, 'error': None}
+    try:
+        row['result'] = tools[name].call(json.dumps(params, ensure_ascii=False))
+        row['data'] = parse_compact(row['result'])
+        if tool_error(row['result']):
+            row['error'] = row['result'].splitlines()[0]
+            print(f"{name} {target} 执行失败: {row['error']}")
+    except Exception as e:
+        print(f"{name} {target} 执行失败: {str(e)}")
+        row['error'] = f"{type(e).__name__}: {str(e)}"
+    row['seconds'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def run_batch(tools, tasks, workers=4):
+    """并发执行全部任务，按任务顺序返回结果；tools 为 工具名 -> 工具实例"""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='batch') as executor:
+        return list(executor.map(lambda task: run_task(tools, *task), tasks))
+
+
+def write_results(rows, path, fmt='json'):
+    """写入结果文件：json 为一个对象（生成时间和结果列表），parquet 每个任务一行（参数和数据存为 JSON 字符串）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    if fmt == 'parquet':
+        import pandas as pd
+
+        frame = pd.DataFrame([
+            {**row, 'params': json.dumps(row['params'], ensure_ascii=False),
+             'data': None if row['data'] is None else json.dumps(row['data'], ensure_ascii=False)}
+            for row in rows
+        ])
+        frame.to_parquet(path, index=False)
+        return path
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'generated_at': datetime.now().isoformat(), 'results': rows}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument('--symbols', default='', help='获取实时价格和策略分析的交易对，逗号分隔，如 BTCUSDT,ETHUSDT')
+    parser.add_argument('--forecast', default='', help='ARIMA 预测的币种代码，逗号分隔，如 BTC,ETH')
+    parser.add_argument('--days', type=int, default=7, help='预测天数')
+    parser.add_argument('--sql', action='append', default=[], help='执行的SQL，可以指定多次')
+    parser.add_argument('--sql-file', help='SQL文件，多条语句以分号分隔')
+    parser.add_argument('--output-mode', choices=('compact', 'markdown'), default='compact',
+                        help='get_real_time_price 的结果格式')
+    parser.add_argument('--workers', type=int, default=4, help='同时执行的任务数')
+    parser.add_argument('--format', choices=('json', 'parquet'), default='json', help='结果文件格式')
+    parser.add_argument('--output', help='结果文件路径（默认 btc_batch_<时间>.<格式>）')
+
+
+def run(args, tools):
+    """按命令行参数执行批量任务并写入结果文件，返回进程退出码"""
+    queries = list(args.sql) + (read_queries(args.sql_file) if args.sql_file else [])
+    tasks = build_tasks(split_list(args.symbols), split_list(args.forecast), args.days, queries, args.output_mode)
+    if not tasks:
+        print("没有任务：请指定 --symbols、--forecast、--sql 或 --sql-file")
+        return 2
+    if args.format == 'parquet' and not any(importlib.util.find_spec(name) for name in ('pyarrow', 'fastparquet')):
+        print("写入 Parquet 需要安装 pyarrow 或 fastparquet")
+        return 2
+    started = time.perf_counter()
+    rows = run_batch({tool.name: tool for tool in tools}, tasks, args.workers)
+    path = args.output or f"btc_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+    write_results(rows, path, args.format)
+    failed = sum(row['error'] is not None for row in rows)
+    print(f"完成 {len(rows)} 个任务（失败 {failed} 个），耗时 {time.perf_counter() - started:.2f} 秒，结果已写入 {path}")
+    return 1 if failed else 0
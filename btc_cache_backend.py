@@ -0,0 +1,468 @@
+"""
+可插拔的缓存后端
+多进程部署（多个 WebUI / HTTP 接口 worker）时，各进程的内存缓存互不相通：worker 越多，同一份K线和行情
+被重复请求交易所的次数越多，缓存命中率随 worker 数下降。K线、行情、策略分析结果和图表路径统一存入
+CacheBackend，换成跨进程的后端后所有 worker 共用一份缓存：
+
+- MemoryBackend：进程内 LRU（默认，单进程部署时与之前相同）
+- SQLiteBackend：本机的 SQLite 文件（WAL 模式），同一台机器上的 worker 共享
+- RedisBackend：Redis 协议（RESP）客户端，只用到 GET / SET PX / DEL / KEYS，
+  可以连接 Redis，也可以连接本模块自带的替身服务（python btc_cache_backend.py --port 6379）
+
+值为任意可 pickle 的对象，跨进程的后端每次读取得到新的副本。缓存键统一由 cache_key() 生成：
+btc:<种类>:<参数...>，有效期按种类取 ttl_for()：
+
+    quote       实时行情                1 秒
+    klines      15分钟 / 1小时K线       5 秒
+    daily       日线                    60 秒
+
+行情和K线在缓存中保留 BTC_STALE_MAX_AGE 秒，超过上面的有效期后不再直接使用，只在交易所不可用时兜底
+（见 btc_circuit_breaker.serve_stale）；策略分析结果和图表路径（stage）按 BTC_PRICE_STAGE_CACHE_TTL 保留
+
+后端出错（如 Redis 断开）时按未命中处理并打印错误，不影响工具调用
+
+环境变量:
+    BTC_CACHE_BACKEND     memory（默认）、sqlite:///文件路径 或 redis://主机:端口/库号
+    BTC_CACHE_SIZE        memory 后端最多缓存的条目数（默认 2048）
+    BTC_CACHE_TTL_<种类>   覆盖某种数据的有效期（秒），如 BTC_CACHE_TTL_QUOTE=2
+"""
+import fnmatch
+import os
+import pickle
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from queue import Empty, LifoQueue
+from urllib.parse import urlsplit
+
+KEY_PREFIX = 'btc'
+DEFAULT_TTLS = {
+    'quote': 1.0,
+    'klines': 5.0,
+    'daily': 60.0,
+}
+
+
+def cache_key(kind, *parts):
+    """统一的缓存键，如 cache_key('klines', 'BTCUSDT', '15m', 100) -> btc:klines:BTCUSDT:15m:100"""
+    return ':'.join([KEY_PREFIX, kind] + [str(part) for part in parts])
+
+
+def ttl_for(kind):
+    """某种数据的有效期（秒），环境变量 BTC_CACHE_TTL_<种类> 优先，未配置的种类为 0（不缓存）"""
+    value = os.getenv(f'BTC_CACHE_TTL_{kind.upper()}')
+    return float(value) if value else DEFAULT_TTLS.get(kind, 0.0)
+
+
+class CacheBackend:
+    """缓存后端的接口：get 未命中或已过期时返回 None，set 的 ttl 为秒数"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self._get(key)
+        except Exception as e:
+            self._error('读取', key, e)
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        try:
+            self._set(key, value, ttl)
+        except Exception as e:
+            self._error('写入', key, e)
+            return
+        self._count('sets')
+
+    def delete(self, key):
+        try:
+            self._delete(key)
+        except Exception as e:
+            self._error('删除', key, e)
+
+    def clear(self, prefix=KEY_PREFIX):
+        """删除以 prefix 开头的全部键（共享后端中只删除本项目的键）"""
+        try:
+            self._clear(prefix)
+        except Exception as e:
+            self._error('清空', prefix, e)
+
+    def hit_rate(self):
+        with self._stats_lock:
+            total = self.stats['hits'] + self.stats['misses']
+            return self.stats['hits'] / total if total else 0.0
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self.stats:
+                self.stats[name] = 0
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _error(self, action, key, error):
+        self._count('errors')
+        print(f"缓存后端 {self.name} {action} {key} 失败: {str(error)}")
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _clear(self, prefix):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """进程内 LRU，值不复制，按最近使用淘汰"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=None):
+        super().__init__()
+        self.max_entries = int(max_entries or os.getenv('BTC_CACHE_SIZE', '2048'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _clear(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._entries.pop(key)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    本机 SQLite 文件，WAL 模式下读写互不阻塞；每个线程（fork 后的每个进程）使用自己的连接，
+    过期的行在读到时跳过，每写入 purge_every 次清理一次
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, purge_every=500):
+        super().__init__()
+        self.path = path
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def _set(self, key, value, ttl):
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                           (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+    def _delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def _clear(self, prefix):
+        self._connection().execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+
+
+class RespError(Exception):
+    """Redis 服务返回的错误"""
+
+
+def encode_command(*args):
+    """按 RESP 协议编码一条命令"""
+    parts = [f'*{len(args)}\r\n'.encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        parts.append(f'${len(data)}\r\n'.encode() + data + b'\r\n')
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """从 socket 的文件对象读取一个 RESP 回复"""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('连接已关闭')
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode('utf-8')
+    if kind == b'-':
+        raise RespError(body.decode('utf-8'))
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        count = int(body)
+        return None if count < 0 else [read_reply(stream) for _ in range(count)]
+    raise RespError(f'无法解析的回复: {line!r}')
+
+
+class RedisBackend(CacheBackend):
+    """Redis 协议客户端，连接池中的连接按需建立，出错的连接直接丢弃"""
+
+    name = 'redis'
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, timeout=2.0, pool_size=16):
+        super().__init__()
+        self.host = host
+        self.port = int(port)
+        self.db = int(db)
+        self.timeout = timeout
+        self._pool = LifoQueue(maxsize=pool_size)
+        self._pid = os.getpid()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        if self.db:
+            sock.sendall(encode_command('SELECT', self.db))
+            read_reply(stream)
+        return sock, stream
+
+    def execute(self, *args):
+        if self._pid != os.getpid():
+            # fork 后不能与父进程共用连接
+            self._pool = LifoQueue(maxsize=self._pool.maxsize)
+            self._pid = os.getpid()
+        try:
+            connection = self._pool.get_nowait()
+        except Empty:
+            connection = self._connect()
+        try:
+            connection[0].sendall(encode_command(*args))
+            reply = read_reply(connection[1])
+        except RespError:
+            self._release(connection)
+            raise
+        except Exception:
+            connection[1].close()
+            connection[0].close()
+            raise
+        self._release(connection)
+        return reply
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except Exception:
+            connection[1].close()
+            connection[0].close()
+
+    def _get(self, key):
+        data = self.execute('GET', key)
+        return pickle.loads(data) if data is not None else None
+
+    def _set(self, key, value, ttl):
+        self.execute('SET', key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 'PX', max(1, int(ttl * 1000)))
+
+    def _delete(self, key):
+        self.execute('DEL', key)
+
+    def _clear(self, prefix):
+        keys = self.execute('KEYS', f'{prefix}*')
+        if keys:
+            self.execute('DEL', *keys)
+
+
+def create_backend(spec=None):
+    """按 BTC_CACHE_BACKEND 的格式创建后端：memory、sqlite:///路径 或 redis://主机:端口/库号"""
+    spec = (spec if spec is not None else os.getenv('BTC_CACHE_BACKEND', 'memory')).strip()
+    if spec in ('', 'memory'):
+        return MemoryBackend()
+    if spec.startswith('sqlite:'):
+        path = spec[len('sqlite:'):]
+        return SQLiteBackend(path[2:] if path.startswith('//') else path)
+    if spec.startswith('redis://'):
+        url = urlsplit(spec)
+        return RedisBackend(url.hostname or '127.0.0.1', url.port or 6379, int(url.path.strip('/') or 0))
+    raise ValueError(f"未知的缓存后端: {spec}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend():
+    """进程共用的缓存后端，首次使用时按 BTC_CACHE_BACKEND 创建；配置错误时打印并退回 memory"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = create_backend()
+                except Exception as e:
+                    print(f"创建缓存后端失败，使用进程内缓存: {str(e)}")
+                    _backend = MemoryBackend()
+    return _backend
+
+
+def set_cache_backend(backend):
+    """替换进程共用的缓存后端（压测和回放使用），None 表示下次使用时按环境变量重新创建"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ---------- Redis 协议替身服务 ----------
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            try:
+                reply = self.server.store.execute(command)
+            except Exception as e:
+                reply = RespError(str(e))
+            self.wfile.write(encode_reply(reply))
+
+
+def encode_reply(reply):
+    if isinstance(reply, RespError):
+        return f'-ERR {reply}\r\n'.encode('utf-8')
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, int):
+        return f':{reply}\r\n'.encode()
+    if isinstance(reply, list):
+        return f'*{len(reply)}\r\n'.encode() + b''.join(encode_reply(item) for item in reply)
+    if isinstance(reply, str):
+        return f'+{reply}\r\n'.encode('utf-8')
+    return f'${len(reply)}\r\n'.encode() + reply + b'\r\n'
+
+
+class RespStore:
+    """替身服务的数据：键 -> (值, 过期时间)，支持 PING / GET / SET [PX|EX] / DEL / KEYS / SELECT / FLUSHDB，
+    command 为命令的各个参数（bytes）"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def execute(self, command):
+        name = command[0].decode('utf-8').upper()
+        # 只有 SET 的值保持原样，其余参数都是文本
+        args = [arg if name == 'SET' and i == 1 else arg.decode('utf-8') for i, arg in enumerate(command[1:])]
+        now = time.time()
+        with self._lock:
+            if name == 'PING':
+                return 'PONG'
+            if name == 'GET':
+                item = self._data.get(args[0])
+                if item is not None and item[1] is not None and item[1] <= now:
+                    self._data.pop(args[0])
+                    item = None
+                return item[0] if item is not None else None
+            if name == 'SET':
+                expires = None
+                options = args[2:]
+                for option, amount in zip(options[::2], options[1::2]):
+                    scale = {'PX': 0.001, 'EX': 1.0}.get(option.upper())
+                    if scale is None:
+                        raise RespError(f'不支持的 SET 选项 {option}')
+                    expires = now + int(amount) * scale
+                self._data[args[0]] = (args[1], expires)
+                return 'OK'
+            if name == 'DEL':
+                return sum(self._data.pop(key, None) is not None for key in args)
+            if name == 'KEYS':
+                return [key.encode('utf-8') for key, (_, expires) in self._data.items()
+                        if fnmatch.fnmatchcase(key, args[0]) and (expires is None or expires > now)]
+            if name in ('SELECT', 'FLUSHDB'):
+                if name == 'FLUSHDB':
+                    self._data.clear()
+                return 'OK'
+        raise RespError(f"不支持的命令 {name}")
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Redis 协议的替身服务，没有 Redis 的开发机和压测中作为共享缓存"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=6379):
+        super().__init__((host, port), _RespHandler)
+        self.store = RespStore()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='resp-stand-in', daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Redis 协议的共享缓存替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+    server = RespStandIn(args.host, args.port)
+    print(f"共享缓存替身服务已启动: {server.url}")
+    server.serve_forever()
@@ -0,0 +1,330 @@
+"""
+按 (交易对, K线周期) 划分的固定容量K线环形缓冲区
+缓冲区预先分配在 multiprocessing.shared_memory 中，保存最近 N 根K线的 OHLCV 列，
+同一根未收盘K线原地更新；多个 WebUI 工作进程可以挂载同一块内存直接读取，无需复制
+
+每个槽位同时写入 i 和 i+capacity 两个位置（镜像写入），
+因此最近 N 根K线在内存中始终是连续的一段，读取时可以直接返回 NumPy 视图，
+交给 btc_indicators 中的指标函数计算，不需要构建 DataFrame
+
+写入进程崩溃后共享内存不会被删除，其他进程只能以只读方式挂载、没有进程再写入；
+CandleRingStore.open() 发现缓冲区超过 orphan_seconds 秒没有写入（从创建时算起）时删除它并重新创建为写入方
+
+环境变量:
+    BTC_CANDLE_RING_ORPHAN_AGE  缓冲区超过该秒数没有写入时视为写入进程已退出（默认 120）
+"""
+import atexit
+import os
+import threading
+import time
+
+import numpy as np
+
+from btc_shm import attach_shared_memory, release_shared_memory, unlink_shared_memory
+
+# 头部字段（int64）
+_HEADER_FIELDS = ('version', 'capacity', 'count', 'head', 'seq', 'last_open_time', 'interval_ms', 'updated_ms',
+                  'created_ms')
+_H = {name: i for i, name in enumerate(_HEADER_FIELDS)}
+_HEADER_SIZE = 8 * len(_HEADER_FIELDS)
+_LAYOUT_VERSION = 2
+
+# 列定义：开盘时间为 int64 毫秒，其余为 float64
+RING_COLUMNS = (
+    ('open_time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+)
+
+# 每种周期对应的毫秒数
+INTERVAL_MS = {
+    '1m': 60_000,
+    '3m': 3 * 60_000,
+    '5m': 5 * 60_000,
+    '15m': 15 * 60_000,
+    '30m': 30 * 60_000,
+    '1h': 3_600_000,
+    '2h': 2 * 3_600_000,
+    '4h': 4 * 3_600_000,
+    '6h': 6 * 3_600_000,
+    '12h': 12 * 3_600_000,
+    '1d': 86_400_000,
+}
+
+DEFAULT_CAPACITY = 1500
+DEFAULT_ORPHAN_SECONDS = float(os.getenv('BTC_CANDLE_RING_ORPHAN_AGE', '120'))
+
+
+def ring_name(symbol, interval):
+    """共享内存名称，各进程据此挂载同一个缓冲区"""
+    return f'btc_ring_{symbol.lower()}_{interval}'
+
+
+def _ring_nbytes(capacity):
+    return _HEADER_SIZE + 2 * capacity * sum(np.dtype(dtype).itemsize for _, dtype in RING_COLUMNS)
+
+
+class CandleRing:
+    """
+    单个 (交易对, 周期) 的K线环形缓冲区
+    只允许一个写入方（创建该缓冲区的进程），其他进程以只读方式挂载
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((len(_HEADER_FIELDS),), dtype=np.int64, buffer=shm.buf)
+        self.capacity = int(self.header[_H['capacity']])
+        self.columns = {}
+        offset = _HEADER_SIZE
+        for name, dtype in RING_COLUMNS:
+            array = np.ndarray((2 * self.capacity,), dtype=dtype, buffer=shm.buf, offset=offset)
+            if not owner:
+                array.flags.writeable = False
+            self.columns[name] = array
+            offset += array.nbytes
+
+    @classmethod
+    def create(cls, symbol, interval, capacity=DEFAULT_CAPACITY):
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(name=ring_name(symbol, interval), create=True,
+                                         size=_ring_nbytes(capacity))
+        header = np.ndarray((len(_HEADER_FIELDS),), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_H['version']] = _LAYOUT_VERSION
+        header[_H['capacity']] = capacity
+        header[_H['interval_ms']] = INTERVAL_MS.get(interval, 0)
+        header[_H['created_ms']] = int(time.time() * 1000)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, symbol, interval):
+        """挂载已存在的缓冲区，不存在时返回 None"""
+        try:
+            shm = attach_shared_memory(ring_name(symbol, interval))
+        except FileNotFoundError:
+            return None
+        header = np.ndarray((len(_HEADER_FIELDS),), dtype=np.int64, buffer=shm.buf)
+        if header[_H['version']] != _LAYOUT_VERSION:
+            release_shared_memory(shm)
+            return None
+        return cls(shm, owner=False)
+
+    # ---------- 写入 ----------
+    def _write_slot(self, slot, values):
+        for name, _ in RING_COLUMNS:
+            column = self.columns[name]
+            column[slot] = values[name]
+            column[slot + self.capacity] = values[name]
+
+    def _append_or_update(self, values):
+        header = self.header
+        count = int(header[_H['count']])
+        head = int(header[_H['head']])
+        open_time = int(values['open_time'])
+        last_open_time = int(header[_H['last_open_time']])
+        if count and open_time == last_open_time:
+            # 未收盘K线原地更新
+            self._write_slot((head - 1) % self.capacity, values)
+        elif not count or open_time > last_open_time:
+            self._write_slot(head, values)
+            header[_H['head']] = (head + 1) % self.capacity
+            header[_H['count']] = min(count + 1, self.capacity)
+            header[_H['last_open_time']] = open_time
+        # 早于最新K线的数据直接忽略
+
+    def update(self, open_time, open_price, high, low, close, volume):
+        """写入一根K线：开盘时间相同则原地更新，更新的开盘时间则追加"""
+        self.extend({
+            'open_time': [open_time], 'open': [open_price], 'high': [high],
+            'low': [low], 'close': [close], 'volume': [volume],
+        })
+
+    def extend(self, columns):
+        """批量写入按时间排序的K线列 {'open_time': [...], 'open': [...], ...}"""
+        if not self.owner:
+            raise PermissionError("只读挂载的K线缓冲区不能写入")
+        n = len(columns['open_time'])
+        start = max(0, n - self.capacity - 1)
+        header = self.header
+        # 顺序锁：写入期间序号为奇数，读取方据此判断是否需要重读
+        header[_H['seq']] += 1
+        try:
+            for i in range(start, n):
+                self._append_or_update({name: columns[name][i] for name, _ in RING_COLUMNS})
+            header[_H['updated_ms']] = int(time.time() * 1000)
+        finally:
+            header[_H['seq']] += 1
+
+    def extend_klines(self, klines):
+        """写入交易所返回的原始K线列表"""
+        from btc_klines import parse_klines
+
+        parsed = parse_klines(klines)
+        self.extend({
+            'open_time': parsed['开盘时间戳'],
+            'open': parsed['开盘价'],
+            'high': parsed['最高价'],
+            'low': parsed['最低价'],
+            'close': parsed['收盘价'],
+            'volume': parsed['成交量'],
+        })
+
+    # ---------- 读取 ----------
+    def __len__(self):
+        return int(self.header[_H['count']])
+
+    @property
+    def last_open_time(self):
+        return int(self.header[_H['last_open_time']])
+
+    @property
+    def updated_ms(self):
+        return int(self.header[_H['updated_ms']])
+
+    def age_seconds(self):
+        """距离最近一次写入的秒数，从未写入时为无穷大"""
+        updated = self.updated_ms
+        return (time.time() * 1000 - updated) / 1000 if updated else float('inf')
+
+    def orphaned(self, max_age):
+        """创建或最近一次写入距今超过 max_age 秒（写入进程已退出或停止更新）"""
+        last = max(self.updated_ms, int(self.header[_H['created_ms']]))
+        return time.time() * 1000 - last > max_age * 1000
+
+    def _window(self, n):
+        """在顺序锁保护下读取头部，返回最近 n 根K线在镜像数组中的区间"""
+        header = self.header
+        spins = 0
+        while True:
+            seq = int(header[_H['seq']])
+            # 写入方异常退出时序号可能停留在奇数，自旋一定次数后不再等待
+            if seq % 2 and spins < 10000:
+                spins += 1
+                time.sleep(0)
+                continue
+            count = int(header[_H['count']])
+            head = int(header[_H['head']])
+            if int(header[_H['seq']]) == seq:
+                break
+        n = count if n is None else min(n, count)
+        end = head + self.capacity
+        return end - n, end, seq
+
+    def view(self, n=None):
+        """
+        返回最近 n 根K线的零拷贝只读视图 {'open_time', 'open', 'high', 'low', 'close', 'volume'}
+        视图直接指向共享内存，写入方随后更新的未收盘K线会反映在视图的最后一个元素上
+        """
+        start, end, _ = self._window(n)
+        result = {}
+        for name, _ in RING_COLUMNS:
+            array = self.columns[name][start:end]
+            array.flags.writeable = False
+            result[name] = array
+        return result
+
+    def snapshot(self, n=None):
+        """返回最近 n 根K线的一致性副本，读取期间发生写入时自动重试"""
+        while True:
+            start, end, seq = self._window(n)
+            result = {name: self.columns[name][start:end].copy() for name, _ in RING_COLUMNS}
+            if int(self.header[_H['seq']]) == seq:
+                return result
+
+    def indicators(self, n=None, periods=None):
+        """直接在共享内存视图上计算技术指标，返回 {列名: ndarray}"""
+        from btc_indicators import compute_indicator_arrays
+
+        data = self.view(n)
+        return compute_indicator_arrays(data['close'], data['high'], data['low'], data['volume'], periods)
+
+    def to_frame(self, n=None, time_column='开盘时间'):
+        """需要 DataFrame 的旧代码路径使用，列名与 klines_to_frame 一致"""
+        import pandas as pd
+
+        data = self.snapshot(n)
+        return pd.DataFrame({
+            time_column: pd.to_datetime(data['open_time'], unit='ms'),
+            '开盘价': data['open'],
+            '最高价': data['high'],
+            '最低价': data['low'],
+            '收盘价': data['close'],
+            '成交量': data['volume'],
+        })
+
+    def close(self):
+        release_shared_memory(self.shm, unlink=self.owner)
+
+
+class CandleRingStore:
+    """
+    进程内的缓冲区注册表：第一个打开某个 (交易对, 周期) 的进程创建并负责写入，
+    其他进程自动以只读方式挂载；写入方停止更新超过 orphan_seconds 秒后，
+    open() 删除旧缓冲区并重新创建为写入方，只读挂载的进程随后重新挂载新的缓冲区
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, orphan_seconds=DEFAULT_ORPHAN_SECONDS):
+        self.capacity = capacity
+        self.orphan_seconds = orphan_seconds
+        self._rings = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close_all)
+
+    def open(self, symbol, interval, create=True):
+        key = (symbol.upper(), interval)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is not None and not ring.owner and ring.orphaned(self.orphan_seconds):
+                # 写入方已不再更新：放弃旧的挂载，重新挂载（可能已被其他进程接管）或由本进程接管
+                ring.close()
+                del self._rings[key]
+                ring = None
+            if ring is None:
+                ring = CandleRing.attach(*key)
+                if create and (ring is None or ring.orphaned(self.orphan_seconds)):
+                    ring = self._create(key, ring)
+                if ring is not None:
+                    self._rings[key] = ring
+            return ring
+
+    def _create(self, key, orphan=None):
+        """创建缓冲区并成为写入方；orphan 为已挂载的无人写入的旧缓冲区，先删除"""
+        name = ring_name(*key)
+        if orphan is not None:
+            orphan.close()
+            current = CandleRing.attach(*key)
+            if current is not None and not current.orphaned(self.orphan_seconds):
+                # 其他进程刚刚接管
+                return current
+            if current is not None:
+                current.close()
+            print(f"K线缓冲区 {name} 超过 {self.orphan_seconds:g} 秒没有写入，写入进程可能已退出，重新创建")
+            unlink_shared_memory(name)
+        try:
+            return CandleRing.create(*key, capacity=self.capacity)
+        except FileExistsError:
+            ring = CandleRing.attach(*key)
+        if ring is None:
+            # 同名的内存块是旧版本布局（升级前遗留），无法使用，删除后重新创建
+            unlink_shared_memory(name)
+            try:
+                return CandleRing.create(*key, capacity=self.capacity)
+            except FileExistsError:
+                ring = CandleRing.attach(*key)
+        return ring
+
+    def get(self, symbol, interval):
+        """只读获取已存在的缓冲区"""
+        return self.open(symbol, interval, create=False)
+
+    def close_all(self):
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings.clear()
+
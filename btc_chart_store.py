@@ -0,0 +1,229 @@
+"""
+按内容寻址的图表存储
+图表文件名由图表种类、输入数据和绘图参数（分辨率、格式、绘图代码版本）的哈希决定，
+相同数据再次请求时直接返回已有文件，不重新绘图；同一张图同时只有一个线程在绘制
+
+btc_images 目录中的所有图片（包括之前按时间戳命名的旧文件）都由存储管理：
+- 超过 ttl 秒没有被访问的文件删除
+- 总大小超过 max_bytes 时按最近访问时间（LRU）从旧到新删除
+访问时间记在文件的 mtime 上，重启后仍按原来的顺序淘汰
+多个 worker 共用同一个目录时，文件本身就是共享的缓存：索引中没有、但目录中已有的图表（由其他 worker 绘制）直接使用
+
+环境变量:
+    BTC_CHART_TTL     图表多久没有被访问后删除（秒，默认 604800 即 7 天）
+    BTC_CHART_MAX_MB  图表目录的磁盘配额（MB，默认 512）
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from btc_metrics import CHART_STORE_BYTES, CHART_STORE_EVICTED, CHART_STORE_FILES, enabled as metrics_enabled, \
+    record_cache
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'btc_images')
+# 绘图代码变化导致同样的数据画出不同的图时递增，旧图不再命中、之后按 TTL/LRU 淘汰
+RENDER_VERSION = 1
+DEFAULT_PROFILE = {'format': 'png', 'dpi': 300, 'version': RENDER_VERSION}
+CHART_EXTENSIONS = ('.png', '.svg', '.json')
+
+
+def fingerprint(hasher, value):
+    """把图表输入（DataFrame、Series、数组、字典、列表和标量）写入哈希"""
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        hasher.update(repr(list(value.columns)).encode('utf-8'))
+        hasher.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (pd.Series, pd.Index)):
+        hasher.update(pd.util.hash_pandas_object(value).values.tobytes())
+    elif isinstance(value, np.ndarray):
+        hasher.update(f'{value.dtype}{value.shape}'.encode('utf-8'))
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        hasher.update(b'{')
+        for key in sorted(value, key=str):
+            fingerprint(hasher, key)
+            fingerprint(hasher, value[key])
+        hasher.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b'[')
+        for item in value:
+            fingerprint(hasher, item)
+        hasher.update(b']')
+    else:
+        hasher.update(repr(value).encode('utf-8'))
+    hasher.update(b'|')
+
+
+class ChartStore:
+    def __init__(self, root=IMAGE_DIR, ttl=None, max_bytes=None, url_prefix='btc_images'):
+        self.root = root
+        self.ttl = float(ttl or os.getenv('BTC_CHART_TTL', '604800'))
+        self.max_bytes = int(max_bytes or float(os.getenv('BTC_CHART_MAX_MB', '512')) * 1024 * 1024)
+        self.url_prefix = url_prefix
+        # 文件名 -> (大小, 最近访问时间)，按访问时间从旧到新排列；首次使用时扫描目录
+        self._files = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._rendering = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = {'ttl': 0, 'quota': 0}
+
+    def key(self, kind, inputs, profile=None):
+        hasher = hashlib.sha256(kind.encode('utf-8'))
+        fingerprint(hasher, {**DEFAULT_PROFILE, **(profile or {})})
+        fingerprint(hasher, inputs)
+        return hasher.hexdigest()[:32]
+
+    def render(self, kind, inputs, draw, profile=None):
+        """
+        返回图表的相对路径（如 btc_images/btc_chart_<hash>.png）：已有相同输入的图表时直接返回，
+        否则调用 draw(保存路径) 绘制。kind 为文件名前缀，inputs 为决定图表内容的全部数据
+        """
+        profile = {**DEFAULT_PROFILE, **(profile or {})}
+        name = f"{kind}_{self.key(kind, inputs, profile)}.{profile['format']}"
+        path = os.path.join(self.root, name)
+        with self._lock:
+            self._load()
+            self._expire()
+            hit = self._touch(name, path)
+            if hit:
+                self.hits += 1
+            else:
+                # 同一张图只由一个线程绘制，其余线程等它画完
+                event = self._rendering.get(name)
+                owner = event is None
+                if owner:
+                    event = self._rendering[name] = threading.Event()
+        if not hit and not owner:
+            event.wait()
+            with self._lock:
+                hit = self._touch(name, path)
+                if hit:
+                    self.hits += 1
+            if not hit:
+                return self.render(kind, inputs, draw, profile)
+        record_cache('chart', hit)
+        if hit:
+            return self.relative(name)
+
+        try:
+            with self._lock:
+                self.misses += 1
+            os.makedirs(self.root, exist_ok=True)
+            # 先写临时文件再改名，其他线程不会读到画了一半的图
+            tmp_path = os.path.join(self.root, f".{name}.{threading.get_ident()}.tmp.{profile['format']}")
+            try:
+                draw(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with self._lock:
+                self._add(name, os.path.getsize(path), time.time())
+                self._enforce_quota()
+        finally:
+            with self._lock:
+                self._rendering.pop(name).set()
+        return self.relative(name)
+
+    def relative(self, name):
+        return os.path.join(self.url_prefix, name)
+
+    def _load(self):
+        if self._files is not None:
+            return
+        entries = []
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.is_file() and entry.name.endswith(CHART_EXTENSIONS) and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._files = OrderedDict()
+        self._bytes = 0
+        for accessed, name, size in sorted(entries):
+            self._add(name, size, accessed)
+
+    def _add(self, name, size, accessed):
+        previous = self._files.pop(name, None)
+        if previous is not None:
+            self._bytes -= previous[0]
+        self._files[name] = (size, accessed)
+        self._bytes += size
+        self._report()
+
+    def _touch(self, name, path):
+        """命中时更新访问时间并返回 True；文件已被外部删除时从索引中移除，由其他进程新写入时加入索引"""
+        item = self._files.get(name)
+        if item is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return False
+            self._add(name, size, time.time())
+            item = self._files[name]
+        if not os.path.exists(path):
+            self._files.pop(name)
+            self._bytes -= item[0]
+            self._report()
+            return False
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        self._files[name] = (item[0], now)
+        self._files.move_to_end(name)
+        return True
+
+    def _remove(self, name, reason):
+        size, _ = self._files.pop(name)
+        self._bytes -= size
+        self.evicted[reason] += 1
+        try:
+            os.remove(os.path.join(self.root, name))
+        except OSError:
+            pass
+        if metrics_enabled():
+            CHART_STORE_EVICTED.inc(reason)
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        while self._files:
+            name, (_, accessed) = next(iter(self._files.items()))
+            if accessed >= deadline:
+                break
+            self._remove(name, 'ttl')
+        self._report()
+
+    def _enforce_quota(self):
+        # 刚写入的文件排在最后，至少保留它
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            self._remove(next(iter(self._files)), 'quota')
+        self._report()
+
+    def _report(self):
+        if metrics_enabled():
+            CHART_STORE_FILES.set(value=len(self._files))
+            CHART_STORE_BYTES.set(value=self._bytes)
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            requests = self.hits + self.misses
+            return {
+                'files': len(self._files),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else 0.0,
+                'evicted': dict(self.evicted),
+            }
+
+
+chart_store = ChartStore()
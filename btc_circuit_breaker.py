@@ -0,0 +1,359 @@
+"""
+交易所熔断与过期数据兜底（stale-while-revalidate）
+交易所变慢或不可用时，每个请求都要等到超时才返回错误，请求越积越多。
+
+- CircuitBreaker：连续 failure_threshold 次上游故障（连接错误、超时、5xx、429/418）后熔断，
+  熔断期间的交易所调用立即抛出 CircuitOpenError；reset_timeout 秒后放行一个探测请求，成功则恢复
+- serve_stale：数据获取方法的装饰器，每次成功获取都记下结果；熔断中或获取失败时返回最近一次的结果，
+  并在后台刷新（同一份数据同时只有一个刷新任务）。结果保存在缓存后端（见 btc_cache_backend）中，
+  指定了数据种类时，有效期内的结果（可能由其他 worker 获取）直接使用，不请求交易所
+- label_stale：工具 call 方法的装饰器，本次调用用到了过期数据时，在回答末尾注明数据的时间
+
+环境变量:
+    BTC_CIRCUIT_FAILURES  触发熔断的连续失败次数（默认 5）
+    BTC_CIRCUIT_RESET     熔断后多久放行探测请求（秒，默认 15）
+    BTC_STALE_MAX_AGE     过期数据最多可以使用多久（秒，默认 3600）
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from btc_cache_backend import cache_key as backend_key, get_cache_backend, ttl_for
+from btc_metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, STALE_SERVED, enabled as metrics_enabled
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_MAX_AGE = float(os.getenv('BTC_STALE_MAX_AGE', '3600'))
+
+
+class CircuitOpenError(Exception):
+    """熔断中，未请求上游"""
+
+
+def is_upstream_failure(error):
+    """
+    是否为上游故障：有 HTTP 状态码时只有 5xx 和 429/418 算故障（4xx 说明交易所正常响应，如交易对不存在），
+    没有状态码的异常（连接失败、超时等）算故障；本地的额度不足、回放缺失等不算
+    """
+    from btc_weight_governor import WeightLimitError
+
+    if isinstance(error, (CircuitOpenError, WeightLimitError, KeyError, ValueError, TypeError)):
+        return False
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status >= 500 or status in (418, 429)
+    return True
+
+
+class CircuitBreaker:
+    def __init__(self, name='binance', failure_threshold=None, reset_timeout=None, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = int(failure_threshold or os.getenv('BTC_CIRCUIT_FAILURES', '5'))
+        self.reset_timeout = float(reset_timeout or os.getenv('BTC_CIRCUIT_RESET', '15'))
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_closed(self):
+        return self._state == CLOSED
+
+    def _set_state(self, state):
+        self._state = state
+        if metrics_enabled():
+            CIRCUIT_STATE.set(self.name, value=STATE_VALUES[state])
+
+    def before_call(self):
+        """请求上游之前调用，熔断中抛出 CircuitOpenError；到时间后放行一个探测请求"""
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED or (self._state == HALF_OPEN and not self._probing):
+                self._probing = self._state == HALF_OPEN
+                return
+            self.rejected += 1
+            retry_in = max(self.reset_timeout - (self.clock() - self._opened_at), 0.0)
+        if metrics_enabled():
+            CIRCUIT_REJECTED.inc(self.name)
+        raise CircuitOpenError(f"交易所暂时不可用（熔断中，{retry_in:.0f} 秒后重试）")
+
+    def after_call(self, error=None):
+        """请求结束后调用，error 为请求抛出的异常"""
+        with self._lock:
+            self._probing = False
+            if error is None or not is_upstream_failure(error):
+                self._failures = 0
+                if self._state != CLOSED:
+                    self._set_state(CLOSED)
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self.clock()
+                self.opened += 1
+                self._set_state(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.after_call(e)
+            raise
+        self.after_call()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def stats(self):
+        return {'state': self._state, 'failures': self._failures, 'opened': self.opened, 'rejected': self.rejected}
+
+
+class BreakerClient:
+    """交易所客户端代理，每次调用都经过熔断器"""
+
+    def __init__(self, client, breaker):
+        self._client = client
+        self.breaker = breaker
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            return self.breaker.call(attr, *args, **kwargs)
+        return wrapper
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    """交易所共用的熔断器"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
+
+
+# ---------- 过期数据兜底 ----------
+class LastKnownStore:
+    """
+    每份数据最近一次成功获取的结果和时间，保存在缓存后端中（backend 为 None 时使用进程共用的后端），
+    键为 (数据种类, 参数...)，对应缓存键 btc:<数据种类>:<参数...>
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, backend=None):
+        self.max_age = max_age
+        self.backend = backend
+
+    def _backend(self):
+        return self.backend if self.backend is not None else get_cache_backend()
+
+    def put(self, key, value):
+        """保存结果的副本（内存后端不复制值，调用方随后修改返回的结果不能影响缓存）"""
+        stored = value.copy() if hasattr(value, 'copy') else value
+        self._backend().set(backend_key(*key), (stored, time.time()), self.max_age)
+
+    def get(self, key):
+        """返回 (结果的副本, 距今秒数)，没有或超过 max_age 时返回 (None, None)"""
+        item = self._backend().get(backend_key(*key))
+        if item is None or time.time() - item[1] > self.max_age:
+            return None, None
+        value, stored_at = item
+        # 调用方会在返回的 DataFrame 上追加指标列，不能把缓存对象本身交出去
+        return (value.copy() if hasattr(value, 'copy') else value), time.time() - stored_at
+
+    def clear(self):
+        """清空缓存后端中本项目的全部数据"""
+        self._backend().clear()
+
+
+last_known = LastKnownStore()
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stale-refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_stale_notes = contextvars.ContextVar('stale_notes', default=None)
+
+
+def _claim_refresh(key):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release_refresh(key):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def _note_stale(label, age):
+    notes = _stale_notes.get()
+    if notes is not None:
+        notes.append((label, age))
+    if metrics_enabled():
+        STALE_SERVED.inc(label)
+
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} 秒前"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} 分钟前"
+    return f"{seconds / 3600:.1f} 小时前"
+
+
+def serve_stale(label, key=None, kind=None):
+    """
+    数据获取方法的装饰器（支持协程方法），label 用于注明过期数据的种类
+    key(*args, **kwargs) 由方法参数（不含 self）得到缓存键，默认使用位置参数
+    kind 为缓存后端中的数据种类（quote、klines、daily），缓存的结果在 ttl_for(kind) 秒内直接返回；
+    熔断中且有缓存时直接返回缓存并在后台刷新；正常时请求上游，失败且有缓存时返回缓存
+    """
+    def make_key(args, kwargs):
+        return (kind or label,) + tuple(key(*args, **kwargs) if key else args)
+
+    def cached(cache_key):
+        """有效期内的结果（直接使用）或熔断中可以兜底的结果，返回 (结果, 距今秒数, 是否过期)；都没有时结果为 None"""
+        value, age = last_known.get(cache_key)
+        if value is not None:
+            if kind and age <= ttl_for(kind):
+                return value, age, False
+            if not get_breaker().is_closed():
+                return value, age, True
+        return None, None, False
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            async def arefresh(cache_key, self, args, kwargs):
+                try:
+                    last_known.put(cache_key, await func(self, *args, **kwargs))
+                except Exception:
+                    pass
+                finally:
+                    _release_refresh(cache_key)
+
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                value, age, stale = cached(cache_key)
+                if value is not None:
+                    if stale:
+                        if _claim_refresh(cache_key):
+                            asyncio.get_running_loop().create_task(arefresh(cache_key, self, args, kwargs))
+                        _note_stale(label, age)
+                    return value
+                try:
+                    result = await func(self, *args, **kwargs)
+                except Exception:
+                    value, age = last_known.get(cache_key)
+                    if value is None:
+                        raise
+                    _note_stale(label, age)
+                    return value
+                last_known.put(cache_key, result)
+                return result
+            return async_wrapper
+
+        def refresh(cache_key, self, args, kwargs):
+            try:
+                last_known.put(cache_key, func(self, *args, **kwargs))
+            except Exception:
+                pass
+            finally:
+                _release_refresh(cache_key)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache_key = make_key(args, kwargs)
+            value, age, stale = cached(cache_key)
+            if value is not None:
+                if stale:
+                    if _claim_refresh(cache_key):
+                        _refresh_executor.submit(refresh, cache_key, self, args, kwargs)
+                    _note_stale(label, age)
+                return value
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception:
+                value, age = last_known.get(cache_key)
+                if value is None:
+                    raise
+                _note_stale(label, age)
+                return value
+            last_known.put(cache_key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def stale_context():
+    """收集本次工具调用用到的过期数据；已在收集中时沿用外层的列表"""
+    notes = _stale_notes.get()
+    if notes is not None:
+        yield notes, False
+        return
+    notes = []
+    token = _stale_notes.set(notes)
+    try:
+        yield notes, True
+    finally:
+        _stale_notes.reset(token)
+
+
+def stale_note(notes):
+    """过期数据说明，同一种数据只保留最旧的一次"""
+    ages = {}
+    for label, age in notes:
+        ages[label] = max(age, ages.get(label, 0.0))
+    parts = '，'.join(f"{label}为 {format_age(age)}的数据" for label, age in ages.items())
+    return f"*注: 交易所暂时不可用，{parts}，后台正在刷新*"
+
+
+def label_stale(func):
+    """工具 call / acall 的装饰器：用到过期数据时在结果末尾追加说明（由最外层的调用追加）"""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with stale_context() as (notes, owner):
+                result = await func(*args, **kwargs)
+            if owner and notes and isinstance(result, str):
+                result = f"{result}\n\n{stale_note(notes)}"
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stale_context() as (notes, owner):
+            result = func(*args, **kwargs)
+        if owner and notes and isinstance(result, str):
+            result = f"{result}\n\n{stale_note(notes)}"
+        return result
+    return wrapper
@@ -0,0 +1,123 @@
+"""
+单次工具调用的时间预算
+调用开始时设定截止时间，每个可选阶段（图表、策略分析等）开始前按该阶段近期耗时的高分位数估算成本，
+剩余时间不够时跳过该阶段（或使用缓存的结果），并在回答中注明跳过了什么
+
+各阶段的耗时在每次执行时记录（不论是否设置了预算），估算值取最近 window 次耗时的 quantile 分位数，
+没有样本时使用 defaults 中的先验值。quantile 取 0.99 时，按 P99 耗时预留时间
+
+环境变量:
+    BTC_BUDGET_QUANTILE  估算阶段耗时使用的分位数（默认 0.95）
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+DEFAULT_QUANTILE = float(os.getenv('BTC_BUDGET_QUANTILE', '0.95'))
+
+_current_budget = contextvars.ContextVar('call_budget', default=None)
+
+
+class BudgetExceeded(Exception):
+    """剩余时间不足，可选阶段未执行"""
+
+
+class StageEstimator:
+    """记录各阶段最近的耗时，按分位数估算下一次的耗时"""
+
+    def __init__(self, defaults=None, window=100, quantile=DEFAULT_QUANTILE):
+        self.defaults = dict(defaults or {})
+        self.quantile = quantile
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def estimate(self, *stages):
+        """多个阶段耗时估算之和（秒）"""
+        total = 0.0
+        with self._lock:
+            for stage in stages:
+                samples = self._samples.get(stage)
+                if samples:
+                    total += float(np.quantile(np.fromiter(samples, dtype=float), self.quantile))
+                else:
+                    total += self.defaults.get(stage, 0.0)
+        return total
+
+
+class CallBudget:
+    """
+    一次调用的截止时间和跳过记录
+    seconds 为 None 或 0 时不限时，allows() 总是返回 True，但阶段耗时照常记录
+    """
+
+    def __init__(self, seconds, estimator):
+        self.seconds = seconds or None
+        self.estimator = estimator
+        self.started = time.perf_counter()
+        self.skipped = []
+        self.reused = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def remaining(self):
+        if self.seconds is None:
+            return float('inf')
+        return self.seconds - self.elapsed()
+
+    def estimate(self, *stages):
+        return self.estimator.estimate(*stages)
+
+    def allows(self, *stages):
+        """剩余时间是否足够执行这些阶段"""
+        return self.seconds is None or self.remaining() >= self.estimate(*stages)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """执行一个阶段并记录耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.estimator.record(name, time.perf_counter() - started)
+
+    def skip(self, label):
+        self.skipped.append(label)
+
+    def reuse(self, label, age):
+        self.reused.append((label, age))
+
+    def note(self):
+        """跳过或使用缓存结果的说明，没有时返回空字符串"""
+        parts = []
+        if self.skipped:
+            parts.append(f"已跳过{'、'.join(self.skipped)}")
+        if self.reused:
+            parts.append('，'.join(f"{label}使用 {age:.0f} 秒前的结果" for label, age in self.reused))
+        if not parts:
+            return ''
+        return f"*注: 为在 {self.seconds:g} 秒内返回，{'；'.join(parts)}*"
+
+
+@contextlib.contextmanager
+def call_budget(seconds, estimator):
+    """设定本次调用的预算；外层已经设定时沿用外层的（异步工具在预取数据前设定，同步处理流程沿用）"""
+    budget = _current_budget.get()
+    if budget is not None:
+        yield budget
+        return
+    budget = CallBudget(seconds, estimator)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
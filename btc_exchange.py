@@ -0,0 +1,102 @@
+"""
+交易所客户端工厂
+Binance 客户端在第一次使用时才创建（导入 binance 包较慢，且构造时默认会 ping 交易所），
+所有工具和后台任务通过 get_client() 共享同一个实例；基准测试和离线环境可以用 set_client() 替换
+
+环境变量 BTC_EXCHANGE_MODE 选择客户端模式（见 btc_replay）:
+    live    直接访问交易所（默认）
+    record  访问交易所，同时把请求和响应录制到 BTC_EXCHANGE_SESSION
+    replay  不访问交易所，从 BTC_EXCHANGE_SESSION 回放，延迟由 BTC_REPLAY_LATENCY / BTC_REPLAY_JITTER 控制
+
+访问交易所的客户端（live / record）经过 btc_weight_governor 的共享权重调度和 btc_circuit_breaker 的熔断器，
+请求超时时间由 BTC_EXCHANGE_TIMEOUT 设置（秒，默认 10）
+"""
+import os
+import threading
+
+# K线周期常量，取值与 binance.Client.KLINE_INTERVAL_* 相同，避免为了常量而导入 binance
+KLINE_INTERVAL_1MINUTE = '1m'
+KLINE_INTERVAL_15MINUTE = '15m'
+KLINE_INTERVAL_1HOUR = '1h'
+KLINE_INTERVAL_4HOUR = '4h'
+KLINE_INTERVAL_1DAY = '1d'
+
+_client = None
+_client_lock = threading.Lock()
+# 是否通过 set_client() 注入了自定义客户端（测试替身、回放等）
+_client_injected = False
+
+
+def create_client():
+    """创建 Binance 客户端，无需 API Key 即可访问公开数据；构造时不 ping 交易所"""
+    from binance import Client
+
+    # 不设置超时的话，交易所无响应时请求会一直挂起
+    requests_params = {'timeout': float(os.getenv('BTC_EXCHANGE_TIMEOUT', '10'))}
+    try:
+        return Client(ping=False, requests_params=requests_params)
+    except TypeError:
+        # 旧版本 python-binance 不支持 ping 参数
+        return Client(requests_params=requests_params)
+
+
+def governed(client):
+    """包裹共享的请求权重调度（BTC_WEIGHT_GOVERNOR=0 时不包裹）"""
+    from btc_weight_governor import GovernedClient, get_governor, governor_enabled
+
+    return GovernedClient(client, get_governor()) if governor_enabled() else client
+
+
+def with_breaker(client):
+    """包裹交易所共用的熔断器"""
+    from btc_circuit_breaker import BreakerClient, get_breaker
+
+    return BreakerClient(client, get_breaker())
+
+
+def create_mode_client(mode=None):
+    """按 BTC_EXCHANGE_MODE 创建直连、录制或回放客户端"""
+    mode = (mode or os.getenv('BTC_EXCHANGE_MODE', 'live')).lower()
+    if mode == 'live':
+        return with_breaker(governed(create_client()))
+
+    import btc_replay
+
+    session = os.getenv('BTC_EXCHANGE_SESSION', btc_replay.DEFAULT_SESSION_FILE)
+    if mode == 'record':
+        # 录制原始请求，熔断器在录制之外
+        return with_breaker(btc_replay.RecordingClient(governed(create_client()), session))
+    if mode == 'replay':
+        latency = os.getenv('BTC_REPLAY_LATENCY')
+        return btc_replay.ReplayClient(
+            session,
+            latency=float(latency) if latency else None,
+            jitter=float(os.getenv('BTC_REPLAY_JITTER', '0')),
+        )
+    raise ValueError(f"未知的交易所客户端模式: {mode}")
+
+
+def get_client():
+    """返回共享的交易所客户端，首次调用时创建"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import btc_metrics
+
+                client = create_mode_client()
+                # 开启指标时统计每个接口的调用次数和耗时
+                _client = btc_metrics.InstrumentedClient(client) if btc_metrics.enabled() else client
+    return _client
+
+
+def set_client(client):
+    """替换共享客户端（用于测试、基准测试或离线回放），传入 None 则下次使用时重新创建"""
+    global _client, _client_injected
+    with _client_lock:
+        _client = client
+        _client_injected = client is not None
+
+
+def client_injected():
+    return _client_injected
@@ -0,0 +1,279 @@
+"""
+技术指标的纯 NumPy 实现
+输入为收盘价、最高价、最低价、成交量等一维数组（可以是共享内存中的视图），
+计算口径与 GetRealTimePriceTool.calculate_technical_indicators 保持一致，
+用于参数扫描等需要大量重复计算、不适合构建 DataFrame 的场景
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 默认指标周期，与 calculate_technical_indicators 中写死的参数相同
+DEFAULT_PERIODS = {
+    'ma_short': 5,
+    'ma_mid': 10,
+    'ma_long': 20,
+    'rsi_period': 14,
+    'boll_period': 20,
+}
+
+# 参与评分的指标，顺序与 OptimizedTradingStrategy 的权重键对应
+SIGNAL_COLUMNS = ('MA', 'MACD', 'SAR', 'BOLL', 'RSI', 'KDJ', 'VOL')
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def _rolling(values, window, func):
+    """
+    对滑动窗口执行聚合，前 window-1 个位置为 NaN
+    窗口内只要有 NaN 结果就是 NaN（与 pandas rolling 默认的 min_periods 一致）
+    """
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if window <= 0 or len(values) < window:
+        return out
+    out[window - 1:] = func(sliding_window_view(values, window), axis=-1)
+    return out
+
+
+def rolling_mean(values, window):
+    return _rolling(values, window, np.mean)
+
+
+def rolling_std(values, window):
+    return _rolling(values, window, lambda v, axis: np.std(v, axis=axis, ddof=1))
+
+
+def rolling_min(values, window):
+    return _rolling(values, window, np.min)
+
+
+def rolling_max(values, window):
+    return _rolling(values, window, np.max)
+
+
+def ewm_mean(values, alpha):
+    """
+    等价于 pandas 的 ewm(alpha=alpha, adjust=False).mean()
+    开头的 NaN 保持为 NaN，中间的 NaN 沿用前值
+    """
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    finite = np.flatnonzero(np.isfinite(values))
+    if len(finite) == 0:
+        return out
+    start = finite[0]
+    series = values[start:].copy()
+    # 中间缺失值向前填充，避免递推被 NaN 污染
+    mask = ~np.isfinite(series)
+    if mask.any():
+        idx = np.where(mask, 0, np.arange(len(series)))
+        np.maximum.accumulate(idx, out=idx)
+        series = series[idx]
+    try:
+        from scipy.signal import lfilter
+        smoothed, _ = lfilter([alpha], [1.0, alpha - 1.0], series, zi=[(1.0 - alpha) * series[0]])
+    except ImportError:
+        smoothed = np.empty_like(series)
+        prev = series[0]
+        for i, value in enumerate(series):
+            prev = prev + alpha * (value - prev)
+            smoothed[i] = prev
+    out[start:] = smoothed
+    return out
+
+
+def ema(values, span):
+    return ewm_mean(values, 2.0 / (span + 1.0))
+
+
+def diff(values):
+    values = _as_float(values)
+    out = np.empty_like(values)
+    out[:1] = np.nan
+    out[1:] = values[1:] - values[:-1]
+    return out
+
+
+def shift(values, periods=1):
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if periods < len(values):
+        out[periods:] = values[:len(values) - periods]
+    return out
+
+
+def rsi(close, period=14):
+    delta = diff(close)
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), period)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+
+def kdj(close, high, low, n=9, m1=3, m2=3):
+    llv = rolling_min(low, n)
+    hhv = rolling_max(high, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (_as_float(close) - llv) / (hhv - llv) * 100
+    k = ewm_mean(rsv, 1.0 / m1)
+    d = ewm_mean(k, 1.0 / m2)
+    return k, d, 3 * k - 2 * d
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(close, period=20, width=2.0):
+    middle = rolling_mean(close, period)
+    std = rolling_std(close, period)
+    return middle + std * width, middle, middle - std * width
+
+
+def parabolic_sar(close, high, low, step=0.02, max_af=0.2):
+    """与 calculate_technical_indicators 中的 SAR 循环保持相同的递推规则"""
+    close = _as_float(close)
+    high = _as_float(high).tolist()
+    low = _as_float(low).tolist()
+    out = np.zeros(len(close))
+    if len(close) == 0:
+        return out
+    af = step
+    sar = ep = float(close[0])
+    trend = 1
+    for i in range(1, len(close)):
+        sar = sar + af * (ep - sar)
+        if trend == 1:
+            if low[i] < sar:
+                trend, sar, ep, af = -1, ep, low[i], step
+            elif high[i] > ep:
+                ep = high[i]
+                af = min(af + step, max_af)
+        else:
+            if high[i] > sar:
+                trend, sar, ep, af = 1, ep, high[i], step
+            elif low[i] < ep:
+                ep = low[i]
+                af = min(af + step, max_af)
+        out[i] = sar
+    return out
+
+
+def obv(close, volume):
+    close = _as_float(close)
+    volume = _as_float(volume)
+    out = np.zeros(len(close))
+    if len(close) > 1:
+        direction = np.sign(close[1:] - close[:-1])
+        out[1:] = np.cumsum(direction * volume[1:])
+    return out
+
+
+def true_range(high, low, close):
+    high = _as_float(high)
+    low = _as_float(low)
+    prev_close = shift(close)
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(high, low, close, period=14):
+    """Wilder 平滑的 ATR，以第一个完整窗口的均值作为起点"""
+    tr = true_range(high, low, close)
+    out = rolling_mean(tr, period)
+    valid = np.flatnonzero(np.isfinite(out))
+    if len(valid) == 0:
+        return out
+    prev = out[valid[0]]
+    for i in range(valid[0] + 1, len(out)):
+        prev = (prev * (period - 1) + tr[i]) / period
+        out[i] = prev
+    return out
+
+
+def adx(high, low, close, period=14):
+    """与 OptimizedTradingStrategy.calculate_adx 相同的简单均值口径"""
+    up = diff(high)
+    down = -diff(low)
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down >= up) & (down > 0), down, 0.0)
+    plus_dm[:1] = np.nan
+    minus_dm[:1] = np.nan
+    atr_mean = rolling_mean(true_range(high, low, close), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = rolling_mean(plus_dm, period) / atr_mean * 100
+        minus_di = rolling_mean(minus_dm, period) / atr_mean * 100
+        dx = np.abs(plus_di - minus_di) / (plus_di + minus_di) * 100
+    return rolling_mean(dx, period)
+
+
+def compute_indicator_arrays(close, high, low, volume, periods=None):
+    """
+    一次性计算策略评分所需的全部指标，返回 {列名: ndarray}
+    均线周期可调，因此用 MA_SHORT/MA_MID/MA_LONG 命名，
+    其余列名与 calculate_technical_indicators 生成的 DataFrame 列名保持一致
+    """
+    p = dict(DEFAULT_PERIODS)
+    if periods:
+        p.update(periods)
+    close = _as_float(close)
+    high = _as_float(high)
+    low = _as_float(low)
+    volume = _as_float(volume)
+
+    result = {
+        'MA_SHORT': rolling_mean(close, p['ma_short']),
+        'MA_MID': rolling_mean(close, p['ma_mid']),
+        'MA_LONG': rolling_mean(close, p['ma_long']),
+        'RSI': rsi(close, p['rsi_period']),
+        'SAR': parabolic_sar(close, high, low),
+        'VOL10': rolling_mean(volume, 10),
+        'OBV': obv(close, volume),
+        'ADX': adx(high, low, close),
+    }
+    result['K'], result['D'], result['J'] = kdj(close, high, low)
+    result['MACD'], result['Signal_Line'], result['MACD_Hist'] = macd(close)
+    result['Upper_Band'], _, result['Lower_Band'] = bollinger(close, p['boll_period'])
+    return result
+
+
+def indicator_signal_matrix(close, volume, indicators, adx_threshold=25):
+    """
+    按 calculate_technical_score 的规则逐根K线给出各指标的 -1/0/+1 信号
+    返回 (signals, volume_flag, trending)：
+    signals 的列顺序为 SIGNAL_COLUMNS，volume_flag 表示放量，trending 表示趋势市
+    """
+    close = _as_float(close)
+    volume = _as_float(volume)
+    ind = indicators
+
+    def _vote(bull, bear):
+        return np.where(bull, 1, np.where(bear, -1, 0)).astype(np.int8)
+
+    signals = np.empty((len(close), len(SIGNAL_COLUMNS)), dtype=np.int8)
+    columns = {
+        'MA': _vote((ind['MA_SHORT'] > ind['MA_MID']) & (ind['MA_MID'] > ind['MA_LONG']),
+                    (ind['MA_SHORT'] < ind['MA_MID']) & (ind['MA_MID'] < ind['MA_LONG'])),
+        'MACD': _vote((ind['MACD'] > ind['Signal_Line']) & (ind['MACD_Hist'] > 0),
+                      (ind['MACD'] < ind['Signal_Line']) & (ind['MACD_Hist'] < 0)),
+        'SAR': np.where(close > ind['SAR'], 1, -1).astype(np.int8),
+        'BOLL': _vote(close < ind['Lower_Band'], close > ind['Upper_Band']),
+        'RSI': _vote(ind['RSI'] < 30, ind['RSI'] > 70),
+        'KDJ': _vote((ind['K'] > ind['D']) & (ind['K'] < 80),
+                     (ind['K'] < ind['D']) & (ind['K'] > 20)),
+        # 原策略中 VOL 有权重但从未打分，这里保持同样的行为
+        'VOL': np.zeros(len(close), dtype=np.int8),
+    }
+    for i, name in enumerate(SIGNAL_COLUMNS):
+        signals[:, i] = columns[name]
+
+    volume_flag = (volume > ind['VOL10'] * 1.2).astype(np.int8)
+    adx_values = ind['ADX']
+    trending = ((adx_values > adx_threshold) &
+                (rolling_mean(adx_values, 20) > adx_threshold)).astype(np.int8)
+    return signals, volume_flag, trending
+
@@ -0,0 +1,84 @@
+"""
+Binance K线原始数据解析
+交易所返回的K线是 12 列的列表（时间戳为整数，价格和成交量为字符串），
+这里直接按列转换为带类型的 NumPy 数组，只保留需要的列，
+不再先构建 12 列字符串 DataFrame 再逐列 astype(float)
+"""
+from operator import itemgetter
+
+import numpy as np
+
+# 交易所返回的K线字段顺序
+KLINE_FIELDS = (
+    '开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量',
+    '收盘时间戳', '成交额', '成交笔数', '主动买入成交量', '主动买入成交额', '忽略'
+)
+KLINE_INDEX = {name: i for i, name in enumerate(KLINE_FIELDS)}
+
+# 整数类型的字段，其余按浮点数解析
+INTEGER_FIELDS = ('开盘时间戳', '收盘时间戳', '成交笔数')
+
+# 默认保留的字段：时间戳和 OHLCV
+OHLCV_FIELDS = ('开盘时间戳', '开盘价', '最高价', '最低价', '收盘价', '成交量')
+
+
+def _field_dtype(name, float_dtype):
+    return np.int64 if name in INTEGER_FIELDS else float_dtype
+
+
+def parse_klines(klines, fields=OHLCV_FIELDS, float_dtype=np.float64):
+    """
+    把原始K线列表解析为 {字段名: ndarray}
+    时间戳为 int64 毫秒，价格和成交量为 float64（或传入 np.float32 节省内存）
+    """
+    n = len(klines)
+    columns = {}
+    for name in fields:
+        getter = itemgetter(KLINE_INDEX[name])
+        dtype = _field_dtype(name, float_dtype)
+        if dtype is np.int64:
+            columns[name] = np.fromiter(map(getter, klines), dtype=np.int64, count=n)
+        else:
+            columns[name] = np.fromiter(map(float, map(getter, klines)), dtype=dtype, count=n)
+    return columns
+
+
+def kline_dtype(fields=OHLCV_FIELDS, float_dtype=np.float64):
+    """结构化数组的字段类型"""
+    return np.dtype([(name, _field_dtype(name, float_dtype)) for name in fields])
+
+
+def parse_klines_structured(klines, fields=OHLCV_FIELDS, float_dtype=np.float64):
+    """把原始K线列表解析为结构化数组，每个元素对应一根K线"""
+    columns = parse_klines(klines, fields, float_dtype)
+    out = np.empty(len(klines), dtype=kline_dtype(fields, float_dtype))
+    for name, values in columns.items():
+        out[name] = values
+    return out
+
+
+def klines_to_frame(klines, time_column='开盘时间', fields=('开盘价', '最高价', '最低价', '收盘价', '成交量'),
+                    close_time_column=None, date_column=None, float_dtype=np.float64):
+    """
+    把原始K线列表转换为只包含所需列的 DataFrame
+    time_column: 开盘时间转换后的 datetime 列名（如 '开盘时间'、'时间'、'日期'）
+    close_time_column: 需要收盘时间时指定列名
+    date_column: 需要按日期（datetime.date）分组时指定列名
+    """
+    import pandas as pd
+
+    wanted = ['开盘时间戳'] + list(fields)
+    if close_time_column:
+        wanted.append('收盘时间戳')
+    columns = parse_klines(klines, wanted, float_dtype)
+
+    data = {}
+    open_time = pd.to_datetime(columns.pop('开盘时间戳'), unit='ms')
+    if date_column:
+        data[date_column] = open_time.date
+    data[time_column] = open_time
+    for name in fields:
+        data[name] = columns[name]
+    if close_time_column:
+        data[close_time_column] = pd.to_datetime(columns.pop('收盘时间戳'), unit='ms')
+    return pd.DataFrame(data)
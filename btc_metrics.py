@@ -0,0 +1,336 @@
+"""
+轻量级耗时追踪与 Prometheus 文本格式指标
+工具内部的各个阶段（交易所请求、指标计算、绘图、大模型等）用 span() 或 traced() 包裹，
+记录耗时直方图、缓存命中次数和外部调用次数，通过本地 HTTP 端点以 Prometheus 文本格式导出
+
+默认关闭（环境变量 BTC_METRICS=1 开启），关闭时 span() 返回共享的空上下文管理器，几乎没有额外开销
+"""
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = os.getenv('BTC_METRICS', '0').lower() not in ('', '0', 'false', 'no')
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name + _format_labels(self.labels, key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        result = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, f'le="{bound}"')
+                result.append((f'{self.name}_bucket{labels}', cumulative))
+            inf_labels = _format_labels(self.labels, key, 'le="+Inf"')
+            result.append((f'{self.name}_bucket{inf_labels}', count))
+            result.append((f'{self.name}_sum{_format_labels(self.labels, key)}', total))
+            result.append((f'{self.name}_count{_format_labels(self.labels, key)}', count))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """按 Prometheus 文本格式输出全部指标"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample, value in metric.samples():
+                lines.append(f'{sample} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'btc_tool_stage_seconds', '工具各阶段耗时（秒）', ('tool', 'stage'))
+STAGE_ERRORS = registry.counter(
+    'btc_tool_stage_errors_total', '工具各阶段抛出异常的次数', ('tool', 'stage'))
+CACHE_REQUESTS = registry.counter(
+    'btc_cache_requests_total', '缓存访问次数', ('cache', 'result'))
+EXTERNAL_CALLS = registry.counter(
+    'btc_external_calls_total', '外部服务调用次数', ('service', 'endpoint'))
+EXTERNAL_SECONDS = registry.histogram(
+    'btc_external_call_seconds', '外部服务调用耗时（秒）', ('service', 'endpoint'))
+SINGLE_FLIGHT_CALLS = registry.counter(
+    'btc_single_flight_calls_total', '工具调用次数，按实际执行和被合并区分', ('tool', 'result'))
+WEIGHT_USED = registry.gauge(
+    'btc_exchange_weight_used', '当前窗口已使用的交易所请求权重')
+WEIGHT_REMAINING = registry.gauge(
+    'btc_exchange_weight_remaining', '当前窗口剩余的交易所请求权重')
+WEIGHT_WAIT_SECONDS = registry.histogram(
+    'btc_exchange_weight_wait_seconds', '等待交易所请求权重额度的时间（秒）', ('priority',))
+WEIGHT_REJECTED = registry.counter(
+    'btc_exchange_weight_rejected_total', '因权重额度不足被拒绝的交易所请求次数', ('priority',))
+WEIGHT_LIMITED = registry.counter(
+    'btc_exchange_rate_limited_total', '交易所返回 429 / 418 的次数', ('status',))
+CIRCUIT_STATE = registry.gauge(
+    'btc_circuit_state', '熔断器状态（0 正常，1 探测中，2 熔断）', ('name',))
+CIRCUIT_REJECTED = registry.counter(
+    'btc_circuit_rejected_total', '熔断期间被直接拒绝的请求次数', ('name',))
+STALE_SERVED = registry.counter(
+    'btc_stale_served_total', '使用过期数据兜底的次数', ('kind',))
+CHART_STORE_FILES = registry.gauge(
+    'btc_chart_store_files', '图表目录中的文件数')
+CHART_STORE_BYTES = registry.gauge(
+    'btc_chart_store_bytes', '图表目录占用的磁盘空间（字节）')
+CHART_STORE_EVICTED = registry.counter(
+    'btc_chart_store_evicted_total', '被删除的图表文件数，按过期和超出配额区分', ('reason',))
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('tool', 'stage', 'started')
+
+    def __init__(self, tool, stage):
+        self.tool = tool
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(self.tool, self.stage, value=time.perf_counter() - self.started)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.tool, self.stage)
+        return False
+
+
+def span(tool, stage):
+    """记录一个阶段的耗时：with span('get_real_time_price', 'indicators'): ..."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(tool, stage)
+
+
+def traced(tool, stage):
+    """方法装饰器，记录整个方法的耗时"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(tool, stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hit):
+    if _enabled:
+        CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def record_single_flight(tool, collapsed):
+    if _enabled:
+        SINGLE_FLIGHT_CALLS.inc(tool, 'collapsed' if collapsed else 'executed')
+
+
+def record_external_call(service, endpoint, seconds=None):
+    if _enabled:
+        EXTERNAL_CALLS.inc(service, endpoint)
+        if seconds is not None:
+            EXTERNAL_SECONDS.observe(service, endpoint, value=seconds)
+
+
+class InstrumentedClient:
+    """
+    交易所客户端代理，统计每个接口的调用次数和耗时
+    只在开启指标时由 btc_exchange 包裹，关闭时直接使用原始客户端
+    """
+
+    def __init__(self, client, service='binance'):
+        self._client = client
+        self._service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_external_call(self._service, name, time.perf_counter() - started)
+        return wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """在后台线程启动 /metrics 端点，返回 HTTP 服务实例"""
+    port = int(port or os.getenv('BTC_METRICS_PORT', '9464'))
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+def instrument_llm(llm, tool='llm'):
+    """
+    包装大模型的 chat 方法，记录首个分片耗时和整体耗时
+    流式调用返回生成器，耗时在生成器迭代结束时记录
+    """
+    chat = llm.chat
+
+    @functools.wraps(chat)
+    def timed_chat(*args, **kwargs):
+        started = time.perf_counter()
+        result = chat(*args, **kwargs)
+        if not hasattr(result, '__next__'):
+            STAGE_SECONDS.observe(tool, 'total', value=time.perf_counter() - started)
+            return result
+
+        def stream():
+            first = True
+            try:
+                for chunk in result:
+                    if first:
+                        STAGE_SECONDS.observe(tool, 'first_chunk', value=time.perf_counter() - started)
+                        first = False
+                    yield chunk
+            finally:
+                STAGE_SECONDS.observe(tool, 'total', value=time.perf_counter() - started)
+        return stream()
+
+    llm.chat = timed_chat
+    return llm
@@ -0,0 +1,422 @@
+"""
+本地维护的全深度订单簿
+get_real_time_price 原来每次只请求 get_order_book(limit=1)，策略只看得到买一和卖一；每次请求都通过 REST 拉取
+深度盘口的权重和延迟又太高。OrderBookSync 按 Binance 的增量深度流（<symbol>@depth）在本地维护完整盘口：
+
+1. 先开始接收增量事件并缓存
+2. 请求一次快照（get_order_book(limit=depth)），丢弃 u <= lastUpdateId 的事件
+3. 之后每个事件的 U 必须不大于上一个已应用的 u + 1（第一个事件满足 U <= lastUpdateId + 1 <= u）
+4. 序号断档（丢包、断线重连）时丢弃本地盘口，重新请求快照并应用缓存的事件
+
+每一侧的价格档位保存为按价格排序的 numpy 数组，更新一档为一次二分查找（插入和删除时在数组内移动之后的元素）；
+前 N 档的深度加权中间价、买卖盘不平衡度和 X% 范围内的流动性都是一次二分查找加切片求和，在微秒级完成
+
+事件来源与传输方式无关：on_event() 接收 depthUpdate 格式的字典，start_depth_stream() 用 python-binance 的
+ThreadedWebsocketManager 订阅。指定 record_path 时收到的事件和请求的快照按顺序写入 JSONL（.gz）文件，
+replay_stream() 重放录制文件，用于离线测试和基准（见 benchmarks/bench_order_book.py）
+
+盘口只在订阅深度流的进程（WebUI 进程）中维护，其他进程和盘口失效时工具照常通过 REST 请求买一卖一
+
+环境变量:
+    BTC_ORDER_BOOK          设为 1 时为 BTC_FEED_SYMBOLS 维护本地订单簿（默认 0）
+    BTC_ORDER_BOOK_DEPTH    快照的档位数（默认 1000）
+    BTC_ORDER_BOOK_MAX_AGE  盘口超过该秒数没有更新时视为失效（默认 10）
+    BTC_ORDER_BOOK_RECORD   录制增量事件和快照的目录（默认不录制）
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def order_book_enabled():
+    return os.getenv('BTC_ORDER_BOOK', '0').lower() not in ('', '0', 'false', 'no')
+
+
+class SequenceGap(Exception):
+    """增量事件的序号不连续，需要重新请求快照"""
+
+
+class BookSide:
+    """
+    盘口的一侧：按键排序的价格数组和对应的数量数组（买盘的键为负价格，两侧都是最优价在前），
+    数组预留容量，插入和删除一档只在数组内移动之后的元素；区间的数量和金额用 numpy 切片求和
+    """
+
+    def __init__(self, bids, capacity=1024):
+        self.sign = -1.0 if bids else 1.0
+        self._keys = np.empty(capacity)
+        self._quantities = np.empty(capacity)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def load(self, levels):
+        """用快照的 [[价格, 数量], ...] 替换全部档位"""
+        items = sorted((self.sign * float(price), float(quantity)) for price, quantity in levels if float(quantity) > 0)
+        capacity = max(1024, 2 * len(items))
+        self._keys = np.empty(capacity)
+        self._quantities = np.empty(capacity)
+        self._size = len(items)
+        if items:
+            self._keys[:self._size], self._quantities[:self._size] = zip(*items)
+
+    def update(self, price, quantity):
+        """设置一档的数量，数量为 0 时删除该档"""
+        key = self.sign * float(price)
+        quantity = float(quantity)
+        size = self._size
+        index = int(np.searchsorted(self._keys[:size], key))
+        exists = index < size and self._keys[index] == key
+        if quantity > 0:
+            if exists:
+                self._quantities[index] = quantity
+                return
+            if size == len(self._keys):
+                self._keys = np.concatenate([self._keys, np.empty(size)])
+                self._quantities = np.concatenate([self._quantities, np.empty(size)])
+            self._keys[index + 1:size + 1] = self._keys[index:size]
+            self._quantities[index + 1:size + 1] = self._quantities[index:size]
+            self._keys[index] = key
+            self._quantities[index] = quantity
+            self._size += 1
+        elif exists:
+            self._keys[index:size - 1] = self._keys[index + 1:size]
+            self._quantities[index:size - 1] = self._quantities[index + 1:size]
+            self._size -= 1
+
+    def best(self):
+        """最优一档 (价格, 数量)，没有档位时返回 None"""
+        if not self._size:
+            return None
+        return self.sign * float(self._keys[0]), float(self._quantities[0])
+
+    def top(self, count):
+        """前 count 档 [(价格, 数量), ...]"""
+        count = min(count, self._size)
+        return list(zip((self._keys[:count] * self.sign).tolist(), self._quantities[:count].tolist()))
+
+    def depth(self, count):
+        """前 count 档的 (总数量, 总金额)"""
+        return self._sum(min(count, self._size))
+
+    def within(self, limit_price):
+        """价格不劣于 limit_price 的全部档位的 (总数量, 总金额)"""
+        return self._sum(int(np.searchsorted(self._keys[:self._size], self.sign * limit_price, side='right')))
+
+    def _sum(self, count):
+        quantities = self._quantities[:count]
+        return float(quantities.sum()), float(quantities @ self._keys[:count]) * self.sign
+
+
+class OrderBook:
+    """单个交易对的本地盘口，更新和查询都持有锁（深度流线程写入，工具线程读取）"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol.upper()
+        self.bids = BookSide(bids=True)
+        self.asks = BookSide(bids=False)
+        self.last_update_id = None
+        self.updated_at = None
+        # metrics() 在持有锁时调用其他查询方法
+        self._lock = threading.RLock()
+
+    def load_snapshot(self, snapshot):
+        """加载 REST 快照（get_order_book 的返回值）"""
+        with self._lock:
+            self.bids.load(snapshot['bids'])
+            self.asks.load(snapshot['asks'])
+            self.last_update_id = int(snapshot['lastUpdateId'])
+            self.updated_at = time.time()
+
+    def apply(self, event):
+        """
+        应用一个增量事件：已包含在盘口中的旧事件返回 False，应用后返回 True，
+        与上一个事件之间有缺失时抛出 SequenceGap（盘口不变）
+        """
+        first, last = int(event['U']), int(event['u'])
+        with self._lock:
+            if self.last_update_id is None:
+                raise SequenceGap(f"{self.symbol} 盘口尚未加载快照")
+            if last <= self.last_update_id:
+                return False
+            if first > self.last_update_id + 1:
+                raise SequenceGap(f"{self.symbol} 增量事件缺失: 已应用到 {self.last_update_id}，收到 {first}~{last}")
+            for price, quantity in event['b']:
+                self.bids.update(price, quantity)
+            for price, quantity in event['a']:
+                self.asks.update(price, quantity)
+            self.last_update_id = last
+            self.updated_at = time.time()
+            return True
+
+    def age_seconds(self):
+        return time.time() - self.updated_at if self.updated_at is not None else float('inf')
+
+    def snapshot(self, limit=100):
+        """与 get_order_book 格式相同的前 limit 档盘口"""
+        with self._lock:
+            return {
+                'lastUpdateId': self.last_update_id,
+                'bids': [[f'{price:.8f}', f'{quantity:.8f}'] for price, quantity in self.bids.top(limit)],
+                'asks': [[f'{price:.8f}', f'{quantity:.8f}'] for price, quantity in self.asks.top(limit)],
+            }
+
+    def best(self):
+        """(买一 (价格, 数量), 卖一 (价格, 数量))，一侧为空时为 None"""
+        with self._lock:
+            return self.bids.best(), self.asks.best()
+
+    def mid(self):
+        bid, ask = self.best()
+        return (bid[0] + ask[0]) / 2 if bid and ask else None
+
+    def weighted_mid(self, levels=20):
+        """
+        深度加权中间价：前 levels 档买盘和卖盘的成交量加权均价，按对侧的数量加权
+        （卖盘更厚时价格更接近买盘，反之亦然），任一侧为空时返回 None
+        """
+        with self._lock:
+            bid_quantity, bid_notional = self.bids.depth(levels)
+            ask_quantity, ask_notional = self.asks.depth(levels)
+        if not bid_quantity or not ask_quantity:
+            return None
+        bid_vwap, ask_vwap = bid_notional / bid_quantity, ask_notional / ask_quantity
+        return (bid_vwap * ask_quantity + ask_vwap * bid_quantity) / (bid_quantity + ask_quantity)
+
+    def imbalance(self, levels=20):
+        """前 levels 档的买卖盘不平衡度 (买量 - 卖量) / (买量 + 卖量)，范围 -1~1，正数表示买盘更厚"""
+        with self._lock:
+            bid_quantity = self.bids.depth(levels)[0]
+            ask_quantity = self.asks.depth(levels)[0]
+        total = bid_quantity + ask_quantity
+        return (bid_quantity - ask_quantity) / total if total else None
+
+    def liquidity(self, percent=1.0):
+        """
+        中间价上下 percent% 范围内的流动性：
+        {'bid_quantity', 'bid_notional', 'ask_quantity', 'ask_notional'}，盘口一侧为空时返回 None
+        """
+        with self._lock:
+            bid, ask = self.bids.best(), self.asks.best()
+            if bid is None or ask is None:
+                return None
+            mid = (bid[0] + ask[0]) / 2
+            bid_quantity, bid_notional = self.bids.within(mid * (1 - percent / 100))
+            ask_quantity, ask_notional = self.asks.within(mid * (1 + percent / 100))
+        return {'bid_quantity': bid_quantity, 'bid_notional': bid_notional,
+                'ask_quantity': ask_quantity, 'ask_notional': ask_notional}
+
+    def metrics(self, levels=20, percent=1.0):
+        """工具使用的盘口指标（同一时刻的盘口），盘口为空时返回 None"""
+        with self._lock:
+            bid, ask = self.best()
+            if bid is None or ask is None:
+                return None
+            liquidity = self.liquidity(percent)
+            return {
+                'update_id': self.last_update_id,
+                'spread': ask[0] - bid[0],
+                'weighted_mid': self.weighted_mid(levels),
+                'imbalance': self.imbalance(levels),
+                'levels': levels,
+                'liquidity_percent': percent,
+                'bid_notional_within': liquidity['bid_notional'],
+                'ask_notional_within': liquidity['ask_notional'],
+            }
+
+
+class OrderBookSync:
+    """
+    快照 + 增量事件的同步：未同步时缓存事件，请求快照后应用缓存中较新的事件；
+    序号断档时重新同步，两次同步至少间隔 retry_seconds 秒（失败期间事件继续缓存，最多 buffer_size 个）
+    fetch_snapshot() 返回 get_order_book 格式的快照
+    """
+
+    def __init__(self, symbol, fetch_snapshot, record_path=None, retry_seconds=1.0, buffer_size=10000):
+        self.book = OrderBook(symbol)
+        self.fetch_snapshot = fetch_snapshot
+        self.retry_seconds = retry_seconds
+        self.synced = False
+        self._buffer = deque(maxlen=buffer_size)
+        self._next_attempt = 0.0
+        self._lock = threading.RLock()
+        self._recorder = StreamRecorder(record_path) if record_path else None
+        self.stats = {'events': 0, 'applied': 0, 'skipped': 0, 'syncs': 0, 'gaps': 0, 'failures': 0}
+
+    @property
+    def symbol(self):
+        return self.book.symbol
+
+    def on_event(self, event):
+        """处理一个 depthUpdate 事件（深度流的回调）"""
+        with self._lock:
+            if self._recorder is not None:
+                self._recorder.write('event', event)
+            self.stats['events'] += 1
+            if self.synced:
+                try:
+                    self._count(self.book.apply(event))
+                    return
+                except SequenceGap as e:
+                    print(f"{str(e)}，重新同步盘口")
+                    self.stats['gaps'] += 1
+                    self.synced = False
+                    self._next_attempt = 0.0
+            self._buffer.append(event)
+            if time.monotonic() >= self._next_attempt:
+                self.sync()
+
+    def sync(self):
+        """请求快照并应用缓存的事件，成功返回 True；快照比缓存的事件还旧或请求失败时稍后重试"""
+        with self._lock:
+            self._next_attempt = time.monotonic() + self.retry_seconds
+            try:
+                snapshot = self.fetch_snapshot()
+            except Exception as e:
+                self.stats['failures'] += 1
+                print(f"获取 {self.symbol} 盘口快照失败: {str(e)}")
+                return False
+            if self._recorder is not None:
+                self._recorder.write('snapshot', snapshot)
+            self.book.load_snapshot(snapshot)
+            try:
+                while self._buffer:
+                    self._count(self.book.apply(self._buffer[0]))
+                    self._buffer.popleft()
+            except SequenceGap as e:
+                # 快照早于缓存中最早的事件，等更新的快照
+                self.stats['failures'] += 1
+                print(f"{str(e)}，稍后重新请求快照")
+                return False
+            self.synced = True
+            self.stats['syncs'] += 1
+            return True
+
+    def _count(self, applied):
+        self.stats['applied' if applied else 'skipped'] += 1
+
+    def reset(self):
+        """断线重连后调用：之后的事件重新与快照同步"""
+        with self._lock:
+            self.synced = False
+            self._buffer.clear()
+            self._next_attempt = 0.0
+
+    def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+
+
+# ---------- 录制与重放 ----------
+class StreamRecorder:
+    """按接收顺序把事件和快照写入 JSONL 文件（.gz 结尾时压缩），每行 {"type": "event"|"snapshot", "data": ...}"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = gzip.open(path, 'at', encoding='utf-8') if path.endswith('.gz') else \
+            open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, kind, data):
+        with self._lock:
+            self._file.write(json.dumps({'type': kind, 'time': time.time(), 'data': data}) + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_stream(path):
+    """读取录制文件，返回 [(种类, 数据), ...]"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [(record['type'], record['data']) for record in map(json.loads, f) if record]
+
+
+def replay_stream(records, symbol='BTCUSDT', on_record=None):
+    """
+    把录制的事件按顺序交给新的 OrderBookSync，快照请求按录制顺序依次返回录制的快照；
+    records 为 read_stream() 的结果，on_record(sync, 种类, 数据) 在处理完每条记录后调用
+    （可以在录制文件中加入其他种类的记录用于校验），返回 OrderBookSync
+    """
+    snapshots = deque(data for kind, data in records if kind == 'snapshot')
+
+    def fetch_snapshot():
+        if not snapshots:
+            raise Exception('录制文件中没有更多的快照')
+        return snapshots.popleft()
+
+    sync = OrderBookSync(symbol, fetch_snapshot, retry_seconds=0)
+    for kind, data in records:
+        if kind == 'event':
+            sync.on_event(data)
+        if on_record is not None:
+            on_record(sync, kind, data)
+    return sync
+
+
+# ---------- 进程内的盘口 ----------
+_syncs = {}
+_syncs_lock = threading.Lock()
+
+
+def register(sync):
+    with _syncs_lock:
+        _syncs[sync.symbol] = sync
+    return sync
+
+
+def local_order_book(symbol, max_age=None):
+    """本进程维护的、已同步且仍在更新的盘口，没有时返回 None（调用方改用 REST）"""
+    max_age = float(max_age if max_age is not None else os.getenv('BTC_ORDER_BOOK_MAX_AGE', '10'))
+    sync = _syncs.get(symbol.upper())
+    if sync is None or not sync.synced or sync.book.age_seconds() > max_age:
+        return None
+    return sync.book
+
+
+def start_depth_stream(symbols, client_factory, depth=None, record_dir=None):
+    """
+    用 python-binance 的 ThreadedWebsocketManager 订阅 symbols 的增量深度流并维护本地盘口，
+    快照通过 client_factory() 返回的 REST 客户端请求；未安装 python-binance 或订阅失败时返回 None
+    """
+    depth = int(depth or os.getenv('BTC_ORDER_BOOK_DEPTH', '1000'))
+    record_dir = record_dir or os.getenv('BTC_ORDER_BOOK_RECORD')
+    try:
+        from binance import ThreadedWebsocketManager
+    except ImportError as e:
+        print(f"无法订阅深度流，改用 REST 盘口: {str(e)}")
+        return None
+
+    manager = ThreadedWebsocketManager()
+    try:
+        manager.start()
+        for symbol in symbols:
+            symbol = symbol.upper()
+            record_path = os.path.join(record_dir, f"depth_{symbol}_{int(time.time())}.jsonl.gz") if record_dir else None
+            sync = register(OrderBookSync(
+                symbol, lambda symbol=symbol: client_factory().get_order_book(symbol=symbol, limit=depth),
+                record_path=record_path))
+
+            def handle(message, sync=sync):
+                if message.get('e') == 'depthUpdate':
+                    sync.on_event(message)
+                elif message.get('e') == 'error':
+                    # 断线时 python-binance 会自动重连，重连后的事件重新与快照同步
+                    print(f"{sync.symbol} 深度流错误: {message.get('m')}")
+                    sync.reset()
+
+            manager.start_depth_socket(callback=handle, symbol=symbol, interval=100)
+    except Exception as e:
+        print(f"订阅深度流失败，改用 REST 盘口: {str(e)}")
+        manager.stop()
+        return None
+    return manager
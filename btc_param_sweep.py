@@ -0,0 +1,356 @@
+"""
+交易策略参数扫描与优化
+对 OptimizedTradingStrategy 的指标权重、得分阈值以及不同市场状态下的指标周期进行批量回测，
+使用进程池并行评估成千上万组参数组合，输出按样本内夏普比率排序、附带样本外验证结果的排行榜
+
+回测只按方向和仓位（温和阈值、中/强信号强度阈值）开平仓，不模拟止损止盈，因此不扫描也不保存 strong 阈值
+（它只决定止损止盈的幅度），保存的参数文件中该项沿用默认值。--save-best 只保存样本外夏普为正的最优组合
+
+指标信号矩阵在主进程计算一次后放入共享内存，工作进程按名称挂载，任务本身只携带参数组合
+
+用法:
+    python btc_param_sweep.py --symbol BTCUSDT --interval 1h --days 365 --samples 20 --workers 8
+    python btc_param_sweep.py --symbol BTCUSDT --save-best   # 保存最优参数，策略下次启动自动加载
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from btc_exchange import get_client
+from btc_indicators import SIGNAL_COLUMNS, compute_indicator_arrays, indicator_signal_matrix
+from btc_klines import parse_klines
+from btc_shm import attach_shared_array, release_shared_memory, share_array
+from btc_strategy_params import DEFAULT_STRATEGY_PARAMS, save_strategy_params
+from btc_weight_governor import BACKFILL, request_priority
+
+# 每根K线对应的年化系数
+BARS_PER_YEAR = {
+    '15m': 365 * 24 * 4,
+    '1h': 365 * 24,
+    '4h': 365 * 6,
+    '1d': 365,
+}
+
+# 默认扫描的指标周期（包含原策略的默认值和两种市场状态的推荐值）
+DEFAULT_PERIOD_GRID = [
+    {'ma_short': 5, 'ma_mid': 10, 'ma_long': 20, 'rsi_period': 14, 'boll_period': 20},
+    DEFAULT_STRATEGY_PARAMS['regime_periods']['trending'],
+    DEFAULT_STRATEGY_PARAMS['regime_periods']['ranging'],
+    {'ma_short': 7, 'ma_mid': 14, 'ma_long': 28, 'rsi_period': 14, 'boll_period': 20},
+]
+
+# 默认扫描的信号阈值
+DEFAULT_THRESHOLD_GRID = {
+    'mild': [0.1, 0.2, 0.3],
+    'medium_strength': [0.3, 0.4],
+    'high_strength': [0.6, 0.7, 0.8],
+}
+
+# 不同信号强度对应的仓位比例（轻仓/中仓/重仓）
+POSITION_SIZES = (0.3, 0.6, 1.0)
+
+# 工作进程中挂载的共享数组
+_WORKER_ARRAYS = {}
+_WORKER_HANDLES = []
+# 工作进程内转换为浮点型的信号矩阵缓存，避免每个任务重复转换
+_WORKER_FLOAT_SIGNALS = {}
+
+
+def weights_to_vector(weights):
+    """把权重字典转换为与 SIGNAL_COLUMNS 对齐的向量"""
+    return np.array([weights.get(name, 0.0) for name in SIGNAL_COLUMNS], dtype=np.float64)
+
+
+def vector_to_weights(vector):
+    return {name: round(float(w), 4) for name, w in zip(SIGNAL_COLUMNS, vector) if w > 0}
+
+
+def sample_weights(base_weights, samples, rng, concentration=20.0):
+    """
+    在默认权重附近按 Dirichlet 分布采样权重组合，第一组始终是默认权重
+    只对默认权重中出现的指标采样，保持每种市场状态各自的指标集合
+    """
+    base = weights_to_vector(base_weights)
+    active = base > 0
+    result = [base]
+    for _ in range(max(samples - 1, 0)):
+        vector = np.zeros_like(base)
+        vector[active] = rng.dirichlet(base[active] * concentration)
+        result.append(vector)
+    return result
+
+
+def threshold_grid(grid=None):
+    """生成阈值组合（不含回测中不起作用的 strong），要求信号强度的中档下限低于强档下限"""
+    grid = grid or DEFAULT_THRESHOLD_GRID
+    combos = []
+    for mild, medium, high in itertools.product(grid['mild'], grid['medium_strength'], grid['high_strength']):
+        if medium < high:
+            combos.append({'mild': mild, 'medium_strength': medium, 'high_strength': high})
+    return combos
+
+
+def load_ohlcv(symbol, interval='1h', days=365):
+    """
+    通过共享的交易所客户端获取历史K线（支持录制 / 回放、权重控制和熔断，见 btc_exchange），
+    以回补优先级请求，返回 {'close','high','low','volume'} 数组
+    """
+    with request_priority(BACKFILL):
+        start_ms = int(time.time() * 1000) - days * 24 * 60 * 60 * 1000
+        klines = get_client().get_historical_klines(symbol=symbol, interval=interval, start_str=start_ms)
+    if not klines:
+        raise ValueError(f"没有获取到 {symbol} 的历史K线数据")
+    columns = parse_klines(klines, fields=('开盘价', '最高价', '最低价', '收盘价', '成交量'))
+    return {
+        'open': columns['开盘价'],
+        'high': columns['最高价'],
+        'low': columns['最低价'],
+        'close': columns['收盘价'],
+        'volume': columns['成交量'],
+    }
+
+
+def build_signal_arrays(ohlcv, period_grid):
+    """
+    为每组指标周期计算信号矩阵，同时计算下一根K线收益率和市场状态
+    返回 {数组名: ndarray}
+    """
+    close = ohlcv['close']
+    arrays = {}
+    trending = None
+    for idx, periods in enumerate(period_grid):
+        indicators = compute_indicator_arrays(close, ohlcv['high'], ohlcv['low'], ohlcv['volume'], periods)
+        signals, volume_flag, regime = indicator_signal_matrix(close, ohlcv['volume'], indicators)
+        arrays[f'signals_{idx}'] = signals
+        arrays[f'volume_flag_{idx}'] = volume_flag
+        # ADX周期固定，市场状态与均线等周期无关
+        if trending is None:
+            trending = regime
+    arrays['trending'] = trending
+    forward_returns = np.zeros(len(close))
+    forward_returns[:-1] = close[1:] / close[:-1] - 1
+    arrays['forward_returns'] = forward_returns
+    return arrays
+
+
+def _init_worker(specs):
+    """进程池初始化：按名称挂载共享内存中的数组"""
+    for name, spec in specs.items():
+        shm, array = attach_shared_array(spec)
+        _WORKER_HANDLES.append(shm)
+        _WORKER_ARRAYS[name] = array
+
+
+def _segment_metrics(returns, positions, bars_per_year):
+    """计算一段回测区间的收益指标"""
+    if len(returns) == 0:
+        return {'total_return': 0.0, 'sharpe': 0.0, 'max_drawdown': 0.0, 'trades': 0, 'exposure': 0.0}
+    equity = np.cumsum(np.log1p(returns))
+    peak = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    std = returns.std()
+    return {
+        'total_return': float(np.expm1(equity[-1])),
+        'sharpe': float(returns.mean() / std * np.sqrt(bars_per_year)) if std > 0 else 0.0,
+        'max_drawdown': float(np.expm1((equity - peak).min())),
+        'trades': int(np.count_nonzero(np.diff(positions))),
+        'exposure': float(np.mean(positions != 0)),
+    }
+
+
+def evaluate_combination(signals, volume_flag, trending, forward_returns, trend_w, range_w,
+                         thresholds, split, fee, bars_per_year):
+    """
+    按 calculate_technical_score / analyze_trading_strategy 的规则逐根K线生成仓位并回测
+    signals/volume_flag 为 (趋势市周期, 震荡市周期) 两组，按当根K线的市场状态选择
+    """
+    trend_signals, range_signals = signals
+    trend_flag, range_flag = volume_flag
+    is_trending = trending.astype(bool)
+    score = np.where(is_trending, trend_signals @ trend_w, range_signals @ range_w)
+    score = score + 0.5 * np.sign(score) * np.where(is_trending, trend_flag, range_flag)
+
+    direction = np.where(score > thresholds['mild'], 1.0, np.where(score < -thresholds['mild'], -1.0, 0.0))
+    strength = np.abs(score)
+    size = np.where(strength > thresholds['high_strength'], POSITION_SIZES[2],
+                    np.where(strength > thresholds['medium_strength'], POSITION_SIZES[1], POSITION_SIZES[0]))
+    positions = direction * size
+
+    turnover = np.abs(np.diff(positions, prepend=0.0))
+    returns = positions * forward_returns - fee * turnover
+    return {
+        'train': _segment_metrics(returns[:split], positions[:split], bars_per_year),
+        'test': _segment_metrics(returns[split:], positions[split:], bars_per_year),
+    }
+
+
+def _float_signals(idx):
+    if idx not in _WORKER_FLOAT_SIGNALS:
+        _WORKER_FLOAT_SIGNALS[idx] = _WORKER_ARRAYS[f'signals_{idx}'].astype(np.float64)
+    return _WORKER_FLOAT_SIGNALS[idx]
+
+
+def _run_task(task):
+    """工作进程执行一批参数组合"""
+    trend_idx, range_idx, combos, split, fee, bars_per_year = task
+    arrays = _WORKER_ARRAYS
+    signals = (_float_signals(trend_idx), _float_signals(range_idx))
+    volume_flag = (arrays[f'volume_flag_{trend_idx}'], arrays[f'volume_flag_{range_idx}'])
+    results = []
+    for trend_w, range_w, thresholds in combos:
+        metrics = evaluate_combination(signals, volume_flag, arrays['trending'], arrays['forward_returns'],
+                                       np.asarray(trend_w), np.asarray(range_w), thresholds,
+                                       split, fee, bars_per_year)
+        results.append((trend_idx, range_idx, trend_w, range_w, thresholds, metrics))
+    return results
+
+
+def run_sweep(ohlcv, period_grid=None, thresholds=None, samples=20, workers=None,
+              train_ratio=0.7, fee=0.001, interval='1h', chunk_size=64, seed=42):
+    """
+    执行参数扫描，返回按样本内夏普比率排序的结果列表
+    """
+    period_grid = period_grid or DEFAULT_PERIOD_GRID
+    thresholds = thresholds or threshold_grid()
+    rng = np.random.default_rng(seed)
+    trend_samples = sample_weights(DEFAULT_STRATEGY_PARAMS['trend_weights'], samples, rng)
+    range_samples = sample_weights(DEFAULT_STRATEGY_PARAMS['range_weights'], samples, rng)
+    weight_pairs = [(t.tolist(), r.tolist()) for t, r in zip(trend_samples, range_samples)]
+
+    n_bars = len(ohlcv['close'])
+    split = int(n_bars * train_ratio)
+    bars_per_year = BARS_PER_YEAR.get(interval, 365 * 24)
+
+    arrays = build_signal_arrays(ohlcv, period_grid)
+    handles = []
+    specs = {}
+    try:
+        for name, array in arrays.items():
+            shm, spec = share_array(array)
+            handles.append(shm)
+            specs[name] = spec
+
+        tasks = []
+        combos = [(t, r, th) for (t, r), th in itertools.product(weight_pairs, thresholds)]
+        for trend_idx, range_idx in itertools.product(range(len(period_grid)), repeat=2):
+            for start in range(0, len(combos), chunk_size):
+                tasks.append((trend_idx, range_idx, combos[start:start + chunk_size], split, fee, bars_per_year))
+
+        total = len(combos) * len(period_grid) ** 2
+        print(f"参数组合数: {total}，任务数: {len(tasks)}，K线数: {n_bars}（样本内 {split}）")
+        started = time.time()
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(specs,)) as pool:
+            for batch in pool.map(_run_task, tasks):
+                results.extend(batch)
+        print(f"扫描完成，耗时 {time.time() - started:.2f} 秒")
+    finally:
+        for shm in handles:
+            release_shared_memory(shm, unlink=True)
+
+    return build_leaderboard(results, period_grid)
+
+
+def build_leaderboard(results, period_grid):
+    """整理扫描结果为排行榜，计算样本外表现相对样本内的衰减"""
+    leaderboard = []
+    for trend_idx, range_idx, trend_w, range_w, thresholds, metrics in results:
+        train, test = metrics['train'], metrics['test']
+        leaderboard.append({
+            'trend_weights': vector_to_weights(trend_w),
+            'range_weights': vector_to_weights(range_w),
+            'signal_thresholds': thresholds,
+            'regime_periods': {
+                'trending': period_grid[trend_idx],
+                'ranging': period_grid[range_idx],
+            },
+            'train': train,
+            'test': test,
+            'sharpe_decay': round(train['sharpe'] - test['sharpe'], 4),
+        })
+    leaderboard.sort(key=lambda row: row['train']['sharpe'], reverse=True)
+    for rank, row in enumerate(leaderboard, start=1):
+        row['rank'] = rank
+    return leaderboard
+
+
+def select_best(leaderboard):
+    """样本内排名最高且样本外夏普为正的参数组合，没有时返回 None（避免保存样本外亏损的过拟合参数）"""
+    return next((row for row in leaderboard if row['test']['sharpe'] > 0), None)
+
+
+def format_leaderboard(leaderboard, top=20):
+    """格式化排行榜前若干名为 Markdown 表格"""
+    lines = [
+        '| 排名 | 样本内夏普 | 样本内收益 | 样本外夏普 | 样本外收益 | 样本外回撤 | 阈值(温和/中/强) | 趋势市周期 | 震荡市周期 |',
+        '|------|------|------|------|------|------|------|------|------|',
+    ]
+    for row in leaderboard[:top]:
+        th = row['signal_thresholds']
+        periods = row['regime_periods']
+        lines.append(
+            f"| {row['rank']} | {row['train']['sharpe']:.2f} | {row['train']['total_return']:.2%} | "
+            f"{row['test']['sharpe']:.2f} | {row['test']['total_return']:.2%} | {row['test']['max_drawdown']:.2%} | "
+            f"{th['mild']}/{th['medium_strength']}/{th['high_strength']} | "
+            f"{_format_periods(periods['trending'])} | {_format_periods(periods['ranging'])} |"
+        )
+    return '\n'.join(lines)
+
+
+def _format_periods(periods):
+    return f"MA{periods['ma_short']}/{periods['ma_mid']}/{periods['ma_long']} RSI{periods['rsi_period']} BOLL{periods['boll_period']}"
+
+
+def _parse_period_grid(text):
+    """解析命令行中的周期组合，格式: "5,10,20,14,20;10,20,30,14,20" """
+    keys = ('ma_short', 'ma_mid', 'ma_long', 'rsi_period', 'boll_period')
+    grid = []
+    for part in text.split(';'):
+        values = [int(v) for v in part.split(',')]
+        if len(values) != len(keys):
+            raise ValueError(f"周期组合格式错误: {part}")
+        grid.append(dict(zip(keys, values)))
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交易策略参数扫描')
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--samples', type=int, default=20, help='每种市场状态的权重采样数')
+    parser.add_argument('--periods', default=None, help='指标周期组合，格式: "5,10,20,14,20;10,20,30,14,20"')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--train-ratio', type=float, default=0.7)
+    parser.add_argument('--fee', type=float, default=0.001, help='单边手续费率')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', default='sweep_leaderboard.json')
+    parser.add_argument('--save-best', action='store_true',
+                        help='把样本外夏普为正的排名最高的参数保存为策略参数文件')
+    args = parser.parse_args()
+
+    period_grid = _parse_period_grid(args.periods) if args.periods else None
+    ohlcv = load_ohlcv(args.symbol, args.interval, args.days)
+    leaderboard = run_sweep(ohlcv, period_grid=period_grid, samples=args.samples, workers=args.workers,
+                            train_ratio=args.train_ratio, fee=args.fee, interval=args.interval)
+
+    print(format_leaderboard(leaderboard, args.top))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(leaderboard, f, ensure_ascii=False, indent=2)
+    print(f"完整排行榜已保存到 {os.path.abspath(args.output)}")
+
+    if args.save_best:
+        best = select_best(leaderboard)
+        if best is None:
+            print("没有样本外夏普为正的参数组合，未保存策略参数")
+        else:
+            path = save_strategy_params(best)
+            print(f"排名第 {best['rank']} 的参数已保存到 {path}（样本外夏普: {best['test']['sharpe']:.2f}）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+K线收盘后的后台预计算
+get_real_time_price 的历史K线、技术指标和技术指标图表，以及 arima_stock 的预测结果只取决于已收盘的K线，
+每根K线收盘后重新计算一次即可。PrecomputeScheduler 在收盘后（加上随机延迟，避免多个进程同时请求交易所）
+为关注列表中的交易对刷新这些结果，同时运行的任务数有上限；交互请求命中时只需叠加实时行情
+
+预计算结果保存在 precomputed 中，按 (交易对, 种类) 索引并记录所基于的收盘时间，
+到下一次收盘后 grace 秒仍未刷新时视为失效，工具照常现算。结果存入缓存后端（见 btc_cache_backend），
+多进程部署时使用共享后端，同一根K线收盘后先完成计算的 worker 的结果由所有 worker 共用，其余 worker 不再重复计算
+
+环境变量:
+    BTC_PRECOMPUTE_SYMBOLS  关注列表，逗号分隔（默认与 BTC_FEED_SYMBOLS 相同，设为空则不启动）
+    BTC_PRECOMPUTE_JITTER   收盘后随机延迟的上限（秒，默认 10）
+    BTC_PRECOMPUTE_WORKERS  同时运行的预计算任务数（默认 2）
+    BTC_PRECOMPUTE_GRACE    下一次收盘后仍沿用旧结果的秒数（默认 120）
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from btc_cache_backend import cache_key, get_cache_backend
+from btc_candle_ring import INTERVAL_MS
+from btc_metrics import record_cache, span
+from btc_timeframes import bucket_start
+from btc_weight_governor import BACKFILL, request_priority
+
+
+def watchlist():
+    default = os.getenv('BTC_FEED_SYMBOLS', 'BTCUSDT')
+    return [item.strip().upper() for item in os.getenv('BTC_PRECOMPUTE_SYMBOLS', default).split(',') if item.strip()]
+
+
+def closed_candles(df, time_column, interval, close_ms):
+    """
+    只保留 close_ms 之前已收盘的K线；数据源还没有收到刚收盘的那根K线时抛出异常，由调度器稍后重试
+    """
+    import pandas as pd
+
+    close_time = pd.Timestamp(close_ms, unit='ms')
+    df = df[df[time_column] < close_time].reset_index(drop=True)
+    if df.empty or df[time_column].iloc[-1] < close_time - pd.Timedelta(milliseconds=INTERVAL_MS[interval]):
+        raise Exception(f"数据尚未包含 {close_time} 收盘的K线")
+    return df
+
+
+class PrecomputeStore:
+    """
+    预计算结果，缓存键为 btc:precompute:<交易对>:<种类>，值为 (结果, 周期, 收盘时间戳)，
+    保存在缓存后端中（backend 为 None 时使用进程共用的后端）
+    """
+
+    def __init__(self, grace=None, backend=None):
+        # 下一次收盘之后仍沿用旧结果的秒数，覆盖收盘后的随机延迟和计算耗时
+        self.grace = float(grace if grace is not None else os.getenv('BTC_PRECOMPUTE_GRACE', '120'))
+        self.backend = backend
+
+    def _backend(self):
+        return self.backend if self.backend is not None else get_cache_backend()
+
+    def _expires_ms(self, interval, close_ms):
+        return close_ms + INTERVAL_MS[interval] + self.grace * 1000
+
+    def put(self, symbol, kind, value, interval, close_ms):
+        ttl = (self._expires_ms(interval, close_ms) - time.time() * 1000) / 1000
+        self._backend().set(cache_key('precompute', symbol, kind), (value, interval, close_ms), ttl)
+
+    def _item(self, symbol, kind):
+        item = self._backend().get(cache_key('precompute', symbol, kind))
+        if item is None or time.time() * 1000 >= self._expires_ms(item[1], item[2]):
+            return None
+        return item
+
+    def get(self, symbol, kind):
+        """返回仍然有效的预计算结果，没有或已失效时返回 None"""
+        item = self._item(symbol, kind)
+        record_cache('precompute', item is not None)
+        return item[0] if item is not None else None
+
+    def close_ms(self, symbol, kind):
+        """仍然有效的预计算结果所基于的收盘时间，没有时返回 None"""
+        item = self._item(symbol, kind)
+        return item[2] if item is not None else None
+
+    def clear(self):
+        self._backend().clear(cache_key('precompute', ''))
+
+
+class PrecomputeJob:
+    """
+    一类预计算：每根 interval 周期的K线收盘后对每个交易对调用 func(symbol, close_ms)，
+    返回值以 name 为种类存入 PrecomputeStore
+    """
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+
+
+class PrecomputeScheduler:
+    """
+    按K线收盘时间调度预计算：启动时先计算一次，之后每次收盘后等待 0~jitter 秒的随机延迟再刷新，
+    同一任务上一次尚未完成时不重复提交，失败后每隔 retry_seconds 重试直到下一次收盘
+    """
+
+    def __init__(self, jobs, symbols=None, store=None, jitter=None, workers=None, retry_seconds=15, tick=1.0):
+        self.jobs = list(jobs)
+        self.symbols = [symbol.upper() for symbol in (symbols if symbols is not None else watchlist())]
+        self.store = store if store is not None else precomputed
+        self.jitter = float(jitter if jitter is not None else os.getenv('BTC_PRECOMPUTE_JITTER', '10'))
+        self.workers = int(workers or os.getenv('BTC_PRECOMPUTE_WORKERS', '2'))
+        self.retry_seconds = retry_seconds
+        self.tick = tick
+        # (任务名, 交易对) -> 最近一次成功的收盘时间 / 下一次可以提交的时间 / 正在运行
+        self._done = {}
+        self._due = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.reused = 0
+        self.failures = 0
+
+    def pending(self, now_ms=None):
+        """当前应当提交的 (任务, 交易对, 收盘时间)"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        ready = []
+        with self._lock:
+            for job in self.jobs:
+                close_ms = bucket_start(now_ms, job.interval)
+                for symbol in self.symbols:
+                    key = (job.name, symbol)
+                    if key in self._running or self._done.get(key, -1) >= close_ms:
+                        continue
+                    due = self._due.get(key)
+                    if due is None or due[0] != close_ms:
+                        # 启动后第一次立即计算，之后每次收盘随机延迟，分散各进程的请求
+                        delay = 0.0 if key not in self._done else random.uniform(0, self.jitter)
+                        due = self._due[key] = (close_ms, now_ms + delay * 1000)
+                    if now_ms >= due[1]:
+                        self._running.add(key)
+                        ready.append((job, symbol, close_ms))
+        return ready
+
+    def run_job(self, job, symbol, close_ms):
+        key = (job.name, symbol)
+        try:
+            if (self.store.close_ms(symbol, job.name) or -1) >= close_ms:
+                # 其他 worker 已经算好了这根K线的结果
+                with self._lock:
+                    self._done[key] = close_ms
+                    self.reused += 1
+                return
+            # 后台任务以最低优先级请求交易所，为交互请求留出权重额度
+            with request_priority(BACKFILL), span('precompute', job.name):
+                value = job.func(symbol, close_ms)
+            self.store.put(symbol, job.name, value, job.interval, close_ms)
+            with self._lock:
+                self._done[key] = close_ms
+                self.runs += 1
+        except Exception as e:
+            print(f"预计算 {symbol} {job.name} 失败: {str(e)}")
+            with self._lock:
+                self._due[key] = (close_ms, time.time() * 1000 + self.retry_seconds * 1000)
+                self.failures += 1
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+    def run_pending(self, now_ms=None):
+        """提交当前到期的任务，返回提交的 Future 列表"""
+        return [self._executor.submit(self.run_job, *item) for item in self.pending(now_ms)]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"预计算调度失败: {str(e)}")
+            self._stop.wait(self.tick)
+
+    def start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='precompute')
+            self._thread = threading.Thread(target=self._run, name='precompute-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+precomputed = PrecomputeStore()
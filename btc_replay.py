@@ -0,0 +1,261 @@
+"""
+交易所请求的录制与回放
+录制模式下，工具对交易所客户端的每次调用（接口名、参数、返回值或异常、耗时）都追加写入 gzip 压缩的 JSONL 文件；
+回放模式下从录制文件读取响应，按录制时的耗时或指定的延迟和抖动模拟网络，不访问交易所，
+用于可重复的性能测试和离线压测
+
+通过环境变量切换（见 btc_exchange.get_client）:
+    BTC_EXCHANGE_MODE=record BTC_EXCHANGE_SESSION=sessions/demo.jsonl.gz python btc_analysis_agent_qwen_trub.py
+    BTC_EXCHANGE_MODE=replay BTC_EXCHANGE_SESSION=sessions/demo.jsonl.gz BTC_REPLAY_LATENCY=0.05 BTC_REPLAY_JITTER=0.02 ...
+
+查看录制内容:
+    python btc_replay.py sessions/demo.jsonl.gz
+"""
+import atexit
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+DEFAULT_SESSION_FILE = os.path.join('exchange_sessions', 'session.jsonl.gz')
+
+
+class ReplayMissError(KeyError):
+    """回放文件中没有与请求匹配的记录"""
+
+
+def request_key(endpoint, args, kwargs):
+    """请求的规范化键：接口名 + 位置参数 + 排序后的关键字参数"""
+    return json.dumps([endpoint, list(args), kwargs], sort_keys=True, ensure_ascii=False, default=str)
+
+
+def loose_key(endpoint, kwargs):
+    """宽松匹配键：只看接口名、交易对和周期，忽略随时间变化的起止时间等参数"""
+    return json.dumps([endpoint, kwargs.get('symbol'), kwargs.get('interval')], ensure_ascii=False, default=str)
+
+
+def read_session(path):
+    """
+    逐条读取录制文件
+    录制进程被强制结束时文件末尾没有 gzip 结束标记、最后一行可能不完整：读到这里时停止，保留之前的完整记录
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"录制文件 {path} 末尾的记录不完整，已忽略")
+                    return
+                yield record
+        except (EOFError, zlib.error):
+            print(f"录制文件 {path} 没有正常结束（录制进程可能被中断），只读取已完整写入的记录")
+
+
+def repair_session(path):
+    """
+    上次录制被中断（文件没有正常结束）时，把完整的记录重写为正常结束的文件，返回是否重写；
+    否则追加的新记录会接在损坏的数据之后，读取时一起丢失
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        with gzip.open(path, 'rb') as f:
+            while f.read(1 << 20):
+                pass
+        return False
+    except (EOFError, zlib.error):
+        pass
+    records = list(read_session(path))
+    temp_path = path + '.repair'
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    os.replace(temp_path, path)
+    print(f"录制文件 {path} 已修复，保留 {len(records)} 条记录")
+    return True
+
+
+class RecordingClient:
+    """
+    交易所客户端代理，把每次调用追加写入录制文件
+    写入由锁保护，多个工具线程可以共用同一个实例；每条记录写入后立即刷新压缩流，
+    录制进程崩溃或被结束时已写入的记录仍可读取（见 read_session）
+    """
+
+    def __init__(self, client, path=DEFAULT_SESSION_FILE):
+        self._client = client
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 追加模式：同一个文件可以累积多次录制
+        repair_session(path)
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.count = 0
+        atexit.register(self.close)
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            record = {'ts': int(time.time() * 1000), 'endpoint': name, 'args': list(args), 'kwargs': kwargs}
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                record['error'] = {'type': type(e).__name__, 'message': str(e)}
+                record['elapsed'] = time.perf_counter() - started
+                self._write(record)
+                raise
+            record['response'] = result
+            record['elapsed'] = time.perf_counter() - started
+            self._write(record)
+            return result
+        return wrapper
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReplayedError(Exception):
+    """回放录制时交易所抛出的异常，消息与原异常相同（工具按消息内容判断错误类型）"""
+
+    def __init__(self, error_type, message):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+class ReplayClient:
+    """
+    从录制文件回放交易所响应
+    latency: 固定延迟（秒），为 None 时使用录制时的实际耗时
+    jitter: 在延迟上叠加 [-jitter, +jitter] 的均匀随机抖动（秒）
+    speed: 延迟缩放系数，0 表示不等待
+    loose: 精确匹配失败时，按接口名 + 交易对 + 周期返回最近一次录制的响应
+    同一个请求被录制多次时按录制顺序依次返回，用完后重复最后一条
+    """
+
+    def __init__(self, path=DEFAULT_SESSION_FILE, latency=None, jitter=0.0, speed=1.0, loose=True, seed=None):
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self.speed = speed
+        self.loose = loose
+        self._random = random.Random(seed)
+        self._exact = defaultdict(deque)
+        self._loose = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loose_hits = 0
+        self.misses = 0
+        for record in read_session(path):
+            self._exact[request_key(record['endpoint'], record['args'], record['kwargs'])].append(record)
+            self._loose[loose_key(record['endpoint'], record['kwargs'])] = record
+
+    def __len__(self):
+        return sum(len(records) for records in self._exact.values())
+
+    def endpoints(self):
+        return sorted({json.loads(key)[0] for key in self._exact})
+
+    def _lookup(self, endpoint, args, kwargs):
+        key = request_key(endpoint, args, kwargs)
+        with self._lock:
+            records = self._exact.get(key)
+            if records:
+                self.hits += 1
+                # 保留最后一条，之后的相同请求都返回它
+                return records.popleft() if len(records) > 1 else records[0]
+            if self.loose:
+                record = self._loose.get(loose_key(endpoint, kwargs))
+                if record is not None:
+                    self.loose_hits += 1
+                    return record
+            self.misses += 1
+        raise ReplayMissError(f"回放文件中没有匹配的请求: {endpoint} {kwargs}")
+
+    def _delay(self, record):
+        base = record.get('elapsed', 0.0) if self.latency is None else self.latency
+        delay = base * self.speed
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def replay(*args, **kwargs):
+            record = self._lookup(name, args, kwargs)
+            delay = self._delay(record)
+            if delay:
+                time.sleep(delay)
+            if 'error' in record:
+                raise ReplayedError(record['error']['type'], record['error']['message'])
+            return record['response']
+        replay.__name__ = name
+        return replay
+
+
+def summarize_session(path):
+    """统计录制文件中每个接口的调用次数、错误次数和耗时"""
+    stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'elapsed': []})
+    for record in read_session(path):
+        item = stats[record['endpoint']]
+        item['calls'] += 1
+        item['errors'] += 'error' in record
+        item['elapsed'].append(record.get('elapsed', 0.0))
+    summary = {}
+    for endpoint, item in sorted(stats.items()):
+        elapsed = sorted(item['elapsed'])
+        summary[endpoint] = {
+            'calls': item['calls'],
+            'errors': item['errors'],
+            'mean_ms': round(sum(elapsed) / len(elapsed) * 1000, 2),
+            'p95_ms': round(elapsed[min(len(elapsed) - 1, int(len(elapsed) * 0.95))] * 1000, 2),
+        }
+    return summary
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看交易所请求录制文件')
+    parser.add_argument('path', nargs='?', default=DEFAULT_SESSION_FILE)
+    args = parser.parse_args()
+
+    print('| 接口 | 调用次数 | 错误次数 | 平均耗时(ms) | P95耗时(ms) |')
+    print('|------|------|------|------|------|')
+    for endpoint, item in summarize_session(args.path).items():
+        print(f"| {endpoint} | {item['calls']} | {item['errors']} | {item['mean_ms']} | {item['p95_ms']} |")
+
+
+if __name__ == '__main__':
+    main()
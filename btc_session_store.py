@@ -0,0 +1,210 @@
+"""
+按会话隔离的查询结果缓存
+每个会话保存最近几次 SQL 查询得到的 DataFrame，追问（如 "只看最近一个月"）时直接在缓存上切片，
+不再重新检查数据同步、也不再查询数据库
+
+- 会话 ID 稳定：优先使用调用方显式传入的 session_id，否则取首条用户消息内容的哈希，
+  不使用 id(messages)（对象回收后 id 会被复用，且每轮对话的 messages 都是新列表）
+- 首条消息的哈希不能区分用户（点击同一个示例问题的会话得到同一个 ID），因此结果只按 SQL 精确复用，
+  不提供 "本会话最近一次结果" 这类与 SQL 无关的兜底
+- 会话和条目都按 LRU 淘汰，同时限制会话数、单个会话和全局占用的内存
+- 条目超过 TTL 后失效，避免追问时拿到过旧的数据
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from btc_metrics import record_cache
+
+DEFAULT_MAX_SESSIONS = int(os.getenv('BTC_SESSION_MAX_SESSIONS', '256'))
+DEFAULT_SESSION_BYTES = int(float(os.getenv('BTC_SESSION_MAX_MB', '32')) * 1024 * 1024)
+DEFAULT_TOTAL_BYTES = int(float(os.getenv('BTC_SESSION_TOTAL_MB', '256')) * 1024 * 1024)
+DEFAULT_TTL = float(os.getenv('BTC_SESSION_TTL', '1800'))
+
+
+def message_field(message, name):
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def content_text(content):
+    """消息内容可能是字符串，也可能是多段内容的列表"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, (list, tuple)):
+        return '\n'.join(content_text(message_field(item, 'text') or item) for item in content)
+    return '' if content is None else str(content)
+
+
+MESSAGE_HASH_PREFIX = 'msg-'
+
+
+def session_id_from_kwargs(kwargs):
+    """
+    从工具调用的 kwargs 中得到稳定的会话 ID
+    首条用户消息相同的两个会话会得到相同的 ID，因此有显式 session_id 时应优先传入
+    """
+    session_id = kwargs.get('session_id')
+    if session_id:
+        return str(session_id)
+    for message in kwargs.get('messages') or ():
+        if message_field(message, 'role') == 'user':
+            text = content_text(message_field(message, 'content'))
+            return MESSAGE_HASH_PREFIX + hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+    return None
+
+
+def frame_nbytes(frame):
+    try:
+        return int(frame.memory_usage(deep=True).sum())
+    except AttributeError:
+        return int(getattr(frame, 'nbytes', 0))
+
+
+class _Entry:
+    __slots__ = ('value', 'nbytes', 'created', 'meta')
+
+    def __init__(self, value, nbytes, meta):
+        self.value = value
+        self.nbytes = nbytes
+        self.created = time.monotonic()
+        self.meta = meta
+
+
+class SessionResultStore:
+    """
+    两级 LRU：外层按会话、内层按查询键
+    写入后依次清理过期条目、超出单会话内存的条目、超出全局内存或会话数的最久未使用会话
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, session_bytes=DEFAULT_SESSION_BYTES,
+                 total_bytes=DEFAULT_TOTAL_BYTES, ttl=DEFAULT_TTL, max_entries_per_session=8):
+        self.max_sessions = max_sessions
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.ttl = ttl
+        self.max_entries_per_session = max_entries_per_session
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def _remove(self, session_id, key):
+        entries = self._sessions[session_id]
+        entry = entries.pop(key)
+        self._bytes -= entry.nbytes
+        if not entries:
+            del self._sessions[session_id]
+        return entry
+
+    def _session_bytes(self, entries):
+        return sum(entry.nbytes for entry in entries.values())
+
+    def _evict(self, now):
+        # 过期条目
+        for session_id in list(self._sessions):
+            for key in list(self._sessions[session_id]):
+                if self._expired(self._sessions[session_id][key], now):
+                    self._remove(session_id, key)
+                    self.expirations += 1
+                    if session_id not in self._sessions:
+                        break
+        # 超出全局内存或会话数时，从最久未使用的会话开始淘汰
+        while self._sessions and (self._bytes > self.total_bytes or len(self._sessions) > self.max_sessions):
+            session_id = next(iter(self._sessions))
+            key = next(iter(self._sessions[session_id]))
+            self._remove(session_id, key)
+            self.evictions += 1
+
+    def put(self, session_id, key, value, meta=None):
+        """保存一个查询结果，单个结果超过会话内存上限时不缓存，返回是否已保存"""
+        if session_id is None:
+            return False
+        nbytes = frame_nbytes(value)
+        if nbytes > self.session_bytes or nbytes > self.total_bytes:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            if entries is None:
+                entries = self._sessions[session_id] = OrderedDict()
+            if key in entries:
+                self._remove(session_id, key)
+                entries = self._sessions.setdefault(session_id, entries)
+            entries[key] = _Entry(value, nbytes, meta or {})
+            self._bytes += nbytes
+            self._sessions.move_to_end(session_id)
+            # 单个会话内按条目数和内存淘汰最久未使用的结果
+            while len(entries) > self.max_entries_per_session or self._session_bytes(entries) > self.session_bytes:
+                self._remove(session_id, next(iter(entries)))
+                self.evictions += 1
+            self._evict(now)
+        return True
+
+    def get(self, session_id, key=None):
+        """
+        读取缓存的结果，key 为 None 时返回该会话最近一次保存的结果
+        返回 (value, meta)，未命中或已过期时返回 (None, None)
+        """
+        result = (None, None)
+        if session_id is not None:
+            now = time.monotonic()
+            with self._lock:
+                entries = self._sessions.get(session_id)
+                if entries:
+                    if key is None:
+                        key = next(reversed(entries))
+                    entry = entries.get(key)
+                    if entry is not None and self._expired(entry, now):
+                        self._remove(session_id, key)
+                        self.expirations += 1
+                    elif entry is not None:
+                        entries.move_to_end(key)
+                        self._sessions.move_to_end(session_id)
+                        result = (entry.value, entry.meta)
+        with self._lock:
+            if result[0] is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache('session_store', result[0] is not None)
+        return result
+
+    def drop(self, session_id):
+        with self._lock:
+            entries = self._sessions.pop(session_id, None)
+            if entries:
+                self._bytes -= self._session_bytes(entries)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'entries': sum(len(entries) for entries in self._sessions.values()),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,94 @@
+"""
+基于 multiprocessing.shared_memory 的 NumPy 数组共享工具
+多个进程可以按名称挂载同一块内存，避免把大数组逐个任务 pickle 传输
+"""
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_ATTACH_LOCK = threading.Lock()
+
+
+def create_shared_array(shape, dtype, name=None):
+    """
+    创建一块共享内存并返回 (SharedMemory, ndarray)，数组初始化为0
+    调用方负责在不再使用时执行 shm.close() 和 shm.unlink()
+    """
+    dtype = np.dtype(dtype)
+    nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.fill(0)
+    return shm, array
+
+
+def share_array(values, name=None):
+    """把已有数组复制进新的共享内存，返回 (SharedMemory, spec)"""
+    values = np.ascontiguousarray(values)
+    shm, array = create_shared_array(values.shape, values.dtype, name=name)
+    array[...] = values
+    return shm, array_spec(shm, array)
+
+
+def array_spec(shm, array):
+    """生成可以跨进程传递的轻量描述信息（只包含名称、形状和类型）"""
+    return {'name': shm.name, 'shape': tuple(array.shape), 'dtype': array.dtype.str}
+
+
+def attach_shared_memory(name):
+    """
+    按名称挂载已存在的共享内存
+    挂载方不应在退出时删除共享内存，因此需要避免被 resource_tracker 跟踪
+    """
+    try:
+        # Python 3.13+ 支持 track 参数
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # 旧版本在挂载时也会登记到 resource_tracker，进程退出时会误删共享内存，
+    # 这里在挂载期间临时跳过登记
+    from multiprocessing import resource_tracker
+    with _ATTACH_LOCK:
+        original = resource_tracker.register
+        resource_tracker.register = lambda res_name, rtype: None if rtype == 'shared_memory' else original(res_name, rtype)
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = original
+
+
+def attach_shared_array(spec):
+    """根据 array_spec 返回的描述信息挂载数组，返回 (SharedMemory, ndarray)"""
+    shm = attach_shared_memory(spec['name'])
+    array = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+    return shm, array
+
+
+def unlink_shared_memory(name):
+    """
+    按名称删除共享内存（创建方异常退出、没有进程负责删除时使用）
+    已挂载的进程仍可访问原来的内存，之后以同一名称创建的是新的内存块
+    """
+    try:
+        import _posixshmem
+    except ImportError:
+        # Windows 上共享内存在所有句柄关闭后自动释放，没有需要删除的名称
+        return
+    try:
+        _posixshmem.shm_unlink('/' + name)
+    except FileNotFoundError:
+        pass
+
+
+def release_shared_memory(shm, unlink=False):
+    """关闭共享内存句柄，创建方可以同时删除该内存块"""
+    try:
+        shm.close()
+    except Exception:
+        pass
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,163 @@
+"""
+相同工具调用的合并（single-flight）
+行情剧烈波动时，很多用户会在同一秒询问同一个交易对，每个请求都单独请求行情、盘口和K线、计算指标并绘图。
+按 工具名 + 规范化后的参数（交易对转大写、BCT 纠正为 BTC 等）合并：同一个键只有第一个调用真正执行，
+执行期间到达的调用等待并共享它的结果；执行完成后 window 秒内到达的相同调用也直接复用结果
+
+只共享成功返回的结果：执行中抛出的异常会传给正在等待的调用，但不会被后续调用复用
+
+环境变量:
+    BTC_SINGLEFLIGHT         设为 0 关闭合并
+    BTC_SINGLEFLIGHT_WINDOW  执行完成后结果的复用时间（秒，默认 1）
+"""
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from btc_metrics import record_single_flight
+
+DEFAULT_WINDOW = float(os.getenv('BTC_SINGLEFLIGHT_WINDOW', '1'))
+
+
+class _Call:
+    __slots__ = ('future', 'finished')
+
+    def __init__(self):
+        self.future = Future()
+        self.finished = None
+
+
+class SingleFlight:
+    """
+    同一个键同时只执行一次，其余调用共享结果
+    同步调用方使用 do()，事件循环中使用 ado()；两者共用同一张表，结果保存在 concurrent.futures.Future 中
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, enabled=None):
+        self.window = window
+        if enabled is None:
+            enabled = os.getenv('BTC_SINGLEFLIGHT', '1').lower() not in ('', '0', 'false', 'no')
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, key, collapsed):
+        name = key[0] if isinstance(key, tuple) else str(key)
+        item = self._stats.setdefault(name, {'executed': 0, 'collapsed': 0})
+        item['collapsed' if collapsed else 'executed'] += 1
+        record_single_flight(name, collapsed)
+
+    def _join(self, key):
+        """返回 (调用, 是否由当前调用方执行)"""
+        now = time.monotonic()
+        with self._lock:
+            # 清理复用窗口已过的结果
+            for expired in [k for k, call in self._calls.items()
+                            if call.finished is not None and now - call.finished > self.window]:
+                del self._calls[expired]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(key, not leader)
+        return call, leader
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            call.finished = time.monotonic()
+            if error is not None or self.window <= 0:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+        if call.future.done():
+            return
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+
+    def do(self, key, func, *args, **kwargs):
+        """同步执行 func，相同 key 的并发调用只执行一次"""
+        if not self.enabled or key is None:
+            return func(*args, **kwargs)
+        call, leader = self._join(key)
+        if not leader:
+            return call.future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    async def ado(self, key, coro):
+        """在事件循环中等待协程，相同 key 的并发调用只执行一次（未执行的协程会被关闭）"""
+        if not self.enabled or key is None:
+            return await coro
+        call, leader = self._join(key)
+        if not leader:
+            coro.close()
+            # shield：等待方被取消时不能连带取消共享的 Future
+            return await asyncio.shield(asyncio.wrap_future(call.future))
+        try:
+            result = await coro
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        """每个工具实际执行和被合并的调用次数"""
+        with self._lock:
+            return {name: dict(item, in_flight=sum(1 for k, call in self._calls.items()
+                                                   if k[0] == name and not call.future.done()))
+                    for name, item in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+tool_flight = SingleFlight()
+
+
+def parse_params(params):
+    """工具参数可能是 JSON 字符串或字典，解析失败时返回 None"""
+    if isinstance(params, dict):
+        return params
+    try:
+        args = json.loads(params)
+    except (TypeError, ValueError):
+        return None
+    return args if isinstance(args, dict) else None
+
+
+def tool_flight_key(tool, params, kwargs=None):
+    """
+    工具调用的合并键：(工具名,) + tool.flight_key(args, kwargs)，kwargs 为调用时的其他关键字参数（messages、session_id 等）
+    tool.single_flight 为 False、参数无法解析或 flight_key 返回 None 时返回 None（不合并）
+    """
+    if not getattr(tool, 'single_flight', False):
+        return None
+    args = parse_params(params)
+    if args is None:
+        return None
+    try:
+        key = tool.flight_key(args, kwargs or {})
+    except Exception:
+        return None
+    return None if key is None else (tool.name,) + tuple(key)
+
+
+def coalesced(func):
+    """工具 call 方法的装饰器：合并键相同的并发调用"""
+    @functools.wraps(func)
+    def wrapper(self, params, **kwargs):
+        return tool_flight.do(tool_flight_key(self, params, kwargs), func, self, params, **kwargs)
+    return wrapper
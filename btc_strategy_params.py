@@ -0,0 +1,96 @@
+"""
+交易策略参数（指标权重、信号阈值、指标周期）的默认值与加载逻辑
+参数扫描（btc_param_sweep.py）输出的最优参数会保存为 JSON，
+OptimizedTradingStrategy 初始化时自动加载，文件不存在时使用默认值
+"""
+import copy
+import json
+import os
+
+# 参数文件路径，可通过环境变量覆盖
+STRATEGY_PARAMS_FILE = os.getenv(
+    'BTC_STRATEGY_PARAMS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategy_params.json')
+)
+
+DEFAULT_STRATEGY_PARAMS = {
+    # 趋势市指标权重
+    'trend_weights': {
+        'MA': 0.25,      # 趋势跟踪权重
+        'MACD': 0.20,    # 趋势动量权重
+        'SAR': 0.15,     # 趋势反转权重
+        'BOLL': 0.20,    # 波动率权重
+        'RSI': 0.10,     # 超买超卖权重
+        'KDJ': 0.10      # 短期动量权重
+    },
+    # 震荡市指标权重
+    'range_weights': {
+        'RSI': 0.30,     # 震荡市中RSI更重要
+        'BOLL': 0.25,    # 布林带在震荡市中很有效
+        'KDJ': 0.20,     # KDJ适合震荡市
+        'VOL': 0.15,     # 成交量确认
+        'MA': 0.10       # 均线在震荡市中权重降低
+    },
+    # 综合得分阈值
+    'signal_thresholds': {
+        'mild': 0.2,             # 超过该值判断为温和上涨/下跌
+        'strong': 0.5,           # 超过该值判断为强势上涨/下跌
+        'medium_strength': 0.3,  # 信号强度"中"的下限
+        'high_strength': 0.7     # 信号强度"强"的下限
+    },
+    # 不同市场状态下的指标周期
+    'regime_periods': {
+        'trending': {
+            'ma_short': 10,    # 缩短均线捕捉趋势
+            'ma_mid': 20,
+            'ma_long': 30,
+            'rsi_period': 14,
+            'boll_period': 20
+        },
+        'ranging': {
+            'ma_short': 5,     # 更短周期捕捉震荡
+            'ma_mid': 10,
+            'ma_long': 20,
+            'rsi_period': 10,  # 更敏感的RSI
+            'boll_period': 14
+        }
+    }
+}
+
+
+def _merge(params, saved):
+    """按键把 saved 合并进 params，嵌套的字典逐层合并，未知字段和类型不符的值忽略"""
+    for key, value in saved.items():
+        if key not in params:
+            continue
+        if isinstance(params[key], dict):
+            if isinstance(value, dict):
+                _merge(params[key], value)
+        else:
+            params[key] = value
+
+
+def load_strategy_params(path=None):
+    """
+    读取策略参数，文件中的字段覆盖默认值，缺失字段沿用默认值
+    """
+    params = copy.deepcopy(DEFAULT_STRATEGY_PARAMS)
+    path = path or STRATEGY_PARAMS_FILE
+    if not os.path.exists(path):
+        return params
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        _merge(params, saved)
+    except Exception as e:
+        print(f"读取策略参数文件失败，使用默认参数: {str(e)}")
+    return params
+
+
+def save_strategy_params(params, path=None):
+    """保存策略参数，只写入已知字段"""
+    path = path or STRATEGY_PARAMS_FILE
+    data = {key: params[key] for key in DEFAULT_STRATEGY_PARAMS if key in params}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
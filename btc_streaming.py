@@ -0,0 +1,81 @@
+"""
+工具结果分阶段流式展示
+qwen_agent 的 Assistant 在工具 call() 返回之后才产出函数结果，get_real_time_price 要等取数、指标计算和两张图表
+全部完成，用户在此之前看不到任何内容。
+
+StreamingAssistant 对提供 stream(params, **kwargs) 生成器的工具改为逐段读取：每产出一段就把它作为
+尚未完成的函数结果交给 WebUI 展示（行情一到就能看到价格），最后一段作为正式的函数结果交给大模型。
+没有 stream 的工具照常调用 call()。
+
+Assistant 的对话循环在后台线程中执行，工具的阶段结果和对话循环的产出经同一个队列按顺序转给调用方。
+该模块导入 qwen_agent，只在初始化助手时导入
+
+环境变量:
+    BTC_STREAM_TOOLS  设为 0 时使用原来的 Assistant，不分阶段展示（默认 1）
+"""
+import contextvars
+import json
+import os
+import queue
+import threading
+
+from qwen_agent.agents import Assistant
+from qwen_agent.llm.schema import FUNCTION, Message
+
+# 当前对话循环的事件队列，工具的阶段结果写入其中
+_stage_events = contextvars.ContextVar('stage_events', default=None)
+
+
+def streaming_enabled():
+    return os.getenv('BTC_STREAM_TOOLS', '1').lower() not in ('', '0', 'false', 'no')
+
+
+class StreamingAssistant(Assistant):
+    """工具结果分阶段产出的 Assistant，参数与 Assistant 相同"""
+
+    def _run(self, messages, **kwargs):
+        events = queue.Queue()
+
+        def produce():
+            _stage_events.set(events)
+            try:
+                for response in super(StreamingAssistant, self)._run(messages, **kwargs):
+                    events.put(('response', list(response)))
+            except BaseException as e:
+                events.put(('error', e))
+            else:
+                events.put(('done', None))
+
+        # 在调用方上下文的副本中执行，请求优先级、会话等上下文变量照常生效
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(produce,), name='assistant-run', daemon=True).start()
+        last = []
+        while True:
+            kind, value = events.get()
+            if kind == 'response':
+                last = value
+                yield last
+            elif kind == 'stage':
+                # 函数结果尚未完成：在已产出的内容之后附上目前的部分结果
+                name, content = value
+                yield last + [Message(role=FUNCTION, name=name, content=content)]
+            elif kind == 'error':
+                raise value
+            else:
+                return
+
+    def _call_tool(self, tool_name, tool_args='{}', **kwargs):
+        tool = self.function_map.get(tool_name)
+        events = _stage_events.get()
+        if events is None or not hasattr(tool, 'stream'):
+            return super()._call_tool(tool_name, tool_args, **kwargs)
+        if not isinstance(tool_args, str):
+            tool_args = json.dumps(tool_args, ensure_ascii=False)
+        result = ''
+        try:
+            for result in tool.stream(tool_args, **kwargs):
+                events.put(('stage', (tool_name, result)))
+        except Exception as e:
+            print(f"工具 {tool_name} 流式调用失败: {str(e)}")
+            return f"An error occurred when calling tool `{tool_name}`:\n{type(e).__name__}: {str(e)}"
+        return result
@@ -0,0 +1,155 @@
+"""
+基于 1 分钟K线的多周期本地重采样
+每个交易对只维护一条 1 分钟K线数据源，15m、1h、4h、1d 等周期的K线由本地聚合得到，
+在周期边界增量更新并写入共享K线缓冲区（btc_candle_ring），各工具直接读取，不再分别请求交易所
+
+启动时每个周期只请求一次已收盘的历史K线，
+再从当天 UTC 零点开始拉取 1 分钟K线重建所有周期的未收盘K线；之后每次刷新只需一次 1 分钟K线请求
+"""
+import threading
+import time
+
+from btc_candle_ring import INTERVAL_MS
+from btc_klines import parse_klines
+
+BASE_INTERVAL = '1m'
+DEFAULT_INTERVALS = ('15m', '1h', '4h', '1d')
+KLINE_REQUEST_LIMIT = 1000
+
+
+def bucket_start(open_time, interval):
+    """K线所属周期的开盘时间（交易所的周期以 UTC 对齐）"""
+    return open_time - open_time % INTERVAL_MS[interval]
+
+
+class MultiTimeframeFeed:
+    """
+    单个交易对的 1 分钟数据源及其多周期聚合
+    只有持有 1 分钟缓冲区写权限的进程才会更新，其他进程直接读取共享缓冲区
+    """
+
+    def __init__(self, client, store, symbol, intervals=DEFAULT_INTERVALS, poll_seconds=5,
+                 history_limit=KLINE_REQUEST_LIMIT):
+        self.client = client
+        self.store = store
+        self.symbol = symbol.upper()
+        self.intervals = tuple(intervals)
+        self.poll_seconds = poll_seconds
+        self.history_limit = history_limit
+        self.base_ring = None
+        self.rings = {}
+        # 各周期当前未收盘K线的聚合状态
+        self._states = {}
+        self._last_minute = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.request_count = 0
+
+    @property
+    def owner(self):
+        return self.base_ring is not None and self.base_ring.owner
+
+    def _get_klines(self, **params):
+        self.request_count += 1
+        return self.client.get_klines(symbol=self.symbol, **params)
+
+    def bootstrap(self):
+        """初始化：各周期加载一次已收盘历史，再用当天的 1 分钟K线重建未收盘K线"""
+        self.base_ring = self.store.open(self.symbol, BASE_INTERVAL)
+        if not self.owner:
+            return False
+        now_ms = int(time.time() * 1000)
+        for interval in self.intervals:
+            ring = self.store.open(self.symbol, interval)
+            self.rings[interval] = ring
+            klines = self._get_klines(interval=interval, limit=self.history_limit)
+            # 只保留已收盘的K线，未收盘部分由 1 分钟数据聚合
+            ring.extend_klines([k for k in klines if int(k[6]) < now_ms])
+        largest = max(self.intervals, key=lambda interval: INTERVAL_MS[interval])
+        self._ingest_minutes(bucket_start(now_ms, largest))
+        return True
+
+    def refresh(self):
+        """拉取上次之后的 1 分钟K线并更新各周期，通常只需要一次请求"""
+        if self._last_minute is None:
+            return self.bootstrap()
+        if not self.owner:
+            return False
+        self._ingest_minutes(self._last_minute)
+        return True
+
+    def _ingest_minutes(self, start_ms):
+        while True:
+            klines = self._get_klines(interval=BASE_INTERVAL, startTime=int(start_ms), limit=KLINE_REQUEST_LIMIT)
+            if not klines:
+                return
+            columns = parse_klines(klines)
+            open_times = columns['开盘时间戳']
+            self.base_ring.extend({
+                'open_time': open_times,
+                'open': columns['开盘价'],
+                'high': columns['最高价'],
+                'low': columns['最低价'],
+                'close': columns['收盘价'],
+                'volume': columns['成交量'],
+            })
+            for i in range(len(open_times)):
+                self._fold_minute(int(open_times[i]), float(columns['开盘价'][i]), float(columns['最高价'][i]),
+                                  float(columns['最低价'][i]), float(columns['收盘价'][i]), float(columns['成交量'][i]))
+            last = int(open_times[-1])
+            self._last_minute = last
+            # 不足一页说明已经追上最新K线
+            if len(klines) < KLINE_REQUEST_LIMIT or last <= start_ms:
+                return
+            start_ms = last
+
+    def _fold_minute(self, open_time, open_price, high, low, close, volume):
+        """
+        把一根 1 分钟K线并入各周期的当前K线
+        同一根未收盘的 1 分钟K线会被多次拉取，成交量按 "已收盘分钟之和 + 当前分钟" 计算，避免重复累加
+        """
+        for interval in self.intervals:
+            bucket = bucket_start(open_time, interval)
+            state = self._states.get(interval)
+            if state is None or bucket > state['open_time']:
+                state = {
+                    'open_time': bucket, 'open': open_price, 'high': high, 'low': low, 'close': close,
+                    'base_volume': 0.0, 'minute': open_time, 'minute_volume': volume,
+                }
+                self._states[interval] = state
+            elif bucket == state['open_time'] and open_time >= state['minute']:
+                if open_time != state['minute']:
+                    state['base_volume'] += state['minute_volume']
+                    state['minute'] = open_time
+                state['minute_volume'] = volume
+                state['high'] = max(state['high'], high)
+                state['low'] = min(state['low'], low)
+                state['close'] = close
+            else:
+                continue
+            self.rings[interval].update(bucket, state['open'], state['high'], state['low'], state['close'],
+                                        state['base_volume'] + state['minute_volume'])
+
+    def indicators(self, interval, n=None, periods=None):
+        """直接在共享缓冲区上计算某个周期的技术指标，不产生网络请求"""
+        ring = self.rings.get(interval) or self.store.get(self.symbol, interval)
+        return ring.indicators(n, periods) if ring is not None else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.refresh() is False:
+                    # 其他进程负责更新，本进程只读取
+                    return
+            except Exception as e:
+                print(f"更新 {self.symbol} 多周期K线失败: {str(e)}")
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'timeframe-feed-{self.symbol}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
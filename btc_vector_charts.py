@@ -0,0 +1,383 @@
+"""
+轻量图表输出：JSON 数据或降采样的 SVG
+300 dpi 的 PNG 图表（技术指标图 12x16 英寸）动辄数 MB，绘制、存储和传输都慢，而图表只在浏览器中查看。
+设置 BTC_CHART_FORMAT=svg 或 json 时，价格/成交量、预测、实时价格和四联技术指标图改为：
+- json：按面板组织的序列数据（时间为毫秒时间戳，数值保留 6 位有效数字），由前端自行绘制
+- svg：直接生成的矢量图，不经过 matplotlib
+
+两种格式都先把每条曲线降采样到 max_points 个点以内（折线用 LTTB 保留形状，柱状图和区间按桶取代表值）。
+图表先由 *_spec() 描述为 {'title', 'panels': [{'series': [...]}, ...]}，再写成 JSON 或 SVG
+
+环境变量:
+    BTC_CHART_FORMAT      图表格式 png（默认）、svg 或 json
+    BTC_CHART_MAX_POINTS  每条曲线最多保留的点数（默认 400）
+"""
+import json
+import math
+import os
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from btc_chart_store import chart_store
+
+CHART_FORMATS = ('png', 'svg', 'json')
+DEFAULT_MAX_POINTS = int(os.getenv('BTC_CHART_MAX_POINTS', '400'))
+SVG_WIDTH = 960
+SVG_UNIT_HEIGHT = 80
+PALETTE = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f')
+
+
+def chart_format():
+    fmt = os.getenv('BTC_CHART_FORMAT', 'png').lower()
+    return fmt if fmt in CHART_FORMATS else 'png'
+
+
+def render_chart(kind, inputs, draw_png, build_spec, fmt=None):
+    """
+    按图表格式生成图表并返回相对路径：png 时调用 draw_png(保存路径)，
+    svg / json 时由 build_spec() 得到图表描述后写出；都经过 chart_store 去重
+    """
+    fmt = fmt or chart_format()
+    if fmt == 'png':
+        return chart_store.render(kind, inputs, draw_png)
+    max_points = DEFAULT_MAX_POINTS
+    return chart_store.render(kind, inputs, lambda path: write_chart(build_spec(), path, fmt, max_points),
+                              profile={'format': fmt, 'dpi': None, 'max_points': max_points})
+
+
+def chart_markdown(alt, path):
+    """图表的 Markdown 引用：图片直接显示，JSON 数据给出链接"""
+    if path.endswith('.json'):
+        return f"[{alt}（图表数据）]({path})"
+    return f"![{alt}]({path})"
+
+
+# ---------- 降采样 ----------
+def lttb_indices(x, y, max_points):
+    """Largest-Triangle-Three-Buckets：选出保留折线形状的 max_points 个点的下标"""
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    bucket_size = (n - 2) / (max_points - 2)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start = int(math.floor(i * bucket_size)) + 1
+        end = int(math.floor((i + 1) * bucket_size)) + 1
+        next_start, next_end = end, min(int(math.floor((i + 2) * bucket_size)) + 1, n)
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        indices[i + 1] = previous
+    return indices
+
+
+def bucket_indices(n, max_points):
+    """均匀分桶，每桶取第一个下标（区间带等成对的序列）"""
+    if n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).astype(np.int64))
+
+
+def bucket_extremes(values, max_points):
+    """柱状图每桶取绝对值最大的一根，返回其下标"""
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    edges = np.linspace(0, n, max_points + 1).astype(np.int64)
+    magnitude = np.nan_to_num(np.abs(values), nan=-1.0)
+    return np.array([start + int(np.argmax(magnitude[start:end])) for start, end in zip(edges[:-1], edges[1:])
+                     if end > start])
+
+
+def _x_values(x):
+    """时间转为毫秒时间戳，其余转为浮点数"""
+    import pandas as pd
+
+    x = pd.Series(x)
+    if x.dtype == object:
+        # SQL 查询得到的日期列是 date 对象
+        parsed = pd.to_datetime(x, errors='coerce')
+        if parsed.notna().all():
+            x = parsed
+    if pd.api.types.is_datetime64_any_dtype(x):
+        if x.dt.tz is not None:
+            x = x.dt.tz_convert(None)
+        return ((x - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64), 'time'
+    return pd.to_numeric(x, errors='coerce').to_numpy(dtype=float), 'number'
+
+
+def _round(values):
+    return [None if value is None or not math.isfinite(value) else float(f'{value:.6g}') for value in values]
+
+
+def downsample(spec, max_points):
+    """降采样并转为可 JSON 序列化的图表描述（不修改原描述）"""
+    panels = []
+    x_type = 'number'
+    for panel in spec['panels']:
+        series_list = []
+        for series in panel['series']:
+            series = dict(series)
+            if 'x' in series:
+                x, x_type = _x_values(series['x'])
+                if series['type'] == 'band':
+                    y0 = np.asarray(series['y0'], dtype=float)
+                    y1 = np.asarray(series['y1'], dtype=float)
+                    keep = bucket_indices(len(x), max_points)
+                    series['y0'], series['y1'] = _round(y0[keep]), _round(y1[keep])
+                else:
+                    y = np.asarray(series['y'], dtype=float)
+                    if series['type'] == 'bar':
+                        keep = bucket_extremes(y, max_points)
+                    else:
+                        keep = lttb_indices(x.astype(float), np.nan_to_num(y, nan=np.nanmean(y) if len(y) else 0.0),
+                                            max_points)
+                    series['y'] = _round(y[keep])
+                    if isinstance(series.get('color'), (list, tuple)):
+                        series['color'] = [series['color'][i] for i in keep]
+                series['x'] = [int(value) for value in x[keep]] if x_type == 'time' else _round(x[keep])
+            elif 'y' in series:
+                series['y'] = _round([float(series['y'])])[0]
+            series_list.append(series)
+        panels.append({**panel, 'series': series_list})
+    return {**spec, 'x_type': x_type, 'panels': panels}
+
+
+# ---------- 写出 ----------
+def write_chart(spec, path, fmt, max_points=DEFAULT_MAX_POINTS):
+    data = downsample(spec, max_points)
+    if fmt == 'json':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(to_svg(data))
+
+
+def _format_tick(value, x_type):
+    if x_type == 'time':
+        from datetime import datetime, timezone
+        # 时间戳由不带时区的时间按 UTC 换算得到，按 UTC 还原即为原来的时间
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).strftime('%m-%d %H:%M')
+    return f'{value:.6g}'
+
+
+def _range(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return 0.0, 1.0
+    low, high = min(values), max(values)
+    if low == high:
+        low, high = low - 1, high + 1
+    pad = (high - low) * 0.05
+    return low - pad, high + pad
+
+
+def to_svg(data, width=SVG_WIDTH, unit_height=SVG_UNIT_HEIGHT):
+    """由降采样后的图表描述生成 SVG"""
+    left, right, top, bottom = 70, 20, 28, 26
+    panels = data['panels']
+    heights = [panel.get('height', 3) * unit_height + top + bottom for panel in panels]
+    title_height = 44 if data.get('subtitle') else 28
+    total_height = title_height + sum(heights)
+    x_all = [value for panel in panels for series in panel['series'] for value in series.get('x', [])]
+    x_low, x_high = (min(x_all), max(x_all)) if x_all else (0, 1)
+    x_high = x_high if x_high > x_low else x_low + 1
+    plot_width = width - left - right
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{total_height}" '
+           f'viewBox="0 0 {width} {total_height}" font-family="sans-serif" font-size="11">',
+           f'<rect width="{width}" height="{total_height}" fill="#fff"/>',
+           f'<text x="{width / 2}" y="18" text-anchor="middle" font-size="14" '
+           f'fill="{data.get("title_color", "#000")}">{escape(data["title"])}</text>']
+    if data.get('subtitle'):
+        out.append(f'<text x="{width / 2}" y="36" text-anchor="middle" font-size="12" '
+                   f'fill="{data.get("title_color", "#000")}">{escape(data["subtitle"])}</text>')
+
+    offset = title_height
+    for panel, height in zip(panels, heights):
+        plot_top, plot_height = offset + top, height - top - bottom
+        y_values = []
+        for series in panel['series']:
+            y_values += series.get('y0', []) + series.get('y1', [])
+            y = series.get('y')
+            y_values += y if isinstance(y, list) else [y]
+            if series['type'] == 'bar':
+                y_values.append(0.0)
+        y_low, y_high = _range(y_values)
+
+        def sx(value):
+            return left + (value - x_low) / (x_high - x_low) * plot_width
+
+        def sy(value):
+            return plot_top + (y_high - value) / (y_high - y_low) * plot_height
+
+        out.append(f'<rect x="{left}" y="{plot_top}" width="{plot_width}" height="{plot_height}" '
+                   f'fill="none" stroke="#999"/>')
+        for i in range(5):
+            value = y_low + (y_high - y_low) * i / 4
+            y = sy(value)
+            out.append(f'<line x1="{left}" y1="{y:.1f}" x2="{width - right}" y2="{y:.1f}" stroke="#ddd" '
+                       f'stroke-dasharray="4 3"/>')
+            out.append(f'<text x="{left - 4}" y="{y + 4:.1f}" text-anchor="end">{value:.6g}</text>')
+        if panel is panels[-1]:
+            for i in range(5):
+                value = x_low + (x_high - x_low) * i / 4
+                out.append(f'<text x="{sx(value):.1f}" y="{plot_top + plot_height + 16}" text-anchor="middle">'
+                           f'{escape(_format_tick(value, data["x_type"]))}</text>')
+        if panel.get('title'):
+            out.append(f'<text x="{width / 2}" y="{plot_top - 8}" text-anchor="middle" font-size="12">'
+                       f'{escape(panel["title"])}</text>')
+        if panel.get('ylabel'):
+            out.append(f'<text transform="translate(14 {plot_top + plot_height / 2}) rotate(-90)" '
+                       f'text-anchor="middle">{escape(panel["ylabel"])}</text>')
+
+        legend = []
+        for index, series in enumerate(panel['series']):
+            color = series.get('color') or PALETTE[index % len(PALETTE)]
+            dash = ' stroke-dasharray="6 4"' if series.get('dash') else ''
+            opacity = series.get('opacity', 1)
+            kind = series['type']
+            if kind == 'hline':
+                if series['y'] is None:
+                    continue
+                y = sy(series['y'])
+                out.append(f'<line x1="{left}" y1="{y:.1f}" x2="{width - right}" y2="{y:.1f}" stroke="{color}" '
+                           f'stroke-opacity="{opacity}"{dash}/>')
+            elif kind == 'band':
+                upper = [(x, y) for x, y in zip(series['x'], series['y1']) if y is not None]
+                lower = [(x, y) for x, y in zip(series['x'], series['y0']) if y is not None]
+                points = ' '.join(f'{sx(x):.1f},{sy(y):.1f}' for x, y in upper + lower[::-1])
+                out.append(f'<polygon points="{points}" fill="{color}" fill-opacity="{opacity}"/>')
+            elif kind == 'bar':
+                colors = series['color'] if isinstance(series.get('color'), list) else None
+                bar_width = max(plot_width / max(len(series['x']), 1) * 0.8, 0.5)
+                zero = sy(0.0)
+                for i, (x, y) in enumerate(zip(series['x'], series['y'])):
+                    if y is None:
+                        continue
+                    fill = colors[i] if colors else color
+                    out.append(f'<rect x="{sx(x) - bar_width / 2:.1f}" y="{min(sy(y), zero):.1f}" '
+                               f'width="{bar_width:.1f}" height="{abs(zero - sy(y)):.1f}" fill="{fill}" '
+                               f'fill-opacity="{opacity}"/>')
+                color = colors[-1] if colors else color
+            elif kind == 'points':
+                for x, y in zip(series['x'], series['y']):
+                    if y is not None:
+                        out.append(f'<circle cx="{sx(x):.1f}" cy="{sy(y):.1f}" r="{series.get("size", 2)}" '
+                                   f'fill="{color}"/>')
+            else:
+                points = ' '.join(f'{sx(x):.1f},{sy(y):.1f}' for x, y in zip(series['x'], series['y'])
+                                  if y is not None)
+                out.append(f'<polyline points="{points}" fill="none" stroke="{color}" '
+                           f'stroke-width="{series.get("width", 1.5)}" stroke-opacity="{opacity}"{dash}/>')
+            if series.get('name'):
+                legend.append((series['name'], color))
+        for i, (name, color) in enumerate(legend):
+            y = plot_top + 12 + i * 14
+            out.append(f'<rect x="{left + 6}" y="{y - 8}" width="10" height="8" fill="{color}"/>'
+                       f'<text x="{left + 20}" y="{y}">{escape(name)}</text>')
+        offset += height
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+# ---------- 图表描述（与 matplotlib 版本的内容一致）----------
+def sql_chart_spec(df):
+    """SQL 查询结果：价格走势 + 成交量，或只有成交量，或通用折线"""
+    columns = list(df.columns)
+    date_columns = [col for col in columns if '日期' in col or '时间' in col]
+    price_columns = [col for col in columns if any(x in col for x in ['开盘价', '收盘价', '最高价', '最低价', '价格'])]
+    volume_columns = [col for col in columns if '成交量' in col]
+    if price_columns and date_columns:
+        date_col = date_columns[0]
+        panels = [{'title': '比特币价格走势', 'ylabel': '价格 (USDT)', 'height': 3, 'series': [
+            {'type': 'line', 'name': col, 'x': df[date_col], 'y': df[col], 'width': 2} for col in price_columns]}]
+        if volume_columns:
+            panels.append({'title': '比特币成交量', 'ylabel': '成交量', 'height': 3, 'series': [
+                {'type': 'bar', 'name': col, 'x': df[date_col], 'y': df[col], 'color': 'orange', 'opacity': 0.7}
+                for col in volume_columns]})
+        return {'title': '比特币价格数据', 'panels': panels}
+    if volume_columns and date_columns:
+        date_col = date_columns[0]
+        return {'title': '比特币成交量', 'panels': [{'ylabel': '成交量', 'height': 4, 'series': [
+            {'type': 'bar', 'name': col, 'x': df[date_col], 'y': df[col], 'color': 'orange', 'opacity': 0.7}
+            for col in volume_columns]}]}
+    return {'title': '数据可视化', 'panels': [{'ylabel': '数值', 'height': 4, 'series': [
+        {'type': 'line', 'name': col, 'x': df.iloc[:, 0], 'y': df[col], 'width': 2} for col in columns[1:]]}]}
+
+
+def forecast_chart_spec(b_code, n, history, future_dates, forecast):
+    """ARIMA 预测：历史收盘价、预测收盘价和 ±5% 预测区间"""
+    forecast = np.asarray(forecast, dtype=float)
+    return {'title': f'{b_code}未来{n}天价格预测 (ARIMA模型)', 'panels': [{'ylabel': '价格 (USDT)', 'height': 4, 'series': [
+        {'type': 'line', 'name': '历史收盘价', 'x': history.index, 'y': history.to_numpy(), 'width': 2},
+        {'type': 'band', 'name': '预测区间', 'x': future_dates, 'y0': forecast * 0.95, 'y1': forecast * 1.05,
+         'color': 'red', 'opacity': 0.1},
+        {'type': 'line', 'name': '预测收盘价', 'x': future_dates, 'y': forecast, 'color': 'red', 'dash': True,
+         'width': 2},
+    ]}]}
+
+
+def price_chart_spec(symbol, recent_klines, current_price, price_change_percent):
+    """实时价格：最近K线收盘价和当前价格"""
+    color = 'green' if price_change_percent > 0 else 'red'
+    return {
+        'title': f'{symbol} 实时价格走势图',
+        'subtitle': f"24h变化: {'+' if price_change_percent > 0 else ''}{price_change_percent:.2f}%",
+        'title_color': color,
+        'panels': [{'ylabel': '价格 (USDT)', 'height': 4, 'series': [
+            {'type': 'line', 'name': '收盘价', 'x': recent_klines['开盘时间'], 'y': recent_klines['收盘价'], 'width': 2},
+            {'type': 'points', 'name': f'当前价格: {current_price}', 'x': recent_klines['开盘时间'].iloc[-1:],
+             'y': [current_price], 'color': 'red', 'size': 5},
+        ]}],
+    }
+
+
+def indicator_chart_spec(df, strategy, symbol):
+    """四联技术指标图：价格/均线/SAR/布林带/支撑压力位、RSI、MACD、KDJ"""
+    t = df['时间']
+    sar_up = df['收盘价'].iloc[-1] > df['SAR'].iloc[-1]
+    levels = [('支撑位1', 'green', 0.7), ('支撑位2', 'lightgreen', 0.5), ('压力位1', 'red', 0.7), ('压力位2', 'pink', 0.5)]
+    price = [
+        {'type': 'band', 'x': t, 'y0': df['Lower_Band'], 'y1': df['Upper_Band'], 'color': 'gray', 'opacity': 0.1},
+        {'type': 'line', 'name': '收盘价', 'x': t, 'y': df['收盘价'], 'width': 2},
+        {'type': 'line', 'name': 'MA5', 'x': t, 'y': df['MA5'], 'width': 1, 'opacity': 0.7},
+        {'type': 'line', 'name': 'MA10', 'x': t, 'y': df['MA10'], 'width': 1, 'opacity': 0.7},
+        {'type': 'line', 'name': 'MA20', 'x': t, 'y': df['MA20'], 'width': 1, 'opacity': 0.7},
+        {'type': 'points', 'name': 'SAR', 'x': t, 'y': df['SAR'], 'color': 'green' if sar_up else 'red', 'size': 1.5},
+        {'type': 'line', 'name': '布林带上轨', 'x': t, 'y': df['Upper_Band'], 'color': 'gray', 'dash': True,
+         'opacity': 0.5},
+        {'type': 'line', 'name': '布林带下轨', 'x': t, 'y': df['Lower_Band'], 'color': 'gray', 'dash': True,
+         'opacity': 0.5},
+    ] + [{'type': 'hline', 'name': f'{name}: {strategy[name]}', 'y': strategy[name], 'color': color, 'dash': True,
+          'opacity': opacity} for name, color, opacity in levels]
+    rsi = [
+        {'type': 'line', 'name': 'RSI', 'x': t, 'y': df['RSI'], 'color': 'purple', 'width': 2},
+        {'type': 'hline', 'name': '超买线(70)', 'y': 70, 'color': 'red', 'dash': True, 'opacity': 0.7},
+        {'type': 'hline', 'name': '超卖线(30)', 'y': 30, 'color': 'green', 'dash': True, 'opacity': 0.7},
+        {'type': 'hline', 'name': '中性线(50)', 'y': 50, 'color': 'gray', 'dash': True, 'opacity': 0.5},
+    ]
+    macd = [
+        {'type': 'bar', 'name': 'MACD柱状', 'x': t, 'y': df['MACD_Hist'], 'opacity': 0.7,
+         'color': ['green' if x > 0 else 'red' for x in df['MACD_Hist']]},
+        {'type': 'line', 'name': 'MACD', 'x': t, 'y': df['MACD'], 'color': 'blue', 'width': 2},
+        {'type': 'line', 'name': '信号线', 'x': t, 'y': df['Signal_Line'], 'color': 'orange', 'width': 2},
+    ]
+    kdj = [
+        {'type': 'line', 'name': 'K线', 'x': t, 'y': df['K'], 'color': 'blue'},
+        {'type': 'line', 'name': 'D线', 'x': t, 'y': df['D'], 'color': 'orange'},
+        {'type': 'line', 'name': 'J线', 'x': t, 'y': df['J'], 'color': 'green'},
+        {'type': 'hline', 'name': '超买线(80)', 'y': 80, 'color': 'red', 'dash': True, 'opacity': 0.7},
+        {'type': 'hline', 'name': '超卖线(20)', 'y': 20, 'color': 'green', 'dash': True, 'opacity': 0.7},
+    ]
+    return {'title': f'{symbol} 价格与技术指标分析', 'panels': [
+        {'ylabel': '价格 (USDT)', 'height': 6, 'series': price},
+        {'ylabel': 'RSI', 'height': 2, 'series': rsi},
+        {'ylabel': 'MACD', 'height': 2, 'series': macd},
+        {'ylabel': 'KDJ', 'height': 2, 'series': kdj},
+    ]}
@@ -0,0 +1,317 @@
+"""
+交易所请求权重调度
+Binance 按 IP 统计每分钟的请求权重（REQUEST_WEIGHT），超限返回 429，继续请求会被 418 封禁一段时间，
+封禁期间所有用户都无法获取行情。三个工具、数据补齐和行情订阅共用同一个 WeightGovernor：
+
+- 调用前按接口和参数估算权重，调用后用响应头 x-mbx-used-weight-1m 校正本分钟已用权重
+- 按优先级分配额度：交互请求（实时价格）可以用满上限，普通请求和后台补齐只能用到一定比例，
+  额度不足时排队等待下一分钟，等待超过该优先级的上限则直接拒绝（WeightLimitError）
+- 收到 429 / 418 时按 Retry-After 暂停所有请求
+
+优先级通过 request_priority() / with_priority() 设置，保存在 contextvars 中，
+同一线程或协程内的交易所调用都会使用它
+
+环境变量:
+    BTC_WEIGHT_GOVERNOR  设为 0 关闭权重调度
+    BTC_WEIGHT_LIMIT     每个窗口的权重上限（默认 6000）
+    BTC_WEIGHT_WINDOW    权重统计窗口（秒，默认 60）
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from btc_metrics import (WEIGHT_LIMITED, WEIGHT_REJECTED, WEIGHT_REMAINING, WEIGHT_USED, WEIGHT_WAIT_SECONDS,
+                         enabled as metrics_enabled)
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKFILL = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKFILL: 'backfill'}
+
+# 各优先级可以使用的额度比例，为更高优先级的请求预留余量
+DEFAULT_SHARES = {INTERACTIVE: 0.95, NORMAL: 0.85, BACKFILL: 0.6}
+# 各优先级最长排队时间（秒），交互请求不能等太久，补齐任务可以等到下一分钟
+DEFAULT_MAX_WAIT = {INTERACTIVE: 3.0, NORMAL: 10.0, BACKFILL: 65.0}
+# 418 没有给出 Retry-After 时的暂停时间（秒）
+DEFAULT_BAN_SECONDS = 120.0
+
+DEFAULT_WEIGHT = 2
+# 接口权重，参考 Binance 现货 REST 接口文档；订单簿按 limit 分档
+ENDPOINT_WEIGHTS = {
+    'get_klines': 2,
+    'get_ticker': 2,
+    'get_symbol_ticker': 2,
+    'get_avg_price': 2,
+    'get_recent_trades': 25,
+    'get_exchange_info': 20,
+    'ping': 1,
+    'get_server_time': 1,
+}
+ORDER_BOOK_WEIGHTS = ((100, 5), (500, 25), (1000, 50), (5000, 250))
+INTERVAL_SECONDS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000}
+
+_priority = contextvars.ContextVar('exchange_priority', default=NORMAL)
+
+
+class WeightLimitError(Exception):
+    """请求权重额度不足，排队超过上限"""
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """在 with 块内以指定优先级请求交易所"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def with_priority(priority):
+    """函数装饰器，函数内的交易所请求使用指定优先级（支持协程函数）"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with request_priority(priority):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _to_ms(value):
+    """K线起止时间转为毫秒时间戳，支持毫秒数、YYYY-MM-DD 和 'N days ago UTC'"""
+    if value is None:
+        return int(time.time() * 1000)
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    match = re.match(r'(\d+)\s+(minute|hour|day|week)s?\s+ago', text)
+    if match:
+        unit = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}[match.group(2)]
+        return int((time.time() - int(match.group(1)) * unit) * 1000)
+    parsed = datetime.fromisoformat(text[:10]).replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _interval_ms(interval):
+    return int(interval[:-1]) * INTERVAL_SECONDS[interval[-1]] * 1000
+
+
+def estimate_weight(endpoint, kwargs):
+    """估算一次客户端调用消耗的请求权重"""
+    if endpoint == 'get_order_book':
+        limit = int(kwargs.get('limit', 100))
+        for upper, weight in ORDER_BOOK_WEIGHTS:
+            if limit <= upper:
+                return weight
+        return ORDER_BOOK_WEIGHTS[-1][1]
+    if endpoint in ('get_ticker', 'get_symbol_ticker') and not kwargs.get('symbol'):
+        # 不指定交易对时返回全部交易对
+        return 80 if endpoint == 'get_ticker' else 4
+    if endpoint == 'get_historical_klines':
+        # python-binance 先查询一次最早的有效时间，再按每页 limit 根分页请求
+        try:
+            span = _to_ms(kwargs.get('end_str')) - _to_ms(kwargs.get('start_str'))
+            pages = max(1, math.ceil(span / _interval_ms(kwargs['interval']) / int(kwargs.get('limit', 1000))))
+        except (KeyError, ValueError, TypeError):
+            pages = 1
+        return ENDPOINT_WEIGHTS['get_klines'] * (pages + 1)
+    return ENDPOINT_WEIGHTS.get(endpoint, DEFAULT_WEIGHT)
+
+
+class WeightGovernor:
+    """
+    所有交易所请求共享的权重预算
+    窗口按时钟对齐（与 Binance 按自然分钟统计一致），本窗口已用权重取本地累计值和响应头中的较大值
+    """
+
+    def __init__(self, limit=None, window=None, shares=None, max_wait=None, clock=time.time):
+        self.limit = int(limit or os.getenv('BTC_WEIGHT_LIMIT', '6000'))
+        self.window = float(window or os.getenv('BTC_WEIGHT_WINDOW', '60'))
+        self.shares = {**DEFAULT_SHARES, **(shares or {})}
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._window_start = None
+        self._used = 0
+        self._blocked_until = 0.0
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self.admitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.rejected = {priority: 0 for priority in PRIORITY_NAMES}
+        self.rate_limited = 0
+
+    def _roll(self, now):
+        window_start = now - now % self.window
+        if window_start != self._window_start:
+            self._window_start = window_start
+            self._used = 0
+
+    def _report(self):
+        if metrics_enabled():
+            WEIGHT_USED.set(value=self._used)
+            WEIGHT_REMAINING.set(value=max(self.limit - self._used, 0))
+
+    @property
+    def used(self):
+        with self._cond:
+            self._roll(self.clock())
+            return self._used
+
+    @property
+    def remaining(self):
+        return max(self.limit - self.used, 0)
+
+    def acquire(self, endpoint, cost=None, priority=None, kwargs=None):
+        """
+        预占一次请求的权重，额度不足时排队；返回预占的权重
+        更高优先级的请求在排队时，低优先级请求让行
+        """
+        cost = estimate_weight(endpoint, kwargs or {}) if cost is None else cost
+        priority = current_priority() if priority is None else priority
+        budget = self.limit * self.shares.get(priority, 1.0)
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        started = self.clock()
+        deadline = started + self.max_wait.get(priority, 0.0)
+        with self._cond:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    now = self.clock()
+                    self._roll(now)
+                    blocked = now < self._blocked_until
+                    higher_waiting = any(count for level, count in self._waiting.items() if level < priority)
+                    if not blocked and not higher_waiting and self._used + cost <= budget:
+                        self._used += cost
+                        self.admitted[priority] = self.admitted.get(priority, 0) + 1
+                        break
+                    wake_at = self._blocked_until if blocked else self._window_start + self.window
+                    if cost > budget or (wake_at > deadline and not higher_waiting):
+                        self.rejected[priority] = self.rejected.get(priority, 0) + 1
+                        if metrics_enabled():
+                            WEIGHT_REJECTED.inc(name)
+                        reason = '交易所暂停了请求' if blocked else '本分钟请求权重额度不足'
+                        raise WeightLimitError(f"{reason}（{endpoint} 需要权重 {cost}，已用 {self._used}/{self.limit}），请稍后重试")
+                    if now >= deadline:
+                        self.rejected[priority] = self.rejected.get(priority, 0) + 1
+                        if metrics_enabled():
+                            WEIGHT_REJECTED.inc(name)
+                        raise WeightLimitError(f"等待交易所请求额度超时（{endpoint}），请稍后重试")
+                    self._cond.wait(timeout=max(min(wake_at, deadline) - now, 0.01))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+            self._report()
+        if metrics_enabled():
+            WEIGHT_WAIT_SECONDS.observe(name, value=self.clock() - started)
+        return cost
+
+    def update(self, used_weight=None, status=None, retry_after=None):
+        """根据响应头和状态码校正已用权重，429 / 418 时暂停所有请求"""
+        with self._cond:
+            now = self.clock()
+            self._roll(now)
+            if used_weight is not None:
+                self._used = max(self._used, int(used_weight))
+            if status in (418, 429):
+                self.rate_limited += 1
+                if metrics_enabled():
+                    WEIGHT_LIMITED.inc(str(status))
+                if retry_after is None:
+                    retry_after = DEFAULT_BAN_SECONDS if status == 418 else self._window_start + self.window - now
+                self._blocked_until = max(self._blocked_until, now + float(retry_after))
+            self._report()
+            self._cond.notify_all()
+
+    def update_from_headers(self, headers, status=None):
+        """从响应头（requests / aiohttp 的大小写不敏感字典）读取已用权重和 Retry-After"""
+        if headers is None:
+            self.update(status=status)
+            return
+        used = headers.get('x-mbx-used-weight-1m') or headers.get('X-MBX-USED-WEIGHT-1M')
+        retry_after = headers.get('Retry-After') or headers.get('retry-after')
+        self.update(used_weight=int(used) if used else None, status=status,
+                    retry_after=float(retry_after) if retry_after else None)
+
+    def stats(self):
+        with self._cond:
+            self._roll(self.clock())
+            return {
+                'limit': self.limit,
+                'used': self._used,
+                'remaining': max(self.limit - self._used, 0),
+                'blocked_for': round(max(self._blocked_until - self.clock(), 0.0), 1),
+                'admitted': {PRIORITY_NAMES[p]: count for p, count in self.admitted.items()},
+                'rejected': {PRIORITY_NAMES[p]: count for p, count in self.rejected.items()},
+                'rate_limited': self.rate_limited,
+            }
+
+
+class GovernedClient:
+    """
+    交易所客户端代理：每次调用前向 WeightGovernor 预占权重，调用后读取 python-binance 保存在
+    client.response 上的响应头校正已用权重；BinanceAPIException 带有 status_code 和 response
+    多个线程共用客户端时 client.response 可能来自其他线程的请求，但同一窗口内已用权重只增不减，取较大值即可
+    """
+
+    def __init__(self, client, governor):
+        self._client = client
+        self.governor = governor
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            self.governor.acquire(name, kwargs=kwargs)
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, 'status_code', None)
+                response = getattr(e, 'response', None)
+                self.governor.update_from_headers(getattr(response, 'headers', None), status=status)
+                raise
+            response = getattr(self._client, 'response', None)
+            if response is not None:
+                self.governor.update_from_headers(getattr(response, 'headers', None))
+            return result
+        return wrapper
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def governor_enabled():
+    return os.getenv('BTC_WEIGHT_GOVERNOR', '1').lower() not in ('', '0', 'false', 'no')
+
+
+def get_governor():
+    """进程内共享的权重调度器"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = WeightGovernor()
+    return _governor